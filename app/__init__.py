@@ -1,15 +1,83 @@
+import os
 from flask import Flask, jsonify
-from flask_wtf.csrf import CSRFProtect
-from .utils import helpers
+from .utils import helpers, search, schema, storage, database, listing, mailer, \
+                   reservations, changelog
+from .utils.assets import assets
+from .utils.jobs import image_jobs
+from .utils.httpcache import response_cache
+from .utils.metrics import request_metrics
+from .utils.outbox import outbox
+from .utils.similarity import similarity_index
+from .utils.tagindex import tag_index
 from .models import db
+from .commands import register_commands
 
 
+#
+# Two ways to build the app:
+#
+#   create_app()      the web application (what radioparts.py serves)
+#   create_cli_app()  the same data layer and CLI commands without the
+#                     web side, for cron jobs and workers (imports, image
+#                     jobs) that should start quickly:
+#                     flask --app radioparts:create_cli_app images process
+#
+# Heavy imports (Alembic, Pillow, python-slugify, the blueprints) are
+# deferred to where they're used, so the CLI app never loads most of
+# them.  `flask perf startup` checks both against a time budget.
+#
+
 def create_app():
+    """The web application"""
+    from flask_wtf.csrf import CSRFProtect
+
+    app = _create_base_app()
+    csrf = CSRFProtect(app)
+    schema.init_app(app)     # flask db ... (Alembic migrations)
+    request_metrics.init_app(app)  # /metrics, slow request log
+    storage.init_app(app)
+    assets.init_app(app)     # fingerprinted /assets/ URLs, asset_url()
+    with app.app_context():
+        schema.upgrade_schema()  # apply pending migrations
+        image_jobs.recover()  # pick up uploads left unprocessed by a restart
+    search.init_app(app)
+    listing.init_app(app)  # PartListing read model for gallery pages
+    changelog.init_app(app)  # change log for /api/v1/sync
+    register_commands(app)
+    register_blueprints(app)
+    outbox.start(app)  # background digest dispatcher
+    reservations.start(app)  # expire stale holds
+    image_jobs.start(app)  # requeue jobs a dead worker left running
+
+    # filters for gallery
+    @app.template_filter('remove_key')
+    def remove_key(d, key):
+        d = d.copy()
+        d.pop(key, None)
+        return d
+
+    return app
+
+
+def create_cli_app():
+    """The app without blueprints, CSRF, request metrics or upload
+    handling, for short-lived processes.  It leaves the database as the
+    web app's startup made it (migrations, part listing), so use the full
+    app for `flask db` and to set up a new database.
+    """
+    app = _create_base_app()
+    storage.configure(app)  # upload settings, used by images commands
+    search.init_app(app)
+    register_commands(app)
+    return app
+
+
+def _create_base_app():
     app = Flask(__name__, template_folder='templates')
 
     # Configuration
     app.config.from_mapping(
-        SQLALCHEMY_DATABASE_URI='sqlite:///nzvintageradioparts.db',
+        SQLALCHEMY_DATABASE_URI=database.database_uri(),  # $DATABASE_URL
         SQLALCHEMY_TRACK_MODIFICATIONS=False,
         SECRET_KEY='9c3ee6247e36a1177178cbe134f31234beefeffe5b8fd8ae4a63cb7cad1cfeba',
         UPLOAD_FOLDER='app/static/images',
@@ -17,30 +85,44 @@ def create_app():
         MAX_CONTENT_LENGTH=16 * 1024 * 1024,  # 16Mb max upload
         WTF_CSRF_CHECK_DEFAULT=True,
         WTF_CSRF_TIME_LIMIT=3600,  # 1 hour token expiration
+        FULL_TEXT_SEARCH=True,  # FTS5 index for gallery search (SQLite only)
+        IMPORT_TOKEN=os.environ.get('IMPORT_TOKEN'),  # POST /import_parts; unset: off
     )
 
     # Initialize extensions
-    csrf = CSRFProtect(app)
+    database.configure(app)  # pool / pre-ping settings
     db.init_app(app)
+    database.init_app(app)   # SQLite: WAL, busy_timeout, synchronous
+    image_jobs.init_app(app)
+    response_cache.init_app(app)  # also cleared by commits from workers
+    tag_index.init_app(app)  # tag type-ahead
+    similarity_index.init_app(app)  # find similar parts
+    mailer.init_app(app)
+    outbox.init_app(app)     # librarian emails, sent in digests
+    reservations.init_app(app)
+    app.helpers = helpers
+    return app
+
 
-    # Register blueprints
+def register_blueprints(app):
+    """Import and register the blueprints (web app only)"""
     with app.app_context():
         from .blueprints.parts import bp as parts_bp
         from .blueprints.tags import bp as tags_bp
         from .blueprints.main import bp as main_bp
         from .blueprints.errors import bp as errors_bp
+        from .blueprints.requests import bp as requests_bp
+        from .blueprints.api import bp as api_bp
+        from .blueprints.parts import import_parts, similar_to_photo
 
         app.register_blueprint(main_bp)
         app.register_blueprint(parts_bp)
         app.register_blueprint(tags_bp, url_prefix='/tags')
         app.register_blueprint(errors_bp)
-        app.helpers = helpers
-
-    # filters for gallery
-    @app.template_filter('remove_key')
-    def remove_key(d, key):
-        d = d.copy()
-        d.pop(key, None)
-        return d
-
-    return app
+        app.register_blueprint(requests_bp)
+        app.register_blueprint(api_bp, url_prefix='/api/v1')
+        # scripts POST imports with a bearer token (IMPORT_TOKEN) instead
+        app.extensions['csrf'].exempt(import_parts)
+        # photo search (/similar) changes nothing, so scripts can POST a
+        # photo without first fetching a session CSRF token
+        app.extensions['csrf'].exempt(similar_to_photo)
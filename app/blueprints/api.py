@@ -0,0 +1,149 @@
+from flask import Blueprint, request, jsonify, abort
+from ..models import db, Part, Image, Tag, Brand, PartType, Location
+from ..utils import changelog, images
+
+
+#
+# Versioned, read-only JSON API (mounted at /api/v1) for clients that
+# keep their own copy of the catalogue, e.g. a librarian's laptop in a
+# shed with poor reception.  Fetch everything once with /sync?since=0,
+# keep the returned seq, and from then on /sync?since=<seq> sends only
+# what changed (utils/changelog.py) - usually a few kilobytes.
+#
+# Objects refer to each other by id only (a part's brand_id, tag_ids,
+# an image's part_id), so a change to one never means resending others.
+# Fields may be added within a version, but never renamed or removed.
+#
+
+bp = Blueprint('api', __name__)
+
+API_VERSION = 1
+SYNC_LIMIT = 500        # objects per /sync page, by default
+SYNC_LIMIT_MAX = 5000
+
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+def part_json(part):
+    data = part.to_dict()
+    data.update(box=part.box, position=part.position,
+                updated_at=_iso(part.updated_at),
+                tag_ids=sorted(tag.id for tag in part.tags))
+    return data
+
+
+def image_json(image):
+    return {
+        'id': image.id,
+        'part_id': image.part_id,
+        'location_id': image.location_id,
+        'filename': image.filename,
+        'original_filename': image.original_filename,
+        'description': image.description,
+        'width': image.width,
+        'height': image.height,
+        'taken_at': _iso(image.taken_at),
+        'created_at': _iso(image.created_at),
+        'updated_at': _iso(image.updated_at),
+        'url': f"/static/images/{image.filename}",
+        'renditions': images.renditions_dict(image),
+        'tag_ids': sorted(tag.id for tag in image.tags),
+    }
+
+
+def tag_json(tag):
+    return {'id': tag.id, 'name': tag.name, 'slug': tag.slug,
+            'description': tag.description}
+
+
+def brand_json(brand):
+    return {'id': brand.id, 'name': brand.name, 'alias': brand.alias,
+            'description': brand.description, 'website': brand.website}
+
+
+def part_type_json(part_type):
+    return {'id': part_type.id, 'name': part_type.name, 'slug': part_type.slug,
+            'description': part_type.description}
+
+
+def location_json(location):
+    return {'id': location.id, 'name': location.name, 'address': location.address}
+
+
+# collection -> (JSON for one object, loader options); the collections
+# are changelog.ENTITIES
+SERIALIZERS = {
+    'locations': (location_json, ()),
+    'brands': (brand_json, ()),
+    'part_types': (part_type_json, ()),
+    'tags': (tag_json, ()),
+    'parts': (part_json, (db.selectinload(Part.tags),)),
+    'images': (image_json, (db.selectinload(Image.tags),
+                            db.selectinload(Image.renditions))),
+}
+
+
+def load(collection, ids):
+    """{id: JSON} of those objects in a collection that still exist"""
+    model = changelog.ENTITIES[collection]
+    to_json, options = SERIALIZERS[collection]
+    found = model.query.options(*options).filter(model.id.in_(ids))
+    return {obj.id: to_json(obj) for obj in found}
+
+
+@bp.route('/')
+def index():
+    return jsonify(version=API_VERSION, seq=changelog.head(),
+                   collections=list(changelog.ENTITIES))
+
+
+@bp.route('/<collection>/<int:object_id>')
+def get_object(collection, object_id):
+    if collection not in SERIALIZERS:
+        abort(404)
+    found = load(collection, [object_id])
+    if not found:
+        abort(404)
+    return jsonify(found[object_id])
+
+
+@bp.route('/sync')
+def sync():
+    """What changed after ?since=<seq> (0, the default, for everything):
+    {seq, more, upserts: {collection: [objects]}, deletes: {collection:
+    [ids]}}.  Store the objects, forget the deleted ids, and ask again
+    with since=seq - straight away if `more`, else whenever convenient.
+    ?limit= objects per page (default 500).  On PostgreSQL the last
+    CHANGELOG_SETTLE_SECONDS of changes wait for the next sync (see
+    utils/changelog.py).
+    """
+    since = request.args.get('since', 0, type=int)
+    limit = min(max(request.args.get('limit', SYNC_LIMIT, type=int), 1),
+                SYNC_LIMIT_MAX)
+    head = changelog.head()
+    if not 0 <= since <= head:
+        # a seq this database never issued: the client's copy is from
+        # elsewhere (or a restored backup), so it has to start over
+        return jsonify(error="Unknown seq; sync again from 0", seq=head), 410
+
+    changes = changelog.changes_since(since, limit + 1)
+    more = len(changes) > limit
+    changes = changes[:limit]
+
+    wanted = {}
+    for collection, object_id, _ in changes:
+        wanted.setdefault(collection, []).append(object_id)
+    upserts, deletes = {}, {}
+    for collection, ids in wanted.items():
+        found = load(collection, ids)
+        if found:
+            upserts[collection] = [found[i] for i in ids if i in found]
+        gone = [i for i in ids if i not in found]
+        if gone:
+            deletes[collection] = gone
+
+    return jsonify(version=API_VERSION, since=since,
+                   seq=changes[-1][2] if changes else since, more=more,
+                   upserts=upserts, deletes=deletes)
@@ -1,12 +1,18 @@
 from flask import Blueprint, flash, redirect, request, jsonify, current_app, \
-                  render_template, url_for, abort
-from slugify import slugify
+                  render_template, url_for, abort, stream_with_context
 from werkzeug.utils import secure_filename
-from ..utils import helpers
-from ..models import db, Part, Image, PartType, Brand, Location, Tag, part_tags
-from sqlalchemy import func, or_
+from ..utils import helpers, images, facets, pagination, loading, export, \
+                    storage, importer, tagging
+from ..utils.jobs import image_jobs
+from ..utils.tagindex import tag_index
+from ..utils.similarity import similarity_index
+from ..utils.httpcache import response_cache, catalogue_last_modified, \
+                             part_last_modified
+from ..models import db, Part, Image, ImageJob, PartType, Brand, Location, Tag, \
+                     PartListing, part_tags
+from ..utils.cache import location_key
 from datetime import datetime
-import os
+import hmac
 from pathlib import Path
 
 
@@ -43,15 +49,29 @@ def allowed_file(filename):
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+def keyset_page(query, per_page, count_key=None, model=Part):
+    """Newest-first cursor pagination driven by ?cursor= / ?before="""
+    try:
+        return pagination.keyset_paginate(
+            query, [model.created_at, model.id],
+            after=request.args.get('cursor'),
+            before=request.args.get('before'),
+            per_page=per_page,
+            count_key=count_key
+        )
+    except ValueError as e:
+        abort(400, str(e))
+
+
 @bp.route('/brand/<int:brand_id>')
+@response_cache.cached(last_modified=catalogue_last_modified)
 def parts_by_brand(brand_id):
     """Show all parts for a specific brand"""
     brand = Brand.query.get_or_404(brand_id)
-    parts = Part.query.options(
-        db.joinedload(Part.images),
-        db.joinedload(Part.brand),
-        db.joinedload(Part.part_type)
-    ).filter_by(brand_id=brand_id).all()
+    query = PartListing.query.filter_by(brand_id=brand_id)
+    parts = keyset_page(query, per_page=24,
+                        count_key=location_key(None, 'brand', brand_id),
+                        model=PartListing)
 
     return render_template('brand_parts.html',
                            brand=brand,
@@ -59,87 +79,51 @@ def parts_by_brand(brand_id):
 
 
 @bp.route('/gallery')
+@response_cache.cached(last_modified=catalogue_last_modified)
 def gallery():
-    # Initialize query with eager loading
-    query = Part.query.options(
-        db.joinedload(Part.images),
-        db.joinedload(Part.brand),
-        db.joinedload(Part.part_type),
-        db.joinedload(Part.tags)
-    )
-
-    # Filter parameters
-    brand_id = request.args.get('brand', type=int)
-    type_id = request.args.get('type', type=int)
-    tag_names = request.args.getlist('tag')
-    search_query = request.args.get('q', '').strip()
-
-    # Apply filters
-    if brand_id:
-        query = query.filter_by(brand_id=brand_id)
-
-    if type_id:
-        query = query.filter_by(part_type_id=type_id)
-
-    if tag_names:
-        query = query.join(part_tags).join(Tag).filter(Tag.name.in_(tag_names))
-
-    if search_query:
-        search = f"%{search_query}%"
-        query = query.filter(or_(
-            Part.name.ilike(search),
-            Part.description.ilike(search),
-            Part.part_number.ilike(search),
-            Brand.name.ilike(search),
-            PartType.name.ilike(search)
-        ))
-
-    # Pagination
-    page = request.args.get('page', 1, type=int)
+    # Cards come ready-joined from the listing table
+    query = PartListing.query
+
+    # Filter parameters (?location= narrows everything to one location's
+    # parts, facets and search results included)
+    filters = {
+        'location': request.args.get('location', type=int),
+        'brand': request.args.get('brand', type=int),
+        'type': request.args.get('type', type=int),
+        'tags': request.args.getlist('tag'),
+        'q': request.args.get('q', '').strip()
+    }
+    query = facets.apply_filters(query, filters, model=PartListing)
+
+    # Pagination - cursor based unless the caller asked for a page number
+    # or is searching (search results are ordered by rank, not date)
     per_page = 12  # Items per page
-    parts = query.paginate(page=page, per_page=per_page, error_out=False)
-
-    # Get filter options
-    brands = Brand.query.order_by(Brand.name).all()
-    part_types = PartType.query.order_by(PartType.name).all()
-
-      # Get all distinct tag names with their counts
-    tag_counts = db.session.query(
-        Tag.name,
-        func.count(part_tags.c.part_id).label('count')
-    ).join(
-        part_tags
-    ).group_by(
-        Tag.name
-    ).order_by(
-        Tag.name
-    ).all()
-
-    # Get all tags that exist (even if unused)
-    all_tags = Tag.query.order_by(Tag.name).all()
-
-    # Combine the data
-    tags_data = []
-    for tag in all_tags:
-        count = next((tc[1] for tc in tag_counts if tc[0] == tag.name), 0)
-        tags_data.append({
-            'name': tag.name,
-            'count': count,
-            'slug': slugify(tag.name)
-        })
+    if 'page' in request.args or filters['q']:
+        page = request.args.get('page', 1, type=int)
+        parts = query.paginate(page=page, per_page=per_page, error_out=False)
+    else:
+        count_key = location_key(filters['location'], 'gallery', filters['brand'],
+                                 filters['type'], tuple(sorted(filters['tags'])))
+        parts = keyset_page(query, per_page, count_key, model=PartListing)
+
+    # Sidebar options and drill-down counts (cached between writes)
+    options = facets.facet_options()
+    counts = facets.facet_counts(filters)
+    tags_data = [dict(tag, count=counts['tags'].get(tag['id'], 0))
+                 for tag in options['tags']]
+    locations = [dict(location, count=counts['locations'].get(location['id'], 0))
+                 for location in options['locations']]
 
     return render_template(
         'gallery.html',
         parts=parts,
-        brands=brands,
-        part_types=part_types,
+        brands=options['brands'],
+        part_types=options['types'],
+        brand_counts=counts['brands'],
+        type_counts=counts['types'],
         all_tags=tags_data,  # Now passing properly structured data
-        current_filters={
-            'brand': brand_id,
-            'type': type_id,
-            'tags': tag_names,
-            'q': search_query
-        }
+        locations=locations,
+        current_filters=filters
     )
 
 
@@ -160,10 +144,6 @@ def add_part_form():
 
 @bp.route('/add_part', methods=['POST'])
 def add_part():
-    print("\n=== ADD_PART REQUEST ===")
-    print("Form data:", request.form.to_dict())
-    print("Image IDs:", request.form.getlist('image_ids[]'))
-
     data = request.form
     try:
         # Validate required fields
@@ -188,48 +168,80 @@ def add_part():
         # -- Critical Fix: Moved tag handling BEFORE commit/return --
         # Handle tags (max 8, like octal tube pins)
         tag_names = helpers.validate_tags(request.form.getlist('tags[]'))
-        for name in tag_names:
-            tag = Tag.query.filter_by(name=name[:100]).first() or Tag(name=name)
-            new_part.tags.append(tag)
+        tagging.set_tags(new_part, tagging.resolve_tags(tag_names))
 
-        # Handle image associations (NEW IMPROVED VERSION)
+        # Handle image associations - one query for all of them
         image_ids = request.form.getlist('image_ids[]')
-        for img_id in image_ids:
-            if img_id:  # Skip empty/None
-                image = Image.query.get(img_id)
-                if image:
-                    # Set both forward and backward references
-                    new_part.images.append(image)
-                    image.part_id = new_part.id  # Explicitly set foreign key
-                    db.session.add(image)  # Ensure change is tracked
+        tagging.attach_images(new_part, tagging.resolve_images(image_ids))
 
         db.session.commit()  # Single atomic commit
-        print(f"Successfully created part {new_part.id} with {len(image_ids)} images")
+        current_app.logger.info(f"Created part {new_part.id} with {len(image_ids)} images")
         
         return jsonify({
             "success": True,
             "part_id": new_part.id,
+            "redirect": url_for('parts.view_part', part_id=new_part.id),
             "image_count": len(image_ids),
             "images": [img.id for img in new_part.images]  # Verification
         })
         
     except Exception as e:
-        print("ERROR:", str(e))
         db.session.rollback()
+        helpers.log_error("Add part", e)
         return jsonify({"error": str(e)}), 400
 
 
+@bp.route('/import_parts', methods=['POST'])
+def import_parts():
+    """Bulk import: an uploaded CSV/JSON/NDJSON `file`, or a JSON body
+    (a list of parts, or {"parts": [...]}).  ?dry_run=1 validates only.
+    For scripts, so exempt from CSRF: send `Authorization: Bearer
+    <IMPORT_TOKEN>`.  Off (403) while IMPORT_TOKEN isn't configured.
+    """
+    token = current_app.config.get('IMPORT_TOKEN')
+    if not token:
+        return jsonify({"error": "Imports are disabled (no IMPORT_TOKEN)"}), 403
+    supplied = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+    if not hmac.compare_digest(supplied.encode(), token.encode()):
+        return jsonify({"error": "Missing or wrong import token"}), 401
+
+    dry_run = request.values.get('dry_run', '').lower() in ('1', 'true', 'yes')
+    try:
+        if 'file' in request.files:
+            upload = request.files['file']
+            fmt = request.values.get('format') or \
+                importer.detect_format(upload.filename or '')
+            rows = importer.read_rows(upload.stream, fmt)
+        elif request.is_json:
+            data = request.get_json()
+            rows = data['parts'] if isinstance(data, dict) else data
+        else:
+            return jsonify({"error": "Send a file or a JSON body"}), 400
+
+        report = importer.import_parts(rows, dry_run=dry_run)
+    except (ValueError, KeyError) as e:  # before anything was imported
+        db.session.rollback()
+        return jsonify({"error": f"Unreadable import: {e}"}), 400
+    except importer.ImportFailed as e:
+        # 207 if earlier batches were committed: the report says what
+        # landed.  Otherwise bad input is the client's fault (400), a
+        # rejected batch isn't (409).
+        if e.report.parts and not dry_run:
+            status = 207
+        else:
+            status = 400 if e.unreadable else 409
+        return jsonify({"error": f"Import stopped: {e}",
+                        "rows": [e.first_row, e.last_row],
+                        "report": e.report.to_dict()}), status
+
+    return jsonify(report.to_dict())
+
+
 @bp.route('/part/<int:part_id>')
+@response_cache.cached(last_modified=part_last_modified)
 def view_part(part_id):
     """Display a single part with all details"""
-    part = Part.query.options(
-        db.joinedload(Part.brand),
-        db.joinedload(Part.part_type),
-        db.joinedload(Part.location),
-        db.joinedload(Part.images),
-        db.joinedload(Part.tags)
-    ).get_or_404(part_id)
-    print('hell yeah')
+    part = Part.query.options(*loading.part_detail_options()).get_or_404(part_id)
 
     return render_template('part.html', 
                            part=part,
@@ -238,13 +250,7 @@ def view_part(part_id):
 
 @bp.route('/edit/<int:part_id>', methods=['GET', 'POST'])
 def edit_part(part_id):
-    part = Part.query.options(
-        db.joinedload(Part.brand),
-        db.joinedload(Part.part_type),
-        db.joinedload(Part.location),
-        db.joinedload(Part.tags),
-        db.joinedload(Part.images)
-    ).get_or_404(part_id)
+    part = Part.query.options(*loading.part_detail_options()).get_or_404(part_id)
 
     if request.method == 'POST':
         try:
@@ -260,36 +266,24 @@ def edit_part(part_id):
             part.part_type_id = int(request.form['part_type_id'])
             part.location_id = int(request.form.get('location_id', 0)) or None
             
-            # Handle tags
+            # Handle tags - only added/removed ones are written
             tag_names = [t.strip() for t in request.form.getlist('tags[]') if t.strip()]
-            part.tags = []
-            for name in tag_names:
-                tag = Tag.query.filter_by(name=name).first() or Tag(name=name)
-                part.tags.append(tag)
+            tagging.set_tags(part, tagging.resolve_tags(tag_names))
             
             # Handle image deletions
             if request.form.get('deleted_images'):
-                deleted_ids = [int(id) for id in request.form['deleted_images'].split(',') if id]
-                for img_id in deleted_ids:
-                    image = Image.query.get(img_id)
-                    if image and image.part_id == part.id:
-                        db.session.delete(image)
+                tagging.detach_images(part, request.form['deleted_images'].split(','))
             
-            # Handle new images
+            # Handle new images (only those not already assigned)
             image_ids = request.form.getlist('image_ids[]')
-            for img_id in image_ids:
-                if img_id:  # Skip empty/None
-                    image = Image.query.get(img_id)
-                    if image and not image.part_id:  # Only add if not already assigned
-                        # Set both forward and backward references
-                        part.images.append(image)
-                        image.part_id = part.id  # Explicitly set foreign key
-                        db.session.add(image)  # Ensure change is tracked
+            tagging.attach_images(part, tagging.resolve_images(image_ids))
             
+            # (before commit, which would expire part and reload it)
+            redirect_url = url_for('parts.view_part', part_id=part.id)
             db.session.commit()
             return jsonify({
                 "success": True,
-                "redirect": url_for('parts.view_part', part_id=part.id)
+                "redirect": redirect_url
             })
             
         except Exception as e:
@@ -308,102 +302,299 @@ def edit_part(part_id):
                            locations=locations)
 
 
-@bp.route('/all_images', methods=['GET'])
-def get_images():
-    """Get all images with their tags"""
-    images = Image.query.options(db.joinedload(Image.tags)).all()
-    return jsonify([{
+def image_json(img):
+    return {
         'id': img.id,
         'filename': img.filename,
         'description': img.description,
         'created_at': img.created_at.isoformat(),
         'tags': [{'id': t.id, 'name': t.name} for t in img.tags],
-        'url': f"/static/images/{img.filename}"
-    } for img in images])
+        'url': f"/static/images/{img.filename}",
+        'thumbnail_url': f"/static/{img.static_path('thumb')}",
+        'renditions': images.renditions_dict(img)
+    }
+
+
+@bp.route('/all_images', methods=['GET'])
+def get_images():
+    """Get all images with their tags.
+    ?limit=N pages through them (newest first, ?cursor= for the next page);
+    ?format=ndjson streams one image per line; otherwise the whole
+    catalogue is streamed as a JSON array.
+    """
+    fmt = request.args.get('format', 'json')
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor', '')
+
+    etag = export.image_catalogue_etag(fmt, limit, cursor)
+    if etag in request.if_none_match:
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+
+    query = db.select(Image).options(
+        db.selectinload(Image.tags),
+        db.selectinload(Image.renditions)
+    )
+
+    if limit:
+        try:
+            page = pagination.keyset_paginate(
+                Image.query.options(
+                    db.selectinload(Image.tags),
+                    db.selectinload(Image.renditions)
+                ),
+                [Image.id],
+                after=cursor or None,
+                per_page=min(limit, 1000),
+                count_key=location_key(None, 'images')
+            )
+        except ValueError as e:
+            abort(400, str(e))
+        response = jsonify(page.to_dict(image_json))
+    elif fmt == 'ndjson':
+        response = current_app.response_class(
+            stream_with_context(export.stream_ndjson(query.order_by(Image.id),
+                                                     image_json)),
+            mimetype='application/x-ndjson')
+    else:
+        response = current_app.response_class(
+            stream_with_context(export.stream_json_array(query.order_by(Image.id),
+                                                         image_json)),
+            mimetype='application/json')
+
+    response.set_etag(etag)
+    return response
+
+
+def upload_response(image, job=None, duplicate=False):
+    response = {
+        "id": image.id,  # Must be 'id' for Dropzone
+        "filename": image.original_filename or image.filename,
+        "url": url_for('static', filename=f"images/{image.filename}"),
+        "size": image.file_size,
+        "duplicate": duplicate
+    }
+    if job:
+        response["job_id"] = job.id
+        response["status_url"] = url_for('parts.image_job_status', job_id=job.id)
+    return response
 
 
 @bp.route('/upload_images', methods=['POST'])
+@storage.streamed
 def upload_images():
-    """Handle file uploads with Dropzone-compatible responses"""
+    """Handle file uploads with Dropzone-compatible responses.  Every file
+    in the request is saved in one transaction.  Dropzone chunks (large
+    scans) are stored until /upload_images/<id>/finish joins them.
+    """
     if 'files' not in request.files:
         return jsonify(error="No files uploaded"), 400
 
     upload_dir = Path(current_app.config['UPLOAD_FOLDER'])
     upload_dir.mkdir(parents=True, exist_ok=True)
-    
-    files = request.files.getlist('files')
-    if not files or all(f.filename == '' for f in files):
+
+    files = [f for f in request.files.getlist('files') if f and f.filename]
+    if not files:
         return jsonify(error="No selected files"), 400
+    if request.form.get('dzuuid'):
+        return upload_chunk(files[0], upload_dir)
 
-    responses = []
+    received = []
     for file in files:
-        if not file or file.filename == '':
+        if not allowed_file(file.filename):
             continue
-
         try:
-            if not allowed_file(file.filename):
-                continue
-                
-            filename = secure_filename(file.filename)
-            save_path = upload_dir / filename
-
-            # Handle duplicates
-            counter = 1
-            while save_path.exists():
-                name, ext = os.path.splitext(filename)
-                filename = f"{name}_{counter}{ext}"
-                save_path = upload_dir / filename
-                counter += 1
-
-            # Save file
-            file.save(str(save_path.absolute()))
-            if not save_path.exists():
-                raise IOError("File save verification failed")
-
-            # Create DB record
-            new_image = Image(filename=filename)
-            db.session.add(new_image)
-            db.session.flush()  # Get ID without commit
-
-            # Critical change: Single-file response format
-            response = {
-                "id": new_image.id,  # Must be 'id' for Dropzone
-                "filename": filename,
-                "url": url_for('static', filename=f"images/{filename}"),
-                "size": save_path.stat().st_size
-            }
-            responses.append(response)
-            
-            # Immediate commit per file (better for Dropzone)
-            db.session.commit()
+            received.append((file.filename,
+                             storage.receive(file.stream, upload_dir)))
+        except OSError as e:
+            helpers.log_error(f"Upload of {file.filename}", e)
+    return save_uploads(received, upload_dir, upload_location())
+
 
+def upload_chunk(file, upload_dir):
+    """Store one chunk of a chunked Dropzone upload"""
+    if not allowed_file(file.filename):
+        return jsonify(error="File type not allowed"), 400
+    try:
+        upload_id = request.form['dzuuid']
+        count = storage.save_chunk(upload_id,
+                                   int(request.form['dzchunkindex']),
+                                   int(request.form['dztotalchunkcount']),
+                                   int(request.form.get('dztotalfilesize', 0)),
+                                   file.stream, upload_dir)
+    except (KeyError, ValueError) as e:
+        return jsonify(error=f"Bad chunk: {e}"), 400
+    return jsonify(upload_id=upload_id, received=count)
+
+
+@bp.route('/upload_images/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    """Chunks received so far, so an interrupted upload can resume"""
+    upload_dir = Path(current_app.config['UPLOAD_FOLDER'])
+    try:
+        chunks = storage.received_chunks(upload_id, upload_dir)
+    except ValueError as e:
+        abort(400, str(e))
+    return jsonify(upload_id=upload_id, chunks=chunks)
+
+
+@bp.route('/upload_images/<upload_id>/finish', methods=['POST'])
+def finish_upload(upload_id):
+    """Join a chunked upload's chunks and save it like a single upload"""
+    filename = request.form.get('filename', '')
+    if not allowed_file(filename):
+        return jsonify(error="File type not allowed"), 400
+    total = request.form.get('total_chunks', type=int)
+    if total is None:
+        return jsonify(error="total_chunks is required"), 400
+    upload_dir = Path(current_app.config['UPLOAD_FOLDER'])
+    try:
+        received = storage.assemble(upload_id, total, upload_dir)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    return save_uploads([(filename, received)], upload_dir, upload_location())
+
+
+def upload_location():
+    """The location (form field location_id) uploads are for, if it exists"""
+    location_id = request.form.get('location_id', type=int)
+    if location_id and db.session.get(Location, location_id):
+        return location_id
+    return None
+
+
+def save_uploads(received, upload_dir, location_id=None):
+    """Create Images for received files [(filename, (digest, temp path,
+    size))], all in one transaction, then queue their processing.  They
+    are stored in `location_id`'s directory.
+    """
+    duplicates = storage.find_duplicates((digest for _, (digest, _, _) in received),
+                                         location_id)
+    saved = []
+    for filename, (digest, tmp_path, size) in received:
+        try:
+            saved.append(add_upload(filename, digest, tmp_path, size,
+                                    upload_dir, duplicates, location_id))
         except Exception as e:
-            db.session.rollback()
-            if 'save_path' in locals() and save_path.exists():
-                save_path.unlink()
-            current_app.logger.error(f"Upload failed: {str(e)}")
-            continue
+            Path(tmp_path).unlink(missing_ok=True)
+            helpers.log_error(f"Upload of {filename}", e)
+    if not saved:
+        return jsonify(error="No valid files processed"), 400
 
-    if responses:
-        # Dropzone expects single-file responses
-        if len(responses) == 1:
-            return jsonify(responses[0]), 201
-        return jsonify(responses), 201
-    
-    return jsonify(error="No valid files processed"), 400
+    try:
+        db.session.flush()  # ids for the responses, without reloading later
+        responses = [upload_response(image, job=job, duplicate=reused)
+                     for image, job, reused in saved]
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        helpers.log_error("Saving uploads", e)
+        return jsonify(error="Upload failed"), 500
+
+    # resizing, metadata etc. happen in the background so a big Dropzone
+    # batch doesn't tie up the worker
+    for _, job, _ in saved:
+        if job:
+            image_jobs.submit(job.id)
+
+    # Dropzone expects single-file responses
+    if len(responses) == 1:
+        return jsonify(responses[0]), 201
+    return jsonify(responses), 201
+
+
+def add_upload(filename, digest, tmp_path, size, upload_dir, duplicates,
+               location_id=None):
+    """Image for one received file: a new one, or an unassigned copy of
+    the same bytes to reuse.  `duplicates` (hash -> Image) gets new images
+    added, so repeats within a batch are caught too.
+    Returns (image, job or None, reused).
+    """
+    duplicate = duplicates.get(digest)
+    if duplicate and not duplicate.part_id:
+        # Same photo uploaded again and still unassigned - reuse it
+        Path(tmp_path).unlink(missing_ok=True)
+        return duplicate, None, True
+
+    if duplicate:
+        # Already on another part: share its file and renditions
+        Path(tmp_path).unlink(missing_ok=True)
+        image = storage.clone_image(duplicate)
+    else:
+        stored = storage.store(tmp_path, digest, Path(filename).suffix, upload_dir,
+                               location_id)
+        image = duplicates[digest] = Image(filename=stored, content_hash=digest,
+                                           file_size=size, location_id=location_id)
+    image.original_filename = secure_filename(filename)[:255]
+    db.session.add(image)
+    # a copy of a photo whose job hasn't run yet gets a job of its own:
+    # nothing else would fill in its renditions and phash
+    job = None if duplicate and image.renditions else image_jobs.enqueue(image)
+    return image, job, False
+
+
+@bp.route('/image_jobs/<int:job_id>', methods=['GET'])
+def image_job_status(job_id):
+    """Processing status of an upload, polled by the part editor"""
+    job = ImageJob.query.get_or_404(job_id)
+    result = job.to_dict()
+    if job.status == 'done':
+        result['thumbnail_url'] = url_for('static',
+                                          filename=job.image.static_path('thumb'))
+    return jsonify(result)
 
 
 @bp.route('/image/<int:image_id>', methods=['GET'])
 def get_image(image_id):
     """Get single image details"""
-    image = Image.query.options(db.joinedload(Image.tags)).get_or_404(image_id)
+    image = Image.query.options(
+        db.selectinload(Image.tags),
+        db.selectinload(Image.renditions)
+    ).get_or_404(image_id)
+    return jsonify(image_json(image))
+
+
+@bp.route('/similar', methods=['POST'])
+def similar_to_photo():
+    """Parts with an image that looks like the uploaded photo ('file').
+    ?limit= (default 20) and ?distance= (bits of 64; default
+    SIMILARITY_MAX_DISTANCE) as for /image/<id>/similar.  Read-only, so
+    exempt from CSRF (see register_blueprints).
+    """
+    file = request.files.get('file')
+    if not file or not file.filename:
+        return jsonify(error="No file uploaded"), 400
+    if not allowed_file(file.filename):
+        return jsonify(error="File type not allowed"), 400
+    try:
+        phash = images.photo_hash(file.stream)
+    except Exception:  # not an image Pillow can read
+        return jsonify(error="Unreadable image"), 400
+    return similar_parts_response(phash)
+
+
+@bp.route('/image/<int:image_id>/similar', methods=['GET'])
+def similar_to_image(image_id):
+    """Other parts with an image that looks like this one"""
+    image = Image.query.get_or_404(image_id)
+    if not image.phash:
+        return jsonify(error="Image not fingerprinted yet"), 409
+    return similar_parts_response(image.phash, exclude_part=image.part_id)
+
+
+def similar_parts_response(phash, exclude_part=None):
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    matches = similarity_index.similar_parts(
+        phash, limit=limit, exclude_part=exclude_part,
+        max_distance=request.args.get('distance', type=int))
+    listings = {row.id: row for row in PartListing.query.filter(
+        PartListing.id.in_([m.part_id for m in matches]))}
     return jsonify({
-        'id': image.id,
-        'filename': image.filename,
-        'description': image.description,
-        'created_at': image.created_at.isoformat(),
-        'tags': [{'id': t.id, 'name': t.name} for t in image.tags],
-        'url': f"/static/images/{image.filename}"
+        'phash': phash,
+        'parts': [dict(listings[m.part_id].to_dict(),
+                       image_id=m.image_id, distance=m.distance)
+                  for m in matches if m.part_id in listings],
     })
 
 
@@ -419,14 +610,15 @@ def update_image(image_id):
 @bp.route('/delete_image/<int:image_id>', methods=['DELETE'])
 def delete_image(image_id):
     image = Image.query.get_or_404(image_id)
-    print(f"Made it to delete for image id {image_id}")
     try:
         # Build absolute path
         image_path = Path(current_app.config['UPLOAD_FOLDER']) / image.filename
-        print(image_path)
         # Verify file exists before deletion
         if image_path.exists():
-            image_path.unlink()  # Delete file
+            # Identical uploads share one stored file
+            if not storage.is_shared(image):
+                image_path.unlink()  # Delete file
+                images.remove_rendition_files(image)
             db.session.delete(image)  # Delete DB record
             db.session.commit()
             return jsonify({"success": True})
@@ -441,9 +633,21 @@ def delete_image(image_id):
 
 @bp.route('/tags/<string:tag_name>')
 def parts_by_tag(tag_name):
-    """Get all parts with a specific tag"""
-    parts = Part.query.join(part_tags).join(Tag).filter(Tag.name == tag_name).all()
-    return jsonify([p.to_dict() for p in parts])
+    """Get all parts with a specific tag, as a JSON list.  With ?limit=,
+    ?cursor= or ?before=, one page at a time instead, newest first:
+    {items, next_cursor, prev_cursor, total}.
+    """
+    query = PartListing.query \
+        .join(part_tags, part_tags.c.part_id == PartListing.id) \
+        .join(Tag, Tag.id == part_tags.c.tag_id).filter(Tag.name == tag_name)
+    if not any(arg in request.args for arg in ('limit', 'cursor', 'before')):
+        # the original response, which existing clients expect
+        return jsonify([p.to_dict() for p in query.order_by(PartListing.id)])
+
+    per_page = min(request.args.get('limit', 50, type=int), 200)
+    parts = keyset_page(query, per_page, count_key=location_key(None, 'tag', tag_name),
+                        model=PartListing)
+    return jsonify(parts.to_dict(PartListing.to_dict))
 
 
 @bp.route('/<int:image_id>/tags', methods=['GET'])
@@ -470,27 +674,24 @@ def add_image_tag(image_id):
         return jsonify(error="Tag too long (max 20 chars)"), 400
 
     image = Image.query.get_or_404(image_id)
-    
-    # Check if already tagged
-    if any(t.name.lower() == tag_name for t in image.tags):
+
+    # Find or create the tag, matched on slug or name like the part forms
+    created = []
+    tags = tagging.resolve_tags([tag_name.capitalize()], created)
+    if not tags:
+        return jsonify(error="Empty tag name"), 400
+    tag, is_new = tags[0], bool(created)
+
+    if tag in image.tags:
+        db.session.rollback()
         return jsonify(error="Image already has this tag"), 400
-        
-    # Check tag limit
     if len(image.tags) >= 8:
+        db.session.rollback()
         return jsonify(error="Maximum 8 tags per image"), 400
 
-    # Find or create tag
-    tag = Tag.query.filter(func.lower(Tag.name) == tag_name).first()
-    is_new = False
-    
-    if not tag:
-        tag = Tag(name=tag_name.capitalize())
-        db.session.add(tag)
-        is_new = True
-    
     image.tags.append(tag)
     db.session.commit()
-    
+
     return jsonify({
         'id': tag.id,
         'name': tag.name,
@@ -520,7 +721,6 @@ def remove_tag(image_id, tag_id):
 
 @bp.route('/images/<int:image_id>/tags/available')
 def available_tags(image_id):
-    image = Image.query.get_or_404(image_id)
-    all_tags = Tag.query.order_by(Tag.name).all()
-    available = [tag for tag in all_tags if tag not in image.tags]
-    return jsonify([{'id': tag.id, 'name': tag.name} for tag in available])
+    image = Image.query.options(db.selectinload(Image.tags)).get_or_404(image_id)
+    available = tag_index.all(exclude={tag.id for tag in image.tags})
+    return jsonify([{'id': tag['id'], 'name': tag['name']} for tag in available])
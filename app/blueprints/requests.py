@@ -1,11 +1,129 @@
+from flask import Blueprint, flash, redirect, request, url_for, current_app, \
+                  jsonify, get_flashed_messages
+from flask_wtf.csrf import generate_csrf
+from ..models import db, Part, PartRequest, Reservation
+from ..utils import reservations
+from ..utils.outbox import outbox
+
+
+#
+# Requests for parts, passed on to the librarian of wherever the part is
+# kept.  The email isn't sent here: it joins the librarian's next digest
+# (utils/outbox.py), so a slow or unreachable mail server never holds up
+# the request.  If one's in stock, a unit is held for the requester
+# meanwhile (utils/reservations.py), and the JSON reservation API below
+# does the same for other clients.
+#
+# Every POST here needs a CSRF token (the X-CSRFToken header, for the
+# JSON API).  Part pages are response-cached, so the request form can't
+# carry the visitor's token or show their flashed messages: the page
+# fetches both from /request-part/state, which is never cached.
+#
+
+bp = Blueprint('requests', __name__)
+
+
+@bp.route('/request-part/state', methods=['GET'])
+def request_form_state():
+    """The per-visitor parts of the request form: a CSRF token and any
+    flashed messages (e.g. "Request sent!")"""
+    response = jsonify(csrf_token=generate_csrf(),
+                       messages=get_flashed_messages())
+    response.cache_control.no_store = True
+    return response
+
+
 @bp.route('/request-part', methods=['POST'])
 def request_part():
-    """Email librarian about a part"""
-    part = Part.query.get(request.form['part_id'])
-    send_email(
-        to=part.location.librarian_email,
-        subject=f"Part Request: {part.name}",
-        body=f"Requester: {request.form['email']}\nNotes: {request.form['notes']}"
-    )
+    """Record a request for a part and queue it for the librarian"""
+    part = Part.query.get_or_404(request.form.get('part_id', type=int))
+    email = request.form.get('email', '').strip()
+    if '@' not in email:
+        flash("Please give an email address so the librarian can reply.")
+        return redirect(url_for('parts.view_part', part_id=part.id))
+
+    part_request = PartRequest(part=part, requester_email=email[:120],
+                               notes=request.form.get('notes', '').strip()[:1024],
+                               status='Pending')
+    db.session.add(part_request)
+    reservations.reserve(part.id, requester_email=part_request.requester_email,
+                         part_request=part_request)
+    recipient = (part.location and part.location.librarian_email) or \
+        current_app.config['LIBRARIAN_EMAIL']
+    if recipient:
+        outbox.enqueue(recipient, *request_email(part_request),
+                       part_request=part_request)
+    else:
+        current_app.logger.warning(f"Part request for part {part.id}: "
+                                   f"no librarian to tell")
+    db.session.commit()
+
     flash("Request sent! The librarian will contact you soon.")
-    return redirect(url_for('parts.detail', part_id=part.id))
\ No newline at end of file
+    return redirect(url_for('parts.view_part', part_id=part.id))
+
+
+def request_email(part_request):
+    """(subject, body) of the email about a part request"""
+    part = part_request.part
+    link = url_for('parts.view_part', part_id=part.id, _external=True)
+    held = part_request.reservation
+    stock = (f"One is held for them until {held.expires_at:%Y-%m-%d %H:%M} UTC"
+             if held else "None in stock to hold")
+    return (f"Part Request: {part.name}",
+            f"Part: {part.name}"
+            f"{' - ' + part.part_number if part.part_number else ''}\n"
+            f"Link: {link}\n"
+            f"Requester: {part_request.requester_email}\n"
+            f"Notes: {part_request.notes or '-'}\n"
+            f"Stock: {stock}")
+
+
+# -- reservation API --
+
+@bp.route('/part/<int:part_id>/reserve', methods=['POST'])
+def reserve_part(part_id):
+    """Hold units of a part: JSON {quantity, email}.  201 with the
+    reservation (keep its token), or 409 if there aren't enough free.
+    """
+    part = Part.query.get_or_404(part_id)
+    data = request.get_json(silent=True) or request.form
+    try:
+        quantity = int(data.get('quantity', 1))
+        reservation = reservations.reserve(part.id, quantity,
+                                           requester_email=(data.get('email') or '')[:120])
+    except (TypeError, ValueError) as e:  # e.g. {"quantity": null}
+        return jsonify(error=f"Bad quantity: {e}"), 400
+    db.session.commit()  # any expired holds it released, too
+    if reservation is None:
+        db.session.refresh(part)
+        return jsonify(error="Not enough in stock", available=part.quantity or 0), 409
+    return jsonify(reservation.to_dict()), 201
+
+
+@bp.route('/reservations/<token>', methods=['GET'])
+def get_reservation(token):
+    return jsonify(Reservation.query.filter_by(token=token).first_or_404().to_dict())
+
+
+@bp.route('/reservations/<token>/release', methods=['POST'])
+def release_reservation(token):
+    """Give the held units back"""
+    return close_reservation(token, reservations.release)
+
+
+@bp.route('/reservations/<token>/fulfil', methods=['POST'])
+def fulfil_reservation(token):
+    """The held units were collected"""
+    return close_reservation(token, reservations.fulfil)
+
+
+def close_reservation(token, close):
+    reservation = Reservation.query.filter_by(token=token).first_or_404()
+    if not close(reservation):
+        db.session.rollback()
+        db.session.refresh(reservation)
+        return jsonify(error=f"Reservation is {reservation.status}, not held",
+                       **reservation.to_dict()), 409
+    db.session.commit()
+    db.session.refresh(reservation)
+    return jsonify(reservation.to_dict())
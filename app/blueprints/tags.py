@@ -1,5 +1,7 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, \
+                  jsonify
 from ..models import db, Tag
+from ..utils.tagindex import tag_index
 from sqlalchemy.exc import IntegrityError
 
 
@@ -13,6 +15,17 @@ def manage_tags():
     return render_template('manage_tags.html', tags=tags)
 
 
+@bp.route('/suggest')
+def suggest_tags():
+    """Type-ahead: ?q=<typed so far>[&limit=10][&exclude=<id>,<id>],
+    most used tags first.  Served from memory, not the database.
+    """
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+    exclude = [int(i) for i in request.args.get('exclude', '').split(',')
+               if i.strip().isdigit()]
+    return jsonify(tag_index.suggest(request.args.get('q', ''), limit, exclude))
+
+
 @bp.route('/add', methods=['POST'])
 def add_tag():
     """Add a new tag"""
@@ -0,0 +1,554 @@
+import click
+from flask.cli import AppGroup
+
+
+#
+# flask CLI commands (run with `flask --app radioparts <group> <command>`)
+#
+
+search_cli = AppGroup('search', help='Manage the part search index')
+
+
+@search_cli.command('rebuild')
+def rebuild_search():
+    """Rebuild the full-text search index from scratch"""
+    from .utils import search
+    count = search.rebuild_index()
+    click.echo(f"Indexed {count} parts")
+
+
+images_cli = AppGroup('images', help='Manage uploaded images')
+
+
+@images_cli.command('renditions')
+@click.option('--all', 'regenerate', is_flag=True,
+              help='Regenerate renditions for images that already have them')
+def generate_renditions(regenerate):
+    """Generate thumbnail/card/detail renditions for existing images"""
+    from .models import db, Image
+    from .utils import images, helpers
+
+    done = failed = 0
+    for image in Image.query.order_by(Image.id).all():
+        if image.renditions and not regenerate:
+            continue
+        try:
+            images.generate_renditions(image)
+            db.session.commit()
+            done += 1
+        except Exception as e:
+            db.session.rollback()
+            helpers.log_error(f"Renditions for image {image.id}", e)
+            failed += 1
+    click.echo(f"Generated renditions for {done} images ({failed} failed)")
+
+
+@images_cli.command('fingerprint')
+@click.option('--all', 'redo', is_flag=True,
+              help='Recompute hashes images already have')
+@click.option('--batch-size', default=200, show_default=True,
+              help='Images per commit')
+def fingerprint_images(redo, batch_size):
+    """Compute the perceptual hashes "find similar parts" searches"""
+    from .models import db, Image
+    from .utils import images, helpers
+
+    done = failed = 0
+    last_id = 0
+    while True:
+        query = Image.query.filter(Image.id > last_id)
+        if not redo:
+            query = query.filter(Image.phash.is_(None))
+        batch = query.order_by(Image.id).limit(batch_size).all()
+        if not batch:
+            break
+        for image in batch:
+            try:
+                images.fingerprint(image)
+                done += 1
+            except Exception as e:  # missing or unreadable file
+                helpers.log_error(f"Fingerprint for image {image.id}", e)
+                failed += 1
+        last_id = batch[-1].id
+        db.session.commit()
+        db.session.expunge_all()
+    click.echo(f"Fingerprinted {done} images ({failed} failed)")
+
+
+@images_cli.command('process')
+def process_images():
+    """Run all queued image jobs now, in this process"""
+    from .models import db, ImageJob
+    from .utils.jobs import image_jobs
+
+    job_ids = db.session.scalars(
+        db.select(ImageJob.id).where(ImageJob.status == 'queued')
+    ).all()
+    processed = sum(1 for job_id in job_ids if image_jobs.run(job_id))
+    failed = ImageJob.query.filter_by(status='failed').count()
+    click.echo(f"Processed {processed} image jobs ({failed} failed in total)")
+
+
+@images_cli.command('dedupe')
+def dedupe_images():
+    """Move pre-existing uploads into content-addressed storage,
+    sharing one file between identical photos"""
+    from pathlib import Path
+    from flask import current_app
+    from .models import db, Image
+    from .utils import images, storage
+
+    upload_dir = Path(current_app.config['UPLOAD_FOLDER'])
+    moved = shared = missing = 0
+    for image in Image.query.filter(
+            ~Image.filename.startswith(f"{storage.CAS_DIR}/")).order_by(Image.id):
+        if storage.CAS_PATH.match(image.filename):
+            continue  # already stored by content, under a location
+        path = upload_dir / image.filename
+        if not path.exists():
+            missing += 1
+            continue
+
+        digest = images.file_hash(path)
+        filename = storage.cas_filename(digest, path.suffix, image.location_id)
+        if (upload_dir / filename).exists():
+            shared += 1
+            if filename != image.filename and not Image.query.filter(
+                    Image.filename == image.filename, Image.id != image.id).count():
+                path.unlink()
+        else:
+            (upload_dir / filename).parent.mkdir(parents=True, exist_ok=True)
+            path.rename(upload_dir / filename)
+            moved += 1
+
+        image.original_filename = image.original_filename or image.filename
+        image.filename = filename
+        image.content_hash = digest
+        db.session.commit()
+
+    click.echo(f"Moved {moved} files, merged {shared} duplicates, "
+               f"{missing} missing on disk")
+
+
+@images_cli.command('relocate')
+@click.option('--batch-size', default=200, show_default=True,
+              help='Images per commit')
+def relocate_images(batch_size):
+    """Move image files into the directory of the location their part is
+    kept at (after parts have changed location)"""
+    from pathlib import Path
+    from flask import current_app
+    from .models import db, Image
+    from .utils import helpers, storage
+
+    upload_dir = Path(current_app.config['UPLOAD_FOLDER'])
+    moved = failed = removed = 0
+    last_id = 0
+    while True:
+        batch = Image.query.options(db.selectinload(Image.renditions),
+                                    db.joinedload(Image.part)) \
+                           .filter(Image.id > last_id) \
+                           .order_by(Image.id).limit(batch_size).all()
+        if not batch:
+            break
+        left = []
+        for image in batch:
+            location_id = image.part.location_id if image.part else image.location_id
+            if image.location_id == location_id and \
+                    storage.location_of(image.filename) == location_id:
+                continue
+            try:
+                left += storage.relocate(image, location_id, upload_dir)
+                moved += 1
+            except OSError as e:  # missing file
+                helpers.log_error(f"Relocating image {image.id}", e)
+                failed += 1
+        last_id = batch[-1].id
+        db.session.commit()
+        removed += storage.remove_unused(left, upload_dir)
+        db.session.expunge_all()
+    click.echo(f"Relocated {moved} images ({failed} failed); "
+               f"removed {removed} old files")
+
+
+@images_cli.command('clean-uploads')
+@click.option('--max-age', type=int, default=None,
+              help='Seconds untouched (default UPLOAD_PARTIAL_MAX_AGE)')
+def clean_uploads(max_age):
+    """Remove abandoned temp files and unfinished chunked uploads"""
+    from flask import current_app
+    from .utils import storage
+
+    if max_age is None:
+        max_age = current_app.config['UPLOAD_PARTIAL_MAX_AGE']
+    removed = storage.clean_partial_uploads(current_app.config['UPLOAD_FOLDER'],
+                                            max_age)
+    click.echo(f"Removed {removed} abandoned uploads")
+
+
+parts_cli = AppGroup('parts', help='Manage the parts catalogue')
+
+
+@parts_cli.command('rebuild-listing')
+def rebuild_listing():
+    """Rebuild the PartListing read model from scratch"""
+    from .utils import listing
+    count = listing.rebuild()
+    click.echo(f"Rebuilt the listing for {count} parts")
+
+
+@parts_cli.command('sweep-reservations')
+def sweep_reservations():
+    """Release stock held by reservations past their expiry"""
+    from .utils import reservations
+
+    click.echo(f"Expired {reservations.sweep()} reservations")
+
+
+@parts_cli.command('compact-changes')
+def compact_changes():
+    """Drop change log rows superseded by a later change to the same object"""
+    from .utils import changelog
+
+    removed = changelog.compact()
+    click.echo(f"Removed {removed} superseded changes; latest seq {changelog.head()}")
+
+
+@parts_cli.command('import')
+@click.argument('file', type=click.File('rb'))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'json', 'ndjson']),
+              help='Input format (default: from the file extension)')
+@click.option('--batch-size', default=500, show_default=True,
+              help='Rows written per INSERT batch / commit')
+@click.option('--dry-run', is_flag=True,
+              help='Validate and report, then roll everything back')
+def import_parts(file, fmt, batch_size, dry_run):
+    """Bulk-import parts (with brands, types, locations and tags) from
+    CSV, JSON or NDJSON"""
+    from .utils import importer
+
+    try:
+        fmt = fmt or importer.detect_format(file.name)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+    def progress(report):
+        click.echo(f"  {report.rows} rows, {report.parts} parts, "
+                   f"{len(report.errors)} errors ({report.rate:.0f} rows/s)")
+
+    try:
+        report = importer.import_parts(importer.read_rows(file, fmt),
+                                       batch_size=batch_size, dry_run=dry_run,
+                                       progress=progress)
+    except importer.ImportFailed as e:
+        raise click.ClickException(f"{e} ({e.report.parts} parts imported before it)")
+    for row, error in report.errors[:20]:
+        click.echo(f"  row {row}: {error}")
+    if len(report.errors) > 20:
+        click.echo(f"  ... and {len(report.errors) - 20} more errors")
+    created = ', '.join(f"{n} {kind}" for kind, n in report.created.items())
+    click.echo(f"{'Would import' if dry_run else 'Imported'} {report.parts} "
+               f"of {report.rows} rows in {report.elapsed:.2f}s "
+               f"({report.rate:.0f} rows/s); new: {created}")
+
+
+outbox_cli = AppGroup('outbox', help='Queued emails to librarians')
+
+
+@outbox_cli.command('dispatch')
+@click.option('--loop', is_flag=True,
+              help='Keep dispatching every NOTIFY_INTERVAL seconds')
+def dispatch_outbox(loop):
+    """Send the digests that are due (for running from cron / a worker)"""
+    import time
+    from flask import current_app
+    from .utils.outbox import outbox
+
+    while True:
+        counts = outbox.dispatch()
+        click.echo(f"Sent {counts['digests']} digests ({counts['sent']} messages), "
+                   f"{counts['retrying']} to retry, {counts['failed']} failed")
+        if not loop:
+            break
+        time.sleep(current_app.config['NOTIFY_INTERVAL'] or 60)
+
+
+@outbox_cli.command('status')
+def outbox_status():
+    """Messages in the outbox, by status"""
+    from .models import db, OutboxMessage
+
+    counts = db.session.execute(
+        db.select(OutboxMessage.status, db.func.count())
+        .group_by(OutboxMessage.status)).all()
+    for status, count in sorted(counts):
+        click.echo(f"{status:<8} {count}")
+
+
+database_cli = AppGroup('database', help='Database connection and data moves')
+
+
+@database_cli.command('info')
+def database_info():
+    """Show the backend, pool and SQLite pragmas in effect"""
+    from .utils import database
+    for key, value in database.describe().items():
+        click.echo(f"{key:>13}: {value}")
+
+
+@database_cli.command('copy')
+@click.argument('target_url')
+@click.option('--batch-size', default=1000, show_default=True)
+def copy_database(target_url, batch_size):
+    """Copy all data into another (empty) database, e.g.
+    flask database copy postgresql://user@host/radioparts
+    then point DATABASE_URL at it."""
+    from .utils import database
+
+    try:
+        copied = database.copy_database(target_url, batch_size)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    for table, rows in copied.items():
+        click.echo(f"{table:>16}: {rows} rows")
+    click.echo(f"Copied {sum(copied.values())} rows; now set DATABASE_URL={target_url}")
+
+
+perf_cli = AppGroup('perf', help='Performance checks')
+
+# route -> most queries a cold-cache request may issue, whatever the
+# number of parts, tags or images involved
+QUERY_BUDGETS = {
+    '/gallery': 7,
+    '/gallery?cursor={cursor}': 7,
+    '/gallery?location={location_id}': 7,
+    '/brand/{brand_id}': 4,
+    '/part/{part_id}': 5,
+    '/edit/{part_id}': 8,
+}
+
+
+# pages whose queries must all be index lookups / ordered index scans
+EXPLAIN_ROUTES = (
+    '/gallery',
+    '/gallery?cursor={cursor}',
+    '/gallery?brand={brand_id}',
+    '/gallery?type={type_id}',
+    '/gallery?location={location_id}',
+    '/gallery?location={location_id}&brand={brand_id}',
+    '/gallery?tag={tag_name}',
+    '/brand/{brand_id}',
+    '/part/{part_id}',
+    '/tags/{tag_name}',
+)
+
+
+@perf_cli.command('queries')
+def check_queries():
+    """Check listing pages stay within their SQL query budgets"""
+    from flask import current_app
+    from .models import db, Part
+    from .utils import facets, pagination
+    from .utils.httpcache import response_cache
+    from .utils.querycount import QueryCounter
+
+    part = Part.query.order_by(Part.id.desc()).first()
+    if part is None:
+        raise click.ClickException("Need at least one part to check against")
+    cursor = pagination.encode_cursor([part.created_at, part.id])
+
+    client = current_app.test_client()
+    failures = 0
+    for route, budget in QUERY_BUDGETS.items():
+        url = route.format(part_id=part.id, brand_id=part.brand_id,
+                           location_id=part.location_id, cursor=cursor)
+        facets.invalidate()
+        pagination.invalidate()
+        response_cache.clear()
+        db.session.expunge_all()  # requests share this session; start cold
+        with QueryCounter() as counter:
+            response = client.get(url)
+        ok = response.status_code == 200 and counter.count <= budget
+        failures += not ok
+        click.echo(f"{'ok  ' if ok else 'FAIL'} {url}: {counter.count} queries "
+                   f"(budget {budget}), HTTP {response.status_code}")
+        if not ok and counter.count > budget:
+            click.echo('\n'.join(f"    {s.strip()}" for s in counter.statements))
+
+    if failures:
+        raise SystemExit(1)
+
+
+@perf_cli.command('explain')
+@click.option('--verbose', '-v', is_flag=True, help='Print every query plan')
+def check_query_plans(verbose):
+    """Check the listing pages' queries use indexes (EXPLAIN QUERY PLAN)"""
+    from flask import current_app
+    from .models import db, Part, Tag, part_tags
+    from .utils import facets, pagination, queryplan
+    from .utils.httpcache import response_cache
+    from .utils.querycount import QueryCounter
+
+    if db.engine.dialect.name != 'sqlite':
+        raise click.ClickException("Query plan checks read SQLite's EXPLAIN QUERY PLAN")
+    part = Part.query.order_by(Part.id.desc()).first()
+    tag = Tag.query.join(part_tags).first() or Tag.query.first()
+    if part is None or tag is None:
+        raise click.ClickException("Need at least one part and tag to check against")
+    cursor = pagination.encode_cursor([part.created_at, part.id])
+
+    client = current_app.test_client()
+    failures = 0
+    for route in EXPLAIN_ROUTES:
+        url = route.format(part_id=part.id, brand_id=part.brand_id,
+                           type_id=part.part_type_id, tag_name=tag.name,
+                           location_id=part.location_id, cursor=cursor)
+        facets.invalidate()
+        pagination.invalidate()
+        response_cache.clear()
+        db.session.expunge_all()
+        with QueryCounter() as counter:
+            response = client.get(url)
+        bad = queryplan.check_statements(counter.statements, counter.parameters)
+        ok = response.status_code == 200 and not bad
+        failures += not ok
+        click.echo(f"{'ok  ' if ok else 'FAIL'} {url}: {counter.count} queries, "
+                   f"HTTP {response.status_code}")
+        for statement, lines in bad:
+            click.echo(f"    {' '.join(statement.split())[:160]}")
+            click.echo('\n'.join(f"      -> {line}" for line in lines))
+        if verbose:
+            for statement, params in zip(counter.statements, counter.parameters):
+                click.echo(f"    {' '.join(statement.split())[:160]}")
+                for line in queryplan.explain(statement, params):
+                    click.echo(f"      {line}")
+
+    if failures:
+        raise SystemExit(1)
+
+
+# ms an app factory may take on top of importing Flask and SQLAlchemy
+STARTUP_BUDGETS = {
+    'create_cli_app': 150,
+    'create_app': 600,
+}
+
+
+@perf_cli.command('startup')
+@click.option('--repeat', default=5, show_default=True,
+              help='Fresh interpreters per measurement (the median is used)')
+def check_startup(repeat):
+    """Check the app factories start within their time budgets"""
+    from .utils import startup
+
+    failures = 0
+    for factory, budget in STARTUP_BUDGETS.items():
+        r = startup.measure(factory, repeat=repeat)
+        # the CLI app must not load any of the deferred modules
+        leaked = r['deferred'] if factory == 'create_cli_app' else []
+        ok = r['overhead_ms'] <= budget and not leaked
+        failures += not ok
+        click.echo(f"{'ok  ' if ok else 'FAIL'} {factory}(): {r['total_ms']:.0f} ms "
+                   f"(import {r['import_ms']:.0f}, create {r['create_ms']:.0f}); "
+                   f"{r['overhead_ms']:.0f} ms over Flask + SQLAlchemy (budget {budget})")
+        if leaked:
+            click.echo(f"    loaded: {', '.join(leaked)}")
+        if not ok:
+            click.echo('\n'.join(f"    {name:<40} {ms:8.1f} ms"
+                                 for name, ms in r['slowest']))
+
+    if failures:
+        raise SystemExit(1)
+
+
+@perf_cli.command('seed')
+@click.option('--parts', default=100_000, show_default=True)
+@click.option('--brands', default=500, show_default=True)
+@click.option('--tags', default=2000, show_default=True)
+@click.option('--images', default=300_000, show_default=True)
+@click.option('--locations', default=3, show_default=True)
+@click.option('--seed', 'random_seed', default=1, show_default=True,
+              help='Same seed, same catalogue')
+def seed_catalogue(parts, brands, tags, images, locations, random_seed):
+    """Fill an empty database with a synthetic catalogue to benchmark
+    against (point DATABASE_URL at a scratch file first)"""
+    import time
+    from .utils import benchmark
+
+    def progress(table, done, total):
+        if done == total:
+            click.echo(f"  {table}: {total}")
+
+    started = time.perf_counter()
+    try:
+        counts = benchmark.seed(parts=parts, brands=brands, tags=tags,
+                                images=images, locations=locations,
+                                seed=random_seed, progress=progress)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Seeded {sum(counts.values())} rows in "
+               f"{time.perf_counter() - started:.1f}s")
+
+
+@perf_cli.command('bench')
+@click.option('--iterations', '-n', default=50, show_default=True,
+              help='Requests per scenario')
+@click.option('--only', multiple=True, help='Scenario(s) to run (default: all)')
+@click.option('--warm', is_flag=True,
+              help="Keep page/facet/count caches between requests")
+@click.option('--json', 'json_path', type=click.Path(dir_okay=False),
+              help='Save results here, e.g. as a baseline')
+@click.option('--compare', type=click.File(), help='Baseline results to compare with')
+@click.option('--tolerance', default=0.2, show_default=True,
+              help='Allowed p95 slowdown against the baseline (0.2 = 20%)')
+def run_benchmark(iterations, only, warm, json_path, compare, tolerance):
+    """Time the gallery (every filter), part, brand, export, add/edit
+    and upload requests; report p50/p95 and queries per request"""
+    import json
+    import tempfile
+    from flask import current_app
+    from .utils import benchmark
+
+    # Forms are posted straight from the test client, and uploads must
+    # not land among the real images
+    current_app.config['WTF_CSRF_ENABLED'] = False
+    upload_dir = tempfile.TemporaryDirectory(prefix='radioparts-bench-')
+    current_app.config['UPLOAD_FOLDER'] = upload_dir.name
+
+    click.echo(f"{'scenario':<20} {'n':>4} {'p50 ms':>9} {'p95 ms':>9} "
+               f"{'max ms':>9} {'queries':>8} {'req/s':>8} {'errors':>6}")
+
+    def progress(name, r):
+        click.echo(f"{name:<20} {r['n']:>4} {r['p50_ms']:>9} {r['p95_ms']:>9} "
+                   f"{r['max_ms']:>9} {r['queries']:>8} {r['rps']:>8} {r['errors']:>6}")
+
+    try:
+        results = benchmark.run(list(only) or None, iterations=iterations,
+                                warm=warm, progress=progress)
+    except (ValueError, KeyError) as e:
+        raise click.ClickException(f"Can't run benchmark: {e}")
+    finally:
+        current_app.extensions['image_jobs'].shutdown()
+        upload_dir.cleanup()
+
+    if json_path:
+        with open(json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+        click.echo(f"Saved results to {json_path}")
+
+    if compare:
+        found = benchmark.regressions(results, json.load(compare), tolerance)
+        for name, message in found:
+            click.echo(f"REGRESSION {name}: {message}")
+        if found:
+            raise SystemExit(1)
+        click.echo("No regressions against the baseline")
+
+
+def register_commands(app):
+    app.cli.add_command(search_cli)
+    app.cli.add_command(images_cli)
+    app.cli.add_command(parts_cli)
+    app.cli.add_command(outbox_cli)
+    app.cli.add_command(database_cli)
+    app.cli.add_command(perf_cli)
@@ -1,6 +1,7 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 from datetime import datetime, timezone
-from slugify import slugify  # Requires python-slugify package
+from .utils.helpers import slugify
 
 
 db = SQLAlchemy()
@@ -10,7 +11,14 @@ db = SQLAlchemy()
 part_tags = db.Table('part_tags',
     db.Column('part_id', db.Integer, db.ForeignKey('Part.id'), primary_key=True),
     db.Column('tag_id', db.Integer, db.ForeignKey('Tag.id'), primary_key=True),
-    db.Column('created_at', db.DateTime, default=datetime.now(timezone.utc))
+    db.Column('created_at', db.DateTime, default=datetime.now(timezone.utc)),
+    # "parts with tag X": the primary key only helps from the part side
+    db.Index('ix_part_tags_tag_id', 'tag_id', 'part_id')
+)
+
+image_tags = db.Table('image_tags',
+    db.Column('image_id', db.Integer, db.ForeignKey('Image.id'), primary_key=True),
+    db.Column('tag_id', db.Integer, db.ForeignKey('Tag.id'), primary_key=True)
 )
 
 
@@ -50,6 +58,14 @@ class Location(db.Model):
 class Part(db.Model):
     """Vintage radio components"""
     __tablename__ = 'Part'
+    # Listings are newest first (keyset on created_at, id), either over
+    # everything or within one brand / type / location
+    __table_args__ = (
+        db.Index('ix_Part_created_at_id', 'created_at', 'id'),
+        db.Index('ix_Part_brand_id_created_at', 'brand_id', 'created_at', 'id'),
+        db.Index('ix_Part_part_type_id_created_at', 'part_type_id', 'created_at', 'id'),
+        db.Index('ix_Part_location_id_created_at', 'location_id', 'created_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)  # "Dial", "Valve"
     description = db.Column(db.String(1024))
@@ -58,8 +74,10 @@ class Part(db.Model):
     box = db.Column(db.String(20))            # "Box 3A"
     position = db.Column(db.String(50))       # "Bottom shelf"
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc),
+                           onupdate=lambda: datetime.now(timezone.utc), index=True)
     brand_id = db.Column(db.Integer, db.ForeignKey('Brand.id'))
-    location_id = db.Column(db.Integer, db.ForeignKey('Location.id'))
+    location_id = db.Column(db.Integer, db.ForeignKey('Location.id'), index=True)
     part_type_id = db.Column(db.Integer, db.ForeignKey('PartType.id'))
     
     # Relationships
@@ -69,6 +87,19 @@ class Part(db.Model):
     tags = db.relationship('Tag', secondary=part_tags, back_populates='parts')
     part_type = db.relationship('PartType')
 
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'description': self.description,
+            'part_number': self.part_number,
+            'quantity': self.quantity,
+            'brand_id': self.brand_id,
+            'part_type_id': self.part_type_id,
+            'location_id': self.location_id,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
 
 class PartType(db.Model):
     """Broad categories for radio parts (Tubes, Capacitors, etc.)"""
@@ -89,25 +120,123 @@ class PartType(db.Model):
 class PartRequest(db.Model):
     __tablename__ = 'PartRequest'
     id = db.Column(db.Integer, primary_key=True)
-    part_id = db.Column(db.Integer, db.ForeignKey('Part.id'))
+    part_id = db.Column(db.Integer, db.ForeignKey('Part.id'), index=True)
     requester_email = db.Column(db.String(120))
     notes = db.Column(db.String(1024))                # "Need for 1947 Philips restoration"
-    status = db.Column(db.String(20))         # "Pending", "Fulfilled"
+    status = db.Column(db.String(20), default='Pending')  # one of STATUSES
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+    # Pending: waiting on the librarian (nothing in stock to hold)
+    # Reserved: a unit is held for the requester (see Reservation)
+    STATUSES = ('Pending', 'Reserved', 'Fulfilled', 'Cancelled')
+
+    part = db.relationship('Part')
+    messages = db.relationship('OutboxMessage', back_populates='part_request')
+    reservation = db.relationship('Reservation', back_populates='part_request',
+                                  uselist=False)
+
+
+class Reservation(db.Model):
+    """Units of a Part held for someone until expires_at.  Held units are
+    already taken off Part.quantity (see utils/reservations.py)."""
+    __tablename__ = 'Reservation'
+    # the sweeper's query: holds past their expiry
+    __table_args__ = (
+        db.Index('ix_Reservation_status_expires_at', 'status', 'expires_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    token = db.Column(db.String(32), nullable=False, unique=True)  # for the API
+    part_id = db.Column(db.Integer, db.ForeignKey('Part.id'), nullable=False, index=True)
+    part_request_id = db.Column(db.Integer, db.ForeignKey('PartRequest.id'), index=True)
+    quantity = db.Column(db.Integer, nullable=False)
+    requester_email = db.Column(db.String(120))
+    status = db.Column(db.String(10), nullable=False, default='held')
+    # "held", "fulfilled", "released", "expired"
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    expires_at = db.Column(db.DateTime, nullable=False)
+    closed_at = db.Column(db.DateTime)  # when it stopped being held
+
+    part = db.relationship('Part')
+    part_request = db.relationship('PartRequest', back_populates='reservation')
+
+    def to_dict(self):
+        return {
+            'token': self.token,
+            'part_id': self.part_id,
+            'quantity': self.quantity,
+            'status': self.status,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None,
+        }
+
+
+class OutboxMessage(db.Model):
+    """An email waiting to go out with its recipient's next digest
+    (see utils/outbox.py)"""
+    __tablename__ = 'OutboxMessage'
+    # the dispatcher's query: due messages, by recipient
+    __table_args__ = (
+        db.Index('ix_OutboxMessage_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(200), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    part_request_id = db.Column(db.Integer, db.ForeignKey('PartRequest.id'), index=True)
+    status = db.Column(db.String(10), nullable=False, default='queued')
+    # "queued", "sending", "sent", "failed"
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    claimed_by = db.Column(db.String(32))  # dispatcher run sending it
+    claimed_at = db.Column(db.DateTime)
+    error = db.Column(db.String(500))
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    sent_at = db.Column(db.DateTime)
+
+    part_request = db.relationship('PartRequest', back_populates='messages')
 
 
 class Image(db.Model):
     __tablename__ = 'Image'
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     filename = db.Column(db.String(100), nullable=False)
+    original_filename = db.Column(db.String(255))  # as uploaded, for display
     description = db.Column(db.String(500))
     created_at = db.Column(db.DateTime,
-                           default=lambda: datetime.now(timezone.utc))
-    location_id = db.Column(db.Integer, db.ForeignKey('Location.id'))
-    part_id = db.Column(db.Integer, db.ForeignKey('Part.id'))
+                           default=lambda: datetime.now(timezone.utc), index=True)
+    location_id = db.Column(db.Integer, db.ForeignKey('Location.id'), index=True)
+    part_id = db.Column(db.Integer, db.ForeignKey('Part.id'), index=True)
+
+    # Filled in by the background image job after upload
+    content_hash = db.Column(db.String(64), index=True)  # sha256 of the original
+    width = db.Column(db.Integer)
+    height = db.Column(db.Integer)
+    file_size = db.Column(db.Integer)
+    taken_at = db.Column(db.DateTime)   # EXIF DateTimeOriginal, if any
+    phash = db.Column(db.String(16))  # perceptual hash, see utils/similarity.py
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc),
+                           onupdate=lambda: datetime.now(timezone.utc), index=True)
 
     # Relationship to tags
     location = db.relationship('Location', back_populates='images')
     part = db.relationship('Part', back_populates='images')
+    renditions = db.relationship('ImageRendition', back_populates='image',
+                                 cascade='all, delete-orphan')
+    jobs = db.relationship('ImageJob', back_populates='image',
+                           cascade='all, delete-orphan')
+    tags = db.relationship('Tag', secondary=image_tags, back_populates='images')
+
+    def rendition(self, kind, fmt='jpeg'):
+        """The downscaled copy of this image, or None if not generated"""
+        return next((r for r in self.renditions
+                     if r.kind == kind and r.format == fmt), None)
+
+    def static_path(self, kind=None, fmt='jpeg'):
+        """Path under /static for a rendition, falling back to the original"""
+        rendition = self.rendition(kind, fmt) if kind else None
+        if rendition:
+            return f"images/{rendition.filename}"
+        return f"images/{self.filename}"
     
     def to_dict(self):
         return {
@@ -125,17 +254,151 @@ class Image(db.Model):
         return self
 
 
+class ImageRendition(db.Model):
+    """Downscaled copies of an uploaded image (thumb, card, detail) in JPEG and WebP"""
+    __tablename__ = 'ImageRendition'
+    id = db.Column(db.Integer, primary_key=True)
+    image_id = db.Column(db.Integer, db.ForeignKey('Image.id'), nullable=False, index=True)
+    kind = db.Column(db.String(10), nullable=False)      # "thumb", "card", "detail"
+    format = db.Column(db.String(10), nullable=False)    # "jpeg", "webp"
+    filename = db.Column(db.String(150), nullable=False)  # relative to UPLOAD_FOLDER
+    width = db.Column(db.Integer)
+    height = db.Column(db.Integer)
+    size = db.Column(db.Integer)
+
+    image = db.relationship('Image', back_populates='renditions')
+
+    def to_dict(self):
+        return {
+            'url': f"/static/images/{self.filename}",
+            'width': self.width,
+            'height': self.height,
+            'size': self.size
+        }
+
+
+class ImageJob(db.Model):
+    """Queued post-upload processing for an Image (renditions, hash, metadata)"""
+    __tablename__ = 'ImageJob'
+    id = db.Column(db.Integer, primary_key=True)
+    image_id = db.Column(db.Integer, db.ForeignKey('Image.id'), nullable=False, index=True)
+    status = db.Column(db.String(10), nullable=False, default='queued', index=True)
+    # "queued", "running", "done", "failed"
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.String(500))
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    image = db.relationship('Image', back_populates='jobs')
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'image_id': self.image_id,
+            'status': self.status,
+            'attempts': self.attempts,
+            'error': self.error
+        }
+
+
+class PartListing(db.Model):
+    """One row per part with everything a gallery card shows, kept in step
+    with Part, Image, Brand etc. by utils/listing.py (a read model, so
+    never edited directly)"""
+    __tablename__ = 'PartListing'
+    __table_args__ = (
+        db.Index('ix_PartListing_created_at_id', 'created_at', 'id'),
+        db.Index('ix_PartListing_brand_id_created_at', 'brand_id', 'created_at', 'id'),
+        db.Index('ix_PartListing_part_type_id_created_at', 'part_type_id', 'created_at', 'id'),
+        db.Index('ix_PartListing_location_id_created_at', 'location_id', 'created_at', 'id'),
+    )
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # Part.id
+    name = db.Column(db.String(100), nullable=False)
+    description = db.Column(db.String(1024))
+    part_number = db.Column(db.String(30))
+    quantity = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime)
+    brand_id = db.Column(db.Integer)
+    brand_name = db.Column(db.String(50))
+    part_type_id = db.Column(db.Integer)
+    part_type_name = db.Column(db.String(50))
+    location_id = db.Column(db.Integer)
+    image_id = db.Column(db.Integer)               # first image, if any
+    image_filename = db.Column(db.String(100))
+    card_jpeg = db.Column(db.String(150))          # its card renditions
+    card_webp = db.Column(db.String(150))
+    image_count = db.Column(db.Integer, nullable=False, default=0)
+    tag_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def card_path(self, fmt='jpeg'):
+        """Path under /static for the card image, falling back to the original"""
+        rendition = self.card_webp if fmt == 'webp' else self.card_jpeg
+        return f"images/{rendition or self.image_filename}"
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'description': self.description,
+            'part_number': self.part_number,
+            'quantity': self.quantity,
+            'brand_id': self.brand_id,
+            'brand': self.brand_name,
+            'part_type_id': self.part_type_id,
+            'part_type': self.part_type_name,
+            'location_id': self.location_id,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'image_url': f"/static/{self.card_path()}" if self.image_id else None,
+            'image_count': self.image_count,
+            'tag_count': self.tag_count
+        }
+
+
+class Change(db.Model):
+    """One row per commit that changed a synced object, for the delta
+    sync API (utils/changelog.py).  seq only ever goes up."""
+    __tablename__ = 'Change'
+    __table_args__ = (
+        db.Index('ix_Change_entity_entity_id', 'entity', 'entity_id'),
+        {'sqlite_autoincrement': True},  # never reuse a compacted seq
+    )
+    seq = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(10), nullable=False)   # "part", "image", "tag"...
+    entity_id = db.Column(db.Integer, nullable=False)
+    changed_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+
 class Tag(db.Model):
     __tablename__ = 'Tag'
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     name = db.Column(db.String(100), nullable=False, unique=True)
     description = db.Column(db.String(255))
     slug = db.Column(db.String(100), nullable=False, unique=True, index=True)
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc),
+                           onupdate=lambda: datetime.now(timezone.utc), index=True)
     
     # Relationships
     parts = db.relationship('Part', secondary=part_tags, back_populates='tags')
+    images = db.relationship('Image', secondary=image_tags, back_populates='tags')
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         if not self.slug:
             self.slug = slugify(self.name)
+
+
+# Tagging an image changes what the image export says about it
+@event.listens_for(Image.tags, 'append')
+@event.listens_for(Image.tags, 'remove')
+def touch_image(image, tag, initiator):
+    image.updated_at = datetime.now(timezone.utc)
+
+
+# Likewise a part's page changes when its tags or images do
+@event.listens_for(Part.tags, 'append')
+@event.listens_for(Part.tags, 'remove')
+@event.listens_for(Part.images, 'append')
+@event.listens_for(Part.images, 'remove')
+def touch_part(part, child, initiator):
+    part.updated_at = datetime.now(timezone.utc)
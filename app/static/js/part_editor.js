@@ -8,15 +8,25 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // Detect if we're in edit mode
     const isEditMode = window.partEditMode || false;
-    const partId = window.partId || null;
+    const urls = window.partEditorUrls;   // from the template's url_for()s
     const uploadedImages = [];
     let deletedImages = window.deletedImages || [];
+    const csrfToken = form.querySelector('input[name="csrf_token"]').value;
 
     // Initialize Dropzone for file uploads
     const myDropzone = new Dropzone("#dropzone", {
-        url: "/parts/upload_images",
+        url: urls.upload,
         paramName: "files",
-        maxFilesize: 16, // MB
+        headers: { 'X-CSRFToken': csrfToken },
+        maxFilesize: 64, // MB (UPLOAD_MAX_FILE_SIZE)
+        // Big scans go up in pieces, each retried on its own if it fails
+        chunking: true,
+        chunkSize: 2 * 1024 * 1024,
+        retryChunks: true,
+        retryChunksLimit: 3,
+        chunksUploaded: function(file, done) {
+            finishChunkedUpload(file, done);
+        },
         acceptedFiles: "image/jpeg,image/png,image/gif",
         addRemoveLinks: true,
         maxFiles: 8,
@@ -55,14 +65,73 @@ document.addEventListener('DOMContentLoaded', function() {
         document.getElementById("upload-progress").style.width = progress + "%";
     });
 
+    // Uploads are stored under the chosen location's image directory
+    myDropzone.on("sending", function(file, xhr, formData) {
+        formData.append('location_id', uploadLocation());
+    });
+
+    function uploadLocation() {
+        const select = form.querySelector('[name="location_id"]');
+        return select ? select.value : '';
+    }
+
+    // All chunks are in - have the server join them into one image
+    function finishChunkedUpload(file, done) {
+        const data = new FormData();
+        data.append('filename', file.name);
+        data.append('location_id', uploadLocation());
+        data.append('total_chunks', file.upload.totalChunkCount);
+        fetch(`${urls.upload}/${file.upload.uuid}/finish`, {
+            method: 'POST',
+            headers: { 'X-CSRFToken': csrfToken },
+            body: data
+        })
+        .then(response => response.json())
+        .then(result => {
+            if (result.error) {
+                myDropzone._errorProcessing([file], result.error);
+                return;
+            }
+            file.finishedUpload = result;
+            done();
+        })
+        .catch(error => myDropzone._errorProcessing([file], error.message));
+    }
+
     // Handle successful uploads - store image ID for form submission
     myDropzone.on("success", function(file, response) {
+        response = file.finishedUpload || response;
         if (response && response.id) {
             file.imageId = response.id;
             uploadedImages.push(response.id);
         }
+        if (response && response.status_url) {
+            pollImageJob(file, response.status_url, 0);
+        }
     });
 
+    // Resizing happens in the background after upload - poll until done
+    function pollImageJob(file, statusUrl, attempt) {
+        if (attempt >= 60) return; // Give up quietly after ~2 minutes
+
+        fetch(statusUrl)
+            .then(response => response.json())
+            .then(job => {
+                if (job.status === 'done') {
+                    file.processed = true;
+                    if (job.thumbnail_url && file.previewElement) {
+                        const thumb = file.previewElement.querySelector('[data-dz-thumbnail]');
+                        if (thumb) thumb.src = job.thumbnail_url;
+                    }
+                } else if (job.status === 'failed') {
+                    myDropzone.emit("error", file, job.error || "Image processing failed");
+                } else {
+                    setTimeout(() => pollImageJob(file, statusUrl, attempt + 1), 2000);
+                }
+            })
+            .catch(error => console.error('Job status error:', error));
+    }
+
     // Handle removed files
     myDropzone.on("removedfile", function(file) {
         // If file has an imageId, it's a server-side file
@@ -103,6 +172,42 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
     
+    // Type-ahead suggestions, most used tags first (answered from the
+    // server's in-memory tag index)
+    const suggestionList = document.getElementById('tag-suggestions');
+    const suggestionCache = {};
+    let suggestTimer = null;
+    if (tagInput && suggestionList) {
+        tagInput.addEventListener('input', function() {
+            clearTimeout(suggestTimer);
+            const typed = this.value.trim().toLowerCase();
+            suggestTimer = setTimeout(() => showSuggestions(typed), 120);
+        });
+    }
+
+    function showSuggestions(typed) {
+        const render = tags => {
+            suggestionList.innerHTML = '';
+            tags.forEach(tag => {
+                const option = document.createElement('option');
+                option.value = tag.name;
+                option.label = `${tag.name} (${tag.count})`;
+                suggestionList.appendChild(option);
+            });
+        };
+        if (suggestionCache[typed]) {
+            render(suggestionCache[typed]);
+            return;
+        }
+        fetch(`${urls.suggestTags}?limit=10&q=${encodeURIComponent(typed)}`)
+            .then(response => response.json())
+            .then(tags => {
+                suggestionCache[typed] = tags;
+                render(tags);
+            })
+            .catch(error => console.error('Tag suggestion error:', error));
+    }
+
     // Function to add a tag to the UI and form
     function addTag(tagName) {
         // Limit to 8 tags
@@ -188,13 +293,8 @@ document.addEventListener('DOMContentLoaded', function() {
             formData.append('image_ids[]', id);
         });
         
-        // Determine endpoint based on mode
-        const endpoint = isEditMode 
-            ? `/parts/edit/${partId}`
-            : '/parts/add_part';
-        
-        // Submit the form
-        fetch(endpoint, {
+        // Submit the form (to add_part or edit_part, by mode)
+        fetch(urls.save, {
             method: 'POST',
             body: formData
         })
@@ -209,8 +309,6 @@ document.addEventListener('DOMContentLoaded', function() {
                 // Redirect to new part page or stay on form with message
                 if (data.redirect) {
                     window.location.href = data.redirect;
-                } else if (data.part_id) {
-                    window.location.href = `/parts/part/${data.part_id}`;
                 } else {
                     alert('Part saved successfully!');
                 }
@@ -0,0 +1,159 @@
+from flask import abort, current_app, redirect, request, send_file, url_for
+from hashlib import sha256
+from mimetypes import guess_type
+from pathlib import Path
+from threading import Lock
+import gzip
+import os
+import re
+from .storage import IMMUTABLE_MAX_AGE
+
+
+#
+# Fingerprinted, precompressed static assets (CSS, JS, icons).
+#
+# Nothing to build: on first use every file under ASSET_DIRS of the
+# static folder is hashed, and asset_url('static', filename='css/style.css')
+# - a drop-in for url_for in templates - gives /assets/css/style.<hash>.css.
+# As the name changes whenever the content does, those URLs are served
+# with a year-long immutable Cache-Control and browsers stop revalidating
+# them on every page.  Each file is also gzipped (and brotli'd, if the
+# brotli package is installed) once into ASSET_CACHE_DIR, and the
+# smallest variant the browser accepts is sent.
+#
+# The manifest is made once per process, so in debug mode (where static
+# files get edited) asset_url is plain url_for.
+#
+
+ASSET_URL = '/assets/<path:filename>'
+
+# (Content-Encoding, file suffix), best first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+# keep a compressed copy only if it saves at least this much
+MIN_SAVING = 0.1
+
+FINGERPRINT = re.compile(r'^(?P<stem>.+)\.(?P<digest>[0-9a-f]{12})(?P<suffix>\.[^./]+)$')
+
+
+class Assets:
+    def __init__(self, app=None):
+        self._lock = Lock()
+        self._manifest = None   # see _build()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ASSET_FINGERPRINTS', True)
+        app.config.setdefault('ASSET_DIRS', ('css', 'js'))
+        app.config.setdefault('ASSET_CACHE_DIR', None)  # default: instance/
+        app.extensions['assets'] = self
+        app.add_url_rule(ASSET_URL, 'asset', self.serve)
+        app.add_template_global(self.url, 'asset_url')
+
+    def url(self, endpoint, **values):
+        """url_for, except that static files with a fingerprint get their
+        cacheable /assets/ URL"""
+        if endpoint == 'static' and self._enabled():
+            entry = self.manifest().get(values.get('filename'))
+            if entry is not None:
+                values['filename'] = entry['name']
+                endpoint = 'asset'
+        return url_for(endpoint, **values)
+
+    def serve(self, filename):
+        match = FINGERPRINT.match(filename)
+        if match is None:
+            abort(404)
+        source = match['stem'] + match['suffix']
+        entry = self.manifest().get(source)
+        if entry is None:
+            abort(404)
+        if entry['digest'] != match['digest']:
+            # a page from before the file changed; not cached, unlike the rest
+            return redirect(url_for('asset', filename=entry['name']))
+
+        path, encoding = entry['path'], None
+        for name, variant in entry['variants'].items():
+            if request.accept_encodings[name]:
+                path, encoding = variant, name
+                break
+        response = send_file(path, mimetype=entry['mimetype'], etag=False,
+                             max_age=IMMUTABLE_MAX_AGE, conditional=False)
+        response.set_etag(f"{entry['digest']}-{encoding or 'identity'}")
+        response.make_conditional(request)
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        response.vary.add('Accept-Encoding')
+        if encoding:
+            response.content_encoding = encoding
+        return response
+
+    def manifest(self):
+        """{source filename: {name, digest, path, mimetype, variants}}"""
+        manifest = self._manifest
+        if manifest is None:
+            with self._lock:
+                if self._manifest is None:
+                    self._manifest = _build(current_app)
+                manifest = self._manifest
+        return manifest
+
+    def _enabled(self):
+        config = current_app.config
+        return config['ASSET_FINGERPRINTS'] and not current_app.debug
+
+
+def _build(app):
+    static = Path(app.static_folder)
+    cache_dir = Path(app.config['ASSET_CACHE_DIR'] or
+                     os.path.join(app.instance_path, 'assets'))
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    manifest = {}
+    for directory in app.config['ASSET_DIRS']:
+        for path in sorted((static / directory).rglob('*')):
+            if not path.is_file():
+                continue
+            source = path.relative_to(static).as_posix()
+            data = path.read_bytes()
+            digest = sha256(data).hexdigest()[:12]
+            stem, suffix = os.path.splitext(source)
+            manifest[source] = {
+                'name': f"{stem}.{digest}{suffix}",
+                'digest': digest,
+                'path': str(path),
+                'mimetype': guess_type(source)[0] or 'application/octet-stream',
+                'variants': _compressed(data, cache_dir / f"{digest}{suffix}"),
+            }
+    return manifest
+
+
+def _compressed(data, base):
+    """{encoding: path} of the compressed copies worth having, written
+    next to `base` unless they're already there"""
+    variants = {}
+    for encoding, suffix in ENCODINGS:
+        path = base.with_name(base.name + suffix)
+        if not path.exists():
+            compressed = _compress(encoding, data)
+            if compressed is None or len(compressed) > len(data) * (1 - MIN_SAVING):
+                continue
+            partial = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            partial.write_bytes(compressed)
+            os.replace(partial, path)  # other workers may be doing the same
+        variants[encoding] = str(path)
+    return variants
+
+
+def _compress(encoding, data):
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    try:
+        import brotli  # optional
+    except ImportError:
+        return None
+    return brotli.compress(data, quality=11)
+
+
+assets = Assets()
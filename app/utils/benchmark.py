@@ -0,0 +1,296 @@
+from datetime import datetime, timedelta, timezone
+from flask import current_app
+from hashlib import sha256
+from math import ceil
+from sqlalchemy import insert, func
+import io
+import random
+import time
+from ..models import db, Part, Brand, PartType, Location, Tag, Image, part_tags
+from . import database, facets, listing, pagination, search
+from .helpers import slugify
+from .httpcache import response_cache
+from .querycount import QueryCounter
+
+
+#
+# Benchmark harness: a synthetic catalogue generator plus a runner that
+# times the main pages and forms against it.
+#
+#   DATABASE_URL=sqlite:///bench.db flask perf seed --parts 100000
+#   DATABASE_URL=sqlite:///bench.db flask perf bench --json before.json
+#   ... change things ...
+#   DATABASE_URL=sqlite:///bench.db flask perf bench --compare before.json
+#
+# Data comes from a seeded random generator, so the same options always
+# give the same catalogue.  Requests go through the test client (no
+# network), one at a time, with the page/facet/count caches emptied
+# before each one unless asked otherwise - so the numbers are about the
+# app and its queries, not the cache hit rate.
+#
+
+SEED_BATCH = 5000
+
+VALVES = ('6V6GT', 'EL84', 'ECC83', '5Y3GT', '6K8G', '6SN7', 'EF86', '6X4',
+          'EBC33', '6J7G', 'KT66', '807', 'EZ80', '6BE6', '6BA6', '1T4')
+PART_TYPES = ('Valve', 'Capacitor', 'Resistor', 'Coil', 'Dial', 'Dial Glass',
+              'Knob', 'Speaker', 'Transformer', 'Chassis', 'Cabinet', 'Switch')
+MAKERS = ('Pacific', 'Columbus', 'Courier', 'Ultimate', 'Bell', 'Pye',
+          'Philips', 'Clipper', 'La Gloria', 'Cromwell', 'Majestic', 'Tasma',
+          'Airzone', 'Astor', 'HMV', 'Stromberg', 'Zenith', 'Kriesler',
+          'Healing', 'Radiola', 'Mullard', 'Courtenay', 'Ekco', 'Murphy')
+TAG_GROUPS = ('Coils', 'Shape', 'Capacitors', 'Era', 'Condition', 'Colour',
+              'Material', 'Band', 'Fitting', 'Voltage')
+WORDS = ('bakelite', 'octal', 'mains', 'ivory', 'walnut', 'chrome', 'brass',
+         'mica', 'paper', 'wax', 'NOS', 'tested', 'spare', 'shortwave',
+         'broadcast', 'console', 'mantel', 'portable', 'cathedral', 'tombstone')
+
+
+def seed(parts=100_000, brands=500, part_types=len(PART_TYPES), tags=2000,
+         images=300_000, locations=3, max_tags=5, seed=1, progress=None):
+    """Fill an empty database with a synthetic catalogue.
+    Returns {table: rows inserted}.
+    """
+    if db.session.scalar(db.select(func.count(Part.id))):
+        raise ValueError("The database already has parts; seed an empty one "
+                         "(point DATABASE_URL at a scratch file)")
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    counts = {}
+
+    def bulk(model_or_table, rows, label):
+        table = getattr(model_or_table, '__table__', model_or_table)
+        for start in range(0, len(rows), SEED_BATCH):
+            db.session.execute(insert(table), rows[start:start + SEED_BATCH])
+            if progress:
+                progress(label, min(start + SEED_BATCH, len(rows)), len(rows))
+        counts[label] = len(rows)
+
+    # The FTS triggers would refresh a part once per row written; build the
+    # index once at the end instead
+    search_enabled = current_app.extensions.get('part_search')
+    if search_enabled:
+        search.drop_index()
+
+    bulk(Brand, [{'id': i, 'name': name, 'alias': slugify(name)}
+                 for i, name in _names(MAKERS, brands)], 'brands')
+    bulk(PartType, [{'id': i, 'name': name, 'slug': slugify(name)}
+                    for i, name in _names(PART_TYPES, part_types)], 'part_types')
+    bulk(Location, [{'id': i, 'name': f"Library {i}",
+                     'librarian_email': f"librarian{i}@example.org"}
+                    for i in range(1, locations + 1)], 'locations')
+    tag_names = ((i, f"{TAG_GROUPS[i % len(TAG_GROUPS)]}, "
+                     f"{WORDS[(i // len(TAG_GROUPS)) % len(WORDS)]} {i}")
+                 for i in range(1, tags + 1))
+    bulk(Tag, [{'id': i, 'name': name, 'slug': slugify(name), 'updated_at': now}
+               for i, name in tag_names], 'tags')
+
+    # Parts, oldest first, spread over five years; popular brands and
+    # tags come up far more often than the long tail, as in real stock
+    start = now - timedelta(days=5 * 365)
+    step = timedelta(days=5 * 365) / max(parts, 1)
+    part_rows, link_rows = [], []
+    for i in range(1, parts + 1):
+        type_id = rng.randint(1, part_types)
+        valve = rng.choice(VALVES)
+        part_rows.append({
+            'id': i,
+            'name': f"{valve} {PART_TYPES[(type_id - 1) % len(PART_TYPES)].lower()}",
+            'description': ' '.join(rng.choices(WORDS, k=rng.randint(3, 12))),
+            'part_number': f"{valve}-{rng.randint(100, 999)}",
+            'quantity': rng.randint(0, 20),
+            'box': f"Box {rng.randint(1, 60)}{rng.choice('ABCD')}",
+            'position': rng.choice(('Top shelf', 'Bottom shelf', 'Drawer', 'Bin')),
+            'brand_id': min(brands, int(rng.paretovariate(1.2))),
+            'part_type_id': type_id,
+            'location_id': rng.randint(1, locations) if locations else None,
+            'created_at': start + step * i,
+            'updated_at': start + step * i,
+        })
+        for tag_id in {min(tags, int(rng.paretovariate(0.8)))
+                       for _ in range(rng.randint(0, max_tags))} if tags else ():
+            link_rows.append({'part_id': i, 'tag_id': tag_id})
+    bulk(Part, part_rows, 'parts')
+    bulk(part_tags, link_rows, 'part_tags')
+
+    # Images: mostly on parts (a few per part), some still unassigned
+    image_rows = []
+    for i in range(1, images + 1):
+        digest = sha256(f"{seed}:{i}".encode()).hexdigest()
+        image_rows.append({
+            'id': i,
+            'filename': f"cas/{digest[:2]}/{digest[2:4]}/{digest}.jpg",
+            'original_filename': f"IMG_{i:06d}.jpg",
+            'content_hash': digest,
+            'part_id': rng.randint(1, parts) if parts and rng.random() < 0.95 else None,
+            'width': 1600, 'height': 1200, 'file_size': rng.randint(200_000, 4_000_000),
+            'created_at': start + step * (i * parts / images) if parts else now,
+            'updated_at': now,
+        })
+    bulk(Image, image_rows, 'images')
+    if db.engine.dialect.name == 'postgresql':
+        database.reset_sequences(db.session.connection())
+    db.session.commit()
+
+    if search_enabled:
+        search.rebuild_index()
+    listing.rebuild()
+    return counts
+
+
+def _names(names, count):
+    """(1, names[0]), (2, names[1]), ... then "names[0] 2", ... - unique
+    however many are asked for
+    """
+    for i in range(1, count + 1):
+        name = names[(i - 1) % len(names)]
+        round_ = (i - 1) // len(names)
+        yield i, f"{name} {round_ + 1}" if round_ else name
+
+
+# -- running --
+
+def scenarios(rng):
+    """name -> callable(client) issuing one request, against whatever is
+    in the database now (ids, names etc. are sampled from it)
+    """
+    max_part = db.session.scalar(db.select(func.max(Part.id))) or 0
+    brand_ids = db.session.scalars(db.select(Brand.id)).all()
+    type_ids = db.session.scalars(db.select(PartType.id)).all()
+    tag_names = db.session.scalars(
+        db.select(Tag.name).join(part_tags).group_by(Tag.id)
+          .order_by(func.count().desc()).limit(50)).all()
+    if not (max_part and brand_ids and type_ids):
+        raise ValueError("Nothing to benchmark: seed the database first")
+
+    def part_id():
+        return rng.randint(1, max_part)
+
+    def gallery(**args):
+        def request(client):
+            params = {k: v() if callable(v) else v for k, v in args.items()}
+            return client.get('/gallery', query_string=params)
+        return request
+
+    def tag():
+        return rng.choice(tag_names) if tag_names else ''
+
+    return {
+        'gallery': gallery(),
+        'gallery brand': gallery(brand=lambda: rng.choice(brand_ids)),
+        'gallery type': gallery(type=lambda: rng.choice(type_ids)),
+        'gallery tag': gallery(tag=tag),
+        'gallery brand+type': gallery(brand=lambda: rng.choice(brand_ids),
+                                      type=lambda: rng.choice(type_ids)),
+        'gallery brand+tag': gallery(brand=lambda: rng.choice(brand_ids), tag=tag),
+        'gallery search': gallery(q=lambda: rng.choice(VALVES)),
+        'gallery page 50': gallery(page=50),
+        'part': lambda client: client.get(f"/part/{part_id()}"),
+        'brand': lambda client: client.get(f"/brand/{rng.choice(brand_ids)}"),
+        'all_images page': lambda client: client.get('/all_images?limit=100'),
+        'add_part': lambda client: client.post('/add_part', data=_part_form(
+            rng, brand_ids, type_ids, tag_names)),
+        'edit_part': lambda client: client.post(f"/edit/{part_id()}", data=_part_form(
+            rng, brand_ids, type_ids, tag_names)),
+        'upload_images': lambda client: client.post('/upload_images', data={
+            'files': (io.BytesIO(_jpeg(rng)), 'bench.jpg')}),
+    }
+
+
+# full export is timed separately: one run is already a lot of rows
+EXPORT_SCENARIO = 'all_images full'
+
+
+def _part_form(rng, brand_ids, type_ids, tag_names):
+    return {
+        'name': f"{rng.choice(VALVES)} valve",
+        'description': ' '.join(rng.choices(WORDS, k=8)),
+        'part_number': str(rng.randint(1000, 9999)),
+        'brand_id': str(rng.choice(brand_ids)),
+        'part_type_id': str(rng.choice(type_ids)),
+        'box': 'Box 1', 'position': 'Drawer',
+        'tags[]': rng.sample(tag_names, min(3, len(tag_names))) + [f"bench {rng.random()}"],
+    }
+
+
+def _jpeg(rng):
+    """A small, unique JPEG, so uploads aren't deduplicated away"""
+    from PIL import Image as PILImage
+    color = tuple(rng.randint(0, 255) for _ in range(3))
+    image = PILImage.new('RGB', (640, 480), color)
+    image.putpixel((rng.randint(0, 639), rng.randint(0, 479)), (255, 255, 255))
+    out = io.BytesIO()
+    image.save(out, 'JPEG', quality=85)
+    return out.getvalue()
+
+
+def run(names=None, iterations=50, warm=False, seed=1, progress=None):
+    """Time each scenario `iterations` times.  Returns
+    {name: {'n', 'p50_ms', 'p95_ms', 'max_ms', 'queries', 'rps', 'errors'}}
+    """
+    rng = random.Random(seed)
+    available = scenarios(rng)
+    names = names or list(available) + [EXPORT_SCENARIO]
+    client = current_app.test_client()
+    results = {}
+
+    for name in names:
+        if name == EXPORT_SCENARIO:
+            request, count = (lambda c: c.get('/all_images?format=ndjson')), 1
+        else:
+            request, count = available[name], iterations
+
+        timings, queries, errors = [], [], 0
+        for _ in range(count):
+            if not warm:
+                facets.invalidate()
+                pagination.invalidate()
+                response_cache.clear()
+            db.session.expunge_all()
+            with QueryCounter() as counter:
+                started = time.perf_counter()
+                response = request(client)
+                response.get_data()  # drain streamed responses
+                timings.append(time.perf_counter() - started)
+            queries.append(counter.count)
+            errors += response.status_code >= 400
+        results[name] = summarize(timings, queries, errors)
+        if progress:
+            progress(name, results[name])
+    return results
+
+
+def summarize(timings, queries, errors=0):
+    ordered = sorted(timings)
+    return {
+        'n': len(timings),
+        'p50_ms': round(_percentile(ordered, 0.50) * 1000, 2),
+        'p95_ms': round(_percentile(ordered, 0.95) * 1000, 2),
+        'max_ms': round(ordered[-1] * 1000, 2),
+        'queries': round(sum(queries) / len(queries), 1),
+        'rps': round(len(timings) / sum(timings), 1) if sum(timings) else 0.0,
+        'errors': errors,
+    }
+
+
+def _percentile(ordered, p):
+    """Nearest-rank percentile of an already sorted list"""
+    return ordered[max(0, ceil(p * len(ordered)) - 1)]
+
+
+def regressions(results, baseline, tolerance=0.2, floor_ms=2.0):
+    """[(scenario, message)] where p95 got more than `tolerance` (and
+    more than `floor_ms`, to ignore jitter on fast pages) slower, or more
+    queries are issued, than in a saved baseline run
+    """
+    found = []
+    for name, now in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        if now['p95_ms'] > max(before['p95_ms'] * (1 + tolerance),
+                               before['p95_ms'] + floor_ms):
+            found.append((name, f"p95 {before['p95_ms']} -> {now['p95_ms']} ms"))
+        if now['queries'] > before['queries']:
+            found.append((name, f"queries {before['queries']} -> {now['queries']}"))
+    return found
@@ -0,0 +1,143 @@
+from collections import OrderedDict
+from hashlib import sha1
+from pathlib import Path
+from threading import Lock
+from uuid import uuid4
+import os
+import pickle
+import time
+
+
+# Caches of views that can be narrowed to one location key their entries
+# (location id, ...), or (ALL_LOCATIONS, ...) for the whole catalogue,
+# and clear(scopes) drops only the entries under those prefixes - so a
+# change in one location leaves every other location's entries alone.
+ALL_LOCATIONS = '*'
+
+
+def location_key(location_id, *key):
+    """Cache key for a view of one location (or, for None, of all)"""
+    return (ALL_LOCATIONS if location_id is None else location_id, *key)
+
+
+def location_scopes(locations):
+    """Key prefixes to clear after changes in these locations (the
+    `locations` of an events.on_commit listener; None = everything)"""
+    if locations is None:
+        return None
+    return {ALL_LOCATIONS} | (set(locations) - {None})
+
+
+def _scope(key):
+    return key[0] if isinstance(key, tuple) and key else None
+
+
+class TTLCache:
+    """Small thread-safe LRU cache whose entries also expire after `ttl`
+    seconds.  Used for per-process caches that are cleared on commit; the
+    TTL only bounds staleness caused by writes from other processes.
+    """
+
+    def __init__(self, max_size=256, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()   # key -> (expires, value), oldest first
+        self._lock = Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is None:
+                return default
+            if hit[0] <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return hit[1]
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def get_or_set(self, key, compute, ttl=None):
+        """Cached value for key, calling compute() on a miss"""
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = compute()
+            self.set(key, value, ttl)
+        return value
+
+    def clear(self, scopes=None):
+        """Drop every entry, or only those whose key starts with one of
+        `scopes`"""
+        with self._lock:
+            if scopes is None:
+                self._data.clear()
+                return
+            for key in [k for k in self._data if _scope(k) in scopes]:
+                del self._data[key]
+
+    def __len__(self):
+        return len(self._data)
+
+
+class FileCache:
+    """TTLCache-compatible cache kept as pickle files in a directory, so
+    several worker processes share entries (and invalidation).
+    """
+
+    def __init__(self, directory, ttl=60):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+
+    def _path(self, key):
+        # named <scope hash>-<key hash>, for clear(scopes)
+        return self.directory / f"{_digest(_scope(key))[:8]}-{_digest(key)}.cache"
+
+    def get(self, key, default=None):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                expires, value = pickle.load(f)
+        except (OSError, EOFError, pickle.PickleError):
+            return default
+        if expires <= time.time():
+            path.unlink(missing_ok=True)
+            return default
+        return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.time() + (self.ttl if ttl is None else ttl)
+        # write then rename, so readers never see half a file
+        tmp = self.directory / f".{uuid4().hex}.tmp"
+        with open(tmp, 'wb') as f:
+            pickle.dump((expires, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self._path(key))
+
+    def get_or_set(self, key, compute, ttl=None):
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = compute()
+            self.set(key, value, ttl)
+        return value
+
+    def clear(self, scopes=None):
+        patterns = ['*.cache'] if scopes is None else \
+            [f"{_digest(scope)[:8]}-*.cache" for scope in scopes]
+        for pattern in patterns:
+            for path in self.directory.glob(pattern):
+                path.unlink(missing_ok=True)
+
+    def __len__(self):
+        return sum(1 for _ in self.directory.glob('*.cache'))
+
+
+def _digest(value):
+    return sha1(repr(value).encode()).hexdigest()
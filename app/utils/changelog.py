@@ -0,0 +1,177 @@
+from datetime import datetime, timedelta, timezone
+from flask import current_app
+from sqlalchemy import delete, event, func, insert, literal, select
+from sqlalchemy.orm import Session
+from ..models import db, Part, Image, ImageRendition, Tag, Brand, PartType, \
+                     Location, Change, part_tags, image_tags
+
+
+#
+# The change log behind delta sync (/api/v1/sync, blueprints/api.py).
+#
+# Every flush that writes a synced object - a part, image, tag, brand,
+# type or location - appends a Change row naming it, in the same
+# transaction, so a change is logged exactly when it is committed.  A
+# client remembers the highest seq it has seen and later asks only for
+# what changed after it; each object comes back once, in its current
+# state (or as a deletion), however often it changed in between.
+#
+# A client must never be handed a seq past a row that isn't committed
+# yet, or it would skip that row for good.  SQLite has a single writer,
+# so rows are committed in seq order and that can't happen.  Concurrent
+# writers (PostgreSQL) take seqs in one order and may commit in another,
+# so there changes_since() holds back everything from the first row
+# logged in the last CHANGELOG_SETTLE_SECONDS: any row still in flight
+# was logged within that window, as was everything after it.  A
+# transaction open longer than that after writing can still be skipped.
+#
+# Core writes bypass the session, so (as with listing.refresh) they call
+# record() themselves: the importer, reservations and the tag resolver do.
+# `flask parts compact-changes` drops rows superseded by a later one for
+# the same object, which a client at any seq no longer needs.
+#
+
+# synced objects, parents first, so a first sync can be applied in order
+ENTITIES = {
+    'locations': Location,
+    'brands': Brand,
+    'part_types': PartType,
+    'tags': Tag,
+    'parts': Part,
+    'images': Image,
+}
+ENTITY_OF = {model: entity for entity, model in ENTITIES.items()}
+
+CHANGES = Change.__table__
+
+
+def init_app(app):
+    """Log every existing object once for a database that has parts but
+    no change log yet, so a client syncing from 0 gets the lot"""
+    app.config.setdefault('CHANGELOG_SETTLE_SECONDS', 60)  # not on SQLite
+    with app.app_context():
+        has_parts = db.session.scalar(select(Part.id).limit(1))
+        if has_parts and not db.session.scalar(select(Change.seq).limit(1)):
+            with db.engine.begin() as conn:
+                now = datetime.now(timezone.utc)
+                for entity, model in ENTITIES.items():
+                    conn.execute(insert(CHANGES).from_select(
+                        ['entity', 'entity_id', 'changed_at'],
+                        select(literal(entity), model.id, literal(now))
+                        .order_by(model.id)))
+            app.logger.info(f"Started the change log at seq {head()}")
+
+
+def record(entity, ids, conn=None):
+    """Log a change to these objects.  Runs in the session's transaction
+    by default."""
+    conn = conn if conn is not None else db.session.connection()
+    now = datetime.now(timezone.utc)
+    rows = [{'entity': entity, 'entity_id': id_, 'changed_at': now}
+            for id_ in sorted({i for i in ids if i is not None})]
+    if rows:
+        conn.execute(insert(CHANGES), rows)
+    return len(rows)
+
+
+def head():
+    """The latest seq (0 before anything was logged)"""
+    return db.session.scalar(select(func.max(Change.seq))) or 0
+
+
+def changes_since(since, limit):
+    """[(entity, id, seq)] of objects changed after `since`, each once at
+    its latest seq, oldest first.  Only settled rows (see settled_below)."""
+    latest = func.max(Change.seq)
+    query = select(Change.entity, Change.entity_id, latest) \
+        .where(Change.seq > since)
+    horizon = settled_below(since)
+    if horizon is not None:
+        query = query.having(latest < horizon)
+    return db.session.execute(
+        query.group_by(Change.entity, Change.entity_id)
+        .order_by(latest)
+        .limit(limit)
+    ).all()
+
+
+def concurrent_writers():
+    """Whether transactions can commit out of seq order (not SQLite)"""
+    return db.engine.dialect.name != 'sqlite'
+
+
+def settled_below(since=0):
+    """The first seq after `since` that rows still in flight might come
+    before, or None if every committed row is safe to hand out (SQLite,
+    or nothing logged recently)"""
+    if not concurrent_writers():
+        return None
+    window = timedelta(seconds=current_app.config['CHANGELOG_SETTLE_SECONDS'])
+    return db.session.scalar(
+        select(func.min(Change.seq))
+        .where(Change.seq > since,
+               Change.changed_at > datetime.now(timezone.utc) - window))
+
+
+def compact():
+    """Delete every row a later one for the same object supersedes.
+    Returns how many went."""
+    latest = select(func.max(Change.seq)).group_by(Change.entity, Change.entity_id)
+    with db.engine.begin() as conn:
+        return conn.execute(delete(CHANGES).where(CHANGES.c.seq.not_in(latest))).rowcount
+
+
+# -- logging session writes --
+
+def _pending(session):
+    return session.info.setdefault('changelog', set())
+
+
+@event.listens_for(Session, 'before_flush')
+def _note_deleted_tags(session, flush_context, instances):
+    # A deleted tag drops out of its parts' and images' tag_ids, but their
+    # part_tags / image_tags rows are gone by the time after_flush runs
+    tag_ids = [obj.id for obj in session.deleted
+               if isinstance(obj, Tag) and obj.id is not None]
+    if not tag_ids:
+        return
+    pending = _pending(session)
+    with session.no_autoflush:
+        for entity, column, table in (('parts', 'part_id', part_tags),
+                                      ('images', 'image_id', image_tags)):
+            pending.update((entity, id_) for id_ in session.scalars(
+                select(table.c[column]).where(table.c.tag_id.in_(tag_ids))))
+
+
+@event.listens_for(Session, 'after_flush')
+def _note_changes(session, flush_context):
+    pending = _pending(session)
+    for obj in session.new | session.deleted:
+        _note(pending, obj)
+    for obj in session.dirty:
+        if session.is_modified(obj):
+            _note(pending, obj)
+
+
+def _note(pending, obj):
+    if isinstance(obj, ImageRendition):
+        pending.add(('images', obj.image_id))
+    elif type(obj) in ENTITY_OF:
+        pending.add((ENTITY_OF[type(obj)], obj.id))
+
+
+@event.listens_for(Session, 'after_flush_postexec')
+def _write_changes(session, flush_context):
+    pending = session.info.pop('changelog', None)
+    if not pending:
+        return
+    conn = session.connection()
+    for entity in ENTITIES:
+        ids = [id_ for kind, id_ in pending if kind == entity]
+        if ids:
+            record(entity, ids, conn)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard(session):
+    session.info.pop('changelog', None)
@@ -0,0 +1,128 @@
+from sqlalchemy import event, inspect, insert, select, text
+from sqlalchemy.engine import make_url
+import os
+from ..models import db
+
+
+#
+# Database connection settings.
+#
+# DATABASE_URL picks the backend (PostgreSQL for anything with several
+# workers writing at once; SQLite is fine for one).  Pool settings come
+# from config so they can be sized to the worker count, and SQLite
+# connections are switched to WAL, so readers no longer block behind a
+# writer, with a busy timeout instead of failing straight away on a
+# locked database.
+#
+
+DEFAULT_URI = 'sqlite:///nzvintageradioparts.db'
+
+# SQLite pragmas applied to every new connection
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',      # readers don't wait for writers
+    'synchronous': 'NORMAL',    # safe with WAL, far fewer fsyncs
+    'busy_timeout': None,       # from SQLITE_BUSY_TIMEOUT (ms)
+}
+
+
+def database_uri():
+    """DATABASE_URL from the environment, normalised for SQLAlchemy"""
+    uri = os.environ.get('DATABASE_URL', DEFAULT_URI)
+    if uri.startswith('postgres://'):  # as handed out by some hosts
+        uri = 'postgresql://' + uri[len('postgres://'):]
+    return uri
+
+
+def configure(app):
+    """Fill in SQLALCHEMY_ENGINE_OPTIONS from the DB_* settings.
+    Call before db.init_app(), with SQLALCHEMY_DATABASE_URI already set.
+    """
+    app.config.setdefault('DB_POOL_SIZE', 5)
+    app.config.setdefault('DB_MAX_OVERFLOW', 10)
+    app.config.setdefault('DB_POOL_TIMEOUT', 30)
+    app.config.setdefault('DB_POOL_RECYCLE', 1800)  # seconds; under server idle timeouts
+    app.config.setdefault('DB_POOL_PRE_PING', True)
+    app.config.setdefault('SQLITE_BUSY_TIMEOUT', 5000)
+
+    options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    options.setdefault('pool_pre_ping', app.config['DB_POOL_PRE_PING'])
+    if url.get_backend_name() != 'sqlite' or url.database not in (None, '', ':memory:'):
+        options.setdefault('pool_size', app.config['DB_POOL_SIZE'])
+        options.setdefault('max_overflow', app.config['DB_MAX_OVERFLOW'])
+        options.setdefault('pool_timeout', app.config['DB_POOL_TIMEOUT'])
+        options.setdefault('pool_recycle', app.config['DB_POOL_RECYCLE'])
+
+
+def init_app(app):
+    """Hook the SQLite pragmas onto the engine.  Call after db.init_app()."""
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        return
+
+    pragmas = dict(SQLITE_PRAGMAS, busy_timeout=app.config['SQLITE_BUSY_TIMEOUT'])
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
+
+def copy_database(target_uri, batch_size=1000, progress=None):
+    """Copy every table of the current database into `target_uri`
+    (e.g. SQLite -> PostgreSQL).  Tables are created there if missing and
+    must be empty.  Returns {table name: rows copied}.
+    """
+    from sqlalchemy import create_engine
+
+    source = db.engine
+    target = create_engine(target_uri)
+    db.metadata.create_all(target)
+
+    copied = {}
+    with source.connect() as src, target.begin() as dst:
+        for table in db.metadata.sorted_tables:  # parents before children
+            if dst.execute(select(table).limit(1)).first():
+                raise ValueError(f"Table {table.name} in the target isn't empty")
+            copied[table.name] = 0
+            result = src.execution_options(yield_per=batch_size).execute(select(table))
+            for rows in result.mappings().partitions():
+                dst.execute(insert(table), [dict(row) for row in rows])
+                copied[table.name] += len(rows)
+                if progress:
+                    progress(table.name, copied[table.name])
+
+        if target.dialect.name == 'postgresql':
+            reset_sequences(dst)
+    target.dispose()
+    return copied
+
+
+def reset_sequences(conn):
+    """Move PostgreSQL id sequences past ids that were inserted explicitly"""
+    for table in db.metadata.sorted_tables:
+        key = list(table.primary_key.columns)
+        if len(key) == 1 and isinstance(key[0].type, db.Integer):
+            column = key[0]
+            conn.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('\"{table.name}\"', '{column.name}'), "
+                f"coalesce(max(\"{column.name}\"), 0) + 1, false) FROM \"{table.name}\""))
+
+
+def describe():
+    """Backend, pool and (for SQLite) pragma settings in effect"""
+    engine = db.engine
+    info = {
+        'url': engine.url.render_as_string(hide_password=True),
+        'dialect': engine.dialect.name,
+        'pool': engine.pool.status(),
+        'tables': len(inspect(engine).get_table_names()),
+    }
+    if engine.dialect.name == 'sqlite':
+        with engine.connect() as conn:
+            for name in SQLITE_PRAGMAS:
+                info[name] = conn.execute(text(f"PRAGMA {name}")).scalar()
+    return info
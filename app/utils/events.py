@@ -0,0 +1,100 @@
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+
+#
+# "Something changed" notifications for in-process caches.
+#
+# Every flush records which tables it wrote to (including association
+# tables like part_tags and bulk UPDATE/DELETE statements); when the
+# transaction commits, listeners interested in any of those tables are
+# called with the set of changed table names.  Nothing fires on rollback.
+#
+# Caches partitioned by location can ask for the locations too: a part
+# written through the session says which one it was in (before and
+# after), so only those need clearing.  Anything else - a brand or tag,
+# an image (whose card shows in its part's location, not necessarily its
+# own), a bulk statement - may show up in any location.
+#
+
+# tables whose rows' location_id is the location they show up in
+PARTITIONED_TABLES = {'Part'}
+
+_listeners = []
+
+
+def on_commit(*tables, by_location=False):
+    """Decorator: call fn(changed_tables) after a commit touching `tables`.
+    With by_location, fn(changed_tables, locations): the ids of the
+    locations changed, or None if the changes could be in any.
+    """
+    def decorator(fn):
+        _listeners.append((set(tables), by_location, fn))
+        return fn
+    return decorator
+
+
+def _changed(session):
+    return session.info.setdefault('changed_tables', set())
+
+
+def _unscoped(session):
+    """Changed tables whose changes' locations aren't known"""
+    return session.info.setdefault('unscoped_tables', set())
+
+
+@event.listens_for(Session, 'after_flush')
+def _record_flush(session, flush_context):
+    changed = _changed(session)
+    unscoped = _unscoped(session)
+    locations = session.info.setdefault('changed_locations', set())
+    for obj in session.new | session.dirty | session.deleted:
+        state = inspect(obj)
+        table = state.mapper.local_table.name
+        changed.add(table)
+        located = table in PARTITIONED_TABLES and \
+            state.attrs.location_id.history.sum()
+        if located:
+            locations.update(located)
+        else:
+            unscoped.add(table)
+        # many-to-many edits only show up as a change to the collection
+        for rel in state.mapper.relationships:
+            if rel.secondary is not None and (
+                    obj in session.deleted or
+                    state.attrs[rel.key].history.has_changes()):
+                changed.add(rel.secondary.name)
+                if not located:
+                    unscoped.add(rel.secondary.name)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _record_bulk(orm_execute_state):
+    if orm_execute_state.is_update or orm_execute_state.is_delete or \
+            orm_execute_state.is_insert:
+        table = getattr(orm_execute_state.statement, 'table', None)
+        if table is not None:
+            _changed(orm_execute_state.session).add(table.name)
+            _unscoped(orm_execute_state.session).add(table.name)
+
+
+@event.listens_for(Session, 'after_commit')
+def _notify(session):
+    changed = session.info.pop('changed_tables', None)
+    unscoped = session.info.pop('unscoped_tables', set())
+    locations = session.info.pop('changed_locations', set())
+    if not changed:
+        return
+    for tables, by_location, fn in _listeners:
+        if not tables & changed:
+            continue
+        if by_location:
+            fn(changed, None if tables & unscoped else locations)
+        else:
+            fn(changed)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard(session):
+    for key in ('changed_tables', 'unscoped_tables', 'changed_locations'):
+        session.info.pop(key, None)
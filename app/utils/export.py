@@ -0,0 +1,54 @@
+from flask import current_app
+from hashlib import sha1
+from sqlalchemy import func
+from ..models import db, Image, Tag, image_tags
+
+
+#
+# Streaming JSON output for large result sets.  Rows are fetched in
+# yield_per batches and written out a batch at a time, so memory stays
+# flat and the first byte goes out before the last row is read.
+#
+
+BATCH_SIZE = 500
+
+
+def stream_json_array(query, serialize, batch_size=BATCH_SIZE):
+    """Generate a JSON array of serialize(row) for every row of a select"""
+    dumps = current_app.json.dumps
+    yield '['
+    first = True
+    for batch in _batches(query, batch_size):
+        chunk = ','.join(dumps(serialize(row)) for row in batch)
+        yield chunk if first else ',' + chunk
+        first = False
+    yield ']'
+
+
+def stream_ndjson(query, serialize, batch_size=BATCH_SIZE):
+    """Generate newline-delimited JSON, one serialize(row) per line"""
+    dumps = current_app.json.dumps
+    for batch in _batches(query, batch_size):
+        yield ''.join(dumps(serialize(row)) + '\n' for row in batch)
+
+
+def _batches(query, batch_size):
+    result = db.session.execute(query.execution_options(yield_per=batch_size))
+    for partition in result.scalars().partitions():
+        yield partition
+
+
+def image_catalogue_etag(*variant):
+    """ETag for the image export, changing whenever any image or tag does.
+    Built from aggregates the database answers from indexes, so checking
+    freshness is one cheap query rather than re-serialising everything.
+    """
+    state = db.session.execute(db.select(
+        db.select(func.count(Image.id)).scalar_subquery(),
+        db.select(func.max(Image.id)).scalar_subquery(),
+        db.select(func.max(Image.updated_at)).scalar_subquery(),
+        db.select(func.count()).select_from(image_tags).scalar_subquery(),
+        db.select(func.max(Tag.updated_at)).scalar_subquery(),
+    )).one()
+    raw = ':'.join(str(value) for value in (*state, *variant))
+    return sha1(raw.encode()).hexdigest()
@@ -0,0 +1,118 @@
+from flask import current_app
+from sqlalchemy import func, literal, union_all
+from ..models import db, Part, Brand, PartType, Tag, Location, part_tags
+from . import events, search
+from .cache import TTLCache, location_key, location_scopes
+from .helpers import slugify
+
+
+#
+# Gallery sidebar facets: how many parts each location, brand, type and
+# tag would give you from where you are now.  Counts for all four come
+# from one UNION ALL query and are cached per filter combination until a
+# write to the underlying tables (or FACET_CACHE_TTL, for other worker
+# processes).  A location's counts are cached under that location, so
+# edits elsewhere don't clear them.
+#
+
+FACET_TABLES = ('Part', 'Brand', 'PartType', 'Tag', 'part_tags', 'Location')
+
+_cache = TTLCache(max_size=256)
+
+
+def apply_filters(query, filters, skip=None, model=Part):
+    """Narrow a Part (or PartListing) query or select by the gallery
+    filters.  `skip` names one filter to leave out, for that facet's own
+    counts.
+    """
+    if filters.get('location') and skip != 'location':
+        query = query.filter(model.location_id == filters['location'])
+
+    if filters.get('brand') and skip != 'brand':
+        query = query.filter(model.brand_id == filters['brand'])
+
+    if filters.get('type') and skip != 'type':
+        query = query.filter(model.part_type_id == filters['type'])
+
+    if filters.get('tags') and skip != 'tags':
+        tagged = db.select(part_tags.c.part_id).join(Tag).where(
+            Tag.name.in_(filters['tags']))
+        query = query.filter(model.id.in_(tagged))
+
+    if filters.get('q'):
+        query = search.apply_search(query, filters['q'], model)
+
+    return query
+
+
+def facet_counts(filters):
+    """{'locations': {id: n}, 'brands': {id: n}, 'types': {id: n},
+    'tags': {id: n}} for the filters.  Location, brand and type counts
+    ignore their own filter, since picking another brand replaces the
+    current one; tag counts are within the results.
+    """
+    key = location_key(filters.get('location'), 'counts', filters.get('brand'),
+                       filters.get('type'), tuple(sorted(filters.get('tags') or ())),
+                       filters.get('q') or '')
+    return _cached(key, lambda: _query_counts(filters))
+
+
+def _query_counts(filters):
+    base = db.select(Part.id, Part.location_id, Part.brand_id, Part.part_type_id)
+    by_location = apply_filters(base, filters, skip='location').order_by(None).subquery()
+    by_brand = apply_filters(base, filters, skip='brand').order_by(None).subquery()
+    by_type = apply_filters(base, filters, skip='type').order_by(None).subquery()
+    matched = apply_filters(base, filters).order_by(None).subquery()
+
+    rows = db.session.execute(union_all(
+        db.select(literal('locations'), by_location.c.location_id, func.count())
+          .group_by(by_location.c.location_id),
+        db.select(literal('brands'), by_brand.c.brand_id, func.count())
+          .group_by(by_brand.c.brand_id),
+        db.select(literal('types'), by_type.c.part_type_id, func.count())
+          .group_by(by_type.c.part_type_id),
+        db.select(literal('tags'), part_tags.c.tag_id, func.count())
+          .select_from(matched.join(part_tags, part_tags.c.part_id == matched.c.id))
+          .group_by(part_tags.c.tag_id)
+    )).all()
+
+    counts = {'locations': {}, 'brands': {}, 'types': {}, 'tags': {}}
+    for facet, value_id, count in rows:
+        if value_id is not None:
+            counts[facet][value_id] = count
+    return counts
+
+
+def facet_options():
+    """Every location, brand, type and tag (as plain dicts) for the
+    sidebar lists"""
+    return _cached(location_key(None, 'options'), _query_options)
+
+
+def _query_options():
+    # all four lists in one query
+    options = union_all(*(
+        db.select(literal(facet).label('facet'), model.id, model.name, slug)
+        for facet, model, slug in (('locations', Location, literal(None)),
+                                   ('brands', Brand, literal(None)),
+                                   ('types', PartType, literal(None)),
+                                   ('tags', Tag, Tag.slug))
+    )).subquery()
+    result = {'locations': [], 'brands': [], 'types': [], 'tags': []}
+    for facet, id_, name, slug in db.session.execute(
+            db.select(options).order_by(options.c.facet, options.c.name)):
+        option = {'id': id_, 'name': name}
+        if facet == 'tags':
+            option['slug'] = slug or slugify(name)
+        result[facet].append(option)
+    return result
+
+
+def _cached(key, compute):
+    return _cache.get_or_set(key, compute,
+                             ttl=current_app.config.get('FACET_CACHE_TTL', 60))
+
+
+@events.on_commit(*FACET_TABLES, by_location=True)
+def invalidate(changed_tables=None, locations=None):
+    _cache.clear(location_scopes(locations))
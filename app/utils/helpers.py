@@ -1,5 +1,14 @@
 from flask import current_app
+from hashlib import sha1
 from pathlib import Path
+from werkzeug.utils import secure_filename
+
+
+def slugify(text, **kwargs):
+    """python-slugify's slugify, imported on first use (it and its
+    transliteration tables are a noticeable share of startup)"""
+    from slugify import slugify as _slugify  # Requires python-slugify package
+    return _slugify(text, **kwargs)
 
 
 def validate_tags(tag_list, max_length=100, max_tags=8):
@@ -18,9 +27,9 @@ def validate_tags(tag_list, max_length=100, max_tags=8):
 
 def secure_filename_custom(filename):
     """Enhanced secure filename for vintage parts"""
-    from werkzeug.utils import secure_filename
     base = secure_filename(filename)
-    return f"{Path(base).stem[:50]}_{hash(filename)[:5]}{Path(base).suffix}"
+    digest = sha1(filename.encode()).hexdigest()[:5]  # stable across processes
+    return f"{Path(base).stem[:50]}_{digest}{Path(base).suffix}"
 
 
 def log_error(context, error):
@@ -0,0 +1,131 @@
+from flask import current_app, request
+from functools import wraps
+from hashlib import sha1
+from sqlalchemy import func
+from ..models import db, Part, Image, Tag, part_tags
+from . import events
+from .cache import TTLCache, FileCache, location_key, location_scopes
+
+
+#
+# Whole-response cache for the read-mostly HTML pages (gallery, part,
+# brand).  A hit is served straight from memory (or the shared cache
+# directory) without touching the database or Jinja, with ETag and
+# Last-Modified so browsers can revalidate for the price of a 304.
+# A commit that writes catalogue tables empties it - or, when it only
+# changed parts in known locations, just the pages for those locations
+# and for the whole catalogue (see cache.location_key).
+#
+
+CATALOGUE_TABLES = ('Part', 'Image', 'ImageRendition', 'Tag', 'part_tags',
+                    'image_tags', 'Brand', 'PartType', 'Location')
+
+
+class ResponseCache:
+    def __init__(self, app=None):
+        self.store = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RESPONSE_CACHE', 'memory')  # or 'filesystem', None
+        app.config.setdefault('RESPONSE_CACHE_TTL', 300)
+        app.config.setdefault('RESPONSE_CACHE_SIZE', 512)
+        app.config.setdefault('RESPONSE_CACHE_DIR', None)  # default: instance/
+
+        backend = app.config['RESPONSE_CACHE']
+        ttl = app.config['RESPONSE_CACHE_TTL']
+        if backend == 'filesystem':
+            directory = app.config['RESPONSE_CACHE_DIR'] or \
+                f"{app.instance_path}/response_cache"
+            self.store = FileCache(directory, ttl=ttl)
+        elif backend:
+            self.store = TTLCache(max_size=app.config['RESPONSE_CACHE_SIZE'], ttl=ttl)
+        app.extensions['response_cache'] = self
+
+    def cached(self, last_modified=None):
+        """Decorator for GET views.  `last_modified(**view_args)` returns
+        the newest change time of what the page shows.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if self.store is None or request.method != 'GET':
+                    return view(*args, **kwargs)
+
+                key = cache_key()
+                entry = self.store.get(key)
+                if entry is None:
+                    response = current_app.make_response(view(*args, **kwargs))
+                    if response.status_code != 200 or response.is_streamed:
+                        return response
+                    entry = {
+                        'body': response.get_data(),
+                        'mimetype': response.mimetype,
+                        'etag': sha1(response.get_data()).hexdigest(),
+                        'last_modified': last_modified(**kwargs) if last_modified else None
+                    }
+                    self.store.set(key, entry)
+                    state = 'MISS'
+                else:
+                    state = 'HIT'
+
+                response = current_app.response_class(entry['body'],
+                                                      mimetype=entry['mimetype'])
+                response.set_etag(entry['etag'])
+                if entry['last_modified']:
+                    response.last_modified = entry['last_modified']
+                response.cache_control.no_cache = True  # always revalidate
+                response.headers['X-Cache'] = state
+                return response.make_conditional(request)
+            return wrapper
+        return decorator
+
+    def clear(self, scopes=None):
+        if self.store is not None:
+            self.store.clear(scopes)
+
+
+def cache_key():
+    """Location shown (?location=) + endpoint + URL arguments + query
+    string, order-independent"""
+    return location_key(request.args.get('location', type=int),
+                        request.endpoint,
+                        tuple(sorted(request.view_args.items())),
+                        tuple(sorted(request.args.items(multi=True))))
+
+
+def catalogue_last_modified(**view_args):
+    """Newest change anywhere in the catalogue"""
+    return _newest(
+        db.select(func.max(Part.updated_at)).scalar_subquery(),
+        db.select(func.max(Part.created_at)).scalar_subquery(),
+        db.select(func.max(Image.updated_at)).scalar_subquery(),
+        db.select(func.max(Image.created_at)).scalar_subquery(),
+        db.select(func.max(Tag.updated_at)).scalar_subquery(),
+    )
+
+
+def part_last_modified(part_id, **view_args):
+    """Newest change to a part, its images or its tags"""
+    return _newest(
+        db.select(func.coalesce(Part.updated_at, Part.created_at))
+          .where(Part.id == part_id).scalar_subquery(),
+        db.select(func.max(Image.updated_at))
+          .where(Image.part_id == part_id).scalar_subquery(),
+        db.select(func.max(Tag.updated_at)).join(part_tags)
+          .where(part_tags.c.part_id == part_id).scalar_subquery(),
+    )
+
+
+def _newest(*subqueries):
+    values = [v for v in db.session.execute(db.select(*subqueries)).one() if v]
+    return max(values) if values else None
+
+
+response_cache = ResponseCache()
+
+
+@events.on_commit(*CATALOGUE_TABLES, by_location=True)
+def invalidate(changed_tables=None, locations=None):
+    response_cache.clear(location_scopes(locations))
@@ -0,0 +1,165 @@
+from flask import current_app
+from datetime import datetime
+from pathlib import Path
+import hashlib
+from ..models import ImageRendition
+from . import similarity, storage
+
+
+#
+# Downscaled renditions of uploaded images.  Originals straight off a
+# camera run to several MB, so pages use these instead.  They're written
+# to renditions/ beside the original's location directory (see
+# utils/storage.py).
+#
+# Pillow (a dependency) is imported on first use rather than with this
+# module, so processes that never touch an image don't load it.
+#
+
+RENDITION_DIR = 'renditions'
+
+# kind -> longest edge in pixels (never upscaled)
+RENDITION_SIZES = {
+    'thumb': 200,
+    'card': 600,
+    'detail': 1600,
+}
+
+# format -> (file extension, Pillow save options)
+RENDITION_FORMATS = {
+    'jpeg': ('jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'webp': ('webp', {'quality': 80, 'method': 4}),
+}
+
+# EXIF tag ids
+EXIF_IFD = 0x8769
+DATETIME = 0x0132
+DATETIME_ORIGINAL = 0x9003
+
+
+def generate_renditions(image):
+    """Create every rendition for an Image and attach the rows to it.
+    Any existing renditions are replaced.  Caller commits.
+    """
+    with _open(_original_path(image)) as original:
+        return _write_renditions(image, _upright(original))
+
+
+def process_image(image):
+    """Everything done to a fresh upload: hashes, metadata and renditions.
+    Runs off the request path in the image job queue.  Caller commits.
+    """
+    path = _original_path(image)
+    if not image.content_hash:  # uploads are hashed on the way in
+        image.content_hash = file_hash(path)
+    image.file_size = path.stat().st_size
+
+    with _open(path) as original:
+        image.taken_at = _taken_at(original)
+        original = _upright(original)
+        image.width, image.height = original.size
+        image.phash = similarity.perceptual_hash(original)
+        _write_renditions(image, original)
+
+    return image
+
+
+def fingerprint(image):
+    """Fill in image.phash from the original.  Caller commits."""
+    with _open(_original_path(image)) as original:
+        image.phash = similarity.perceptual_hash(_upright(original))
+    return image.phash
+
+
+def photo_hash(stream):
+    """Perceptual hash of an image file that isn't stored (a photo to
+    search with)"""
+    with _open(stream) as original:
+        return similarity.perceptual_hash(_upright(original))
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    """sha256 hex digest of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _original_path(image):
+    return Path(current_app.config['UPLOAD_FOLDER']) / image.filename
+
+
+def _open(path):
+    from PIL import Image as PILImage  # Requires Pillow package
+    return PILImage.open(path)
+
+
+def _upright(original):
+    from PIL import ImageOps
+    # Camera JPEGs are often stored sideways with an EXIF rotation flag
+    original = ImageOps.exif_transpose(original)
+    if original.mode not in ('RGB', 'L'):
+        original = original.convert('RGB')
+    return original
+
+
+def _taken_at(original):
+    """EXIF DateTimeOriginal (falling back to DateTime), or None"""
+    exif = original.getexif()
+    value = exif.get_ifd(EXIF_IFD).get(DATETIME_ORIGINAL) or exif.get(DATETIME)
+    try:
+        return datetime.strptime(value, '%Y:%m:%d %H:%M:%S') if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _write_renditions(image, original):
+    from PIL import Image as PILImage
+    upload_dir = Path(current_app.config['UPLOAD_FOLDER'])
+    rendition_dir = rendition_dir_for(image.filename)
+    (upload_dir / rendition_dir).mkdir(parents=True, exist_ok=True)
+
+    remove_rendition_files(image)
+    image.renditions = []
+
+    stem = Path(image.filename).stem
+    for kind, max_edge in RENDITION_SIZES.items():
+        resized = original.copy()
+        resized.thumbnail((max_edge, max_edge), PILImage.LANCZOS)
+
+        for fmt, (ext, options) in RENDITION_FORMATS.items():
+            filename = f"{rendition_dir}/{stem}_{kind}.{ext}"
+            save_path = upload_dir / filename
+            resized.save(save_path, format=fmt.upper(), **options)
+            image.renditions.append(ImageRendition(
+                kind=kind,
+                format=fmt,
+                filename=filename,
+                width=resized.width,
+                height=resized.height,
+                size=save_path.stat().st_size
+            ))
+
+    return image.renditions
+
+
+def rendition_dir_for(filename):
+    """Where the renditions of an original stored at `filename` go"""
+    return f"{storage.location_dir(storage.location_of(filename))}{RENDITION_DIR}"
+
+
+def remove_rendition_files(image):
+    """Delete rendition files from disk (rows go with the Image cascade)"""
+    upload_dir = Path(current_app.config['UPLOAD_FOLDER'])
+    for rendition in image.renditions:
+        (upload_dir / rendition.filename).unlink(missing_ok=True)
+
+
+def renditions_dict(image):
+    """Rendition URLs for JSON responses, keyed by kind then format"""
+    result = {}
+    for rendition in image.renditions:
+        result.setdefault(rendition.kind, {})[rendition.format] = rendition.to_dict()
+    return result
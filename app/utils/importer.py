@@ -0,0 +1,290 @@
+from itertools import islice
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+import csv
+import io
+import json
+import time
+from ..models import db, Part, Brand, PartType, Location, Tag, part_tags
+from . import changelog, helpers, listing
+from .helpers import slugify
+
+
+#
+# Bulk import of parts from CSV / JSON / NDJSON, e.g. when a donated
+# collection is inventoried in a spreadsheet.
+#
+# Rows are read lazily and written in batches: brands, types, locations
+# and tags are resolved against name -> id maps loaded once up front (new
+# ones are bulk-inserted per batch), then the batch's parts and their
+# part_tags rows go in as two executemany INSERTs, and their listing rows
+# as one INSERT ... SELECT; every new row is logged for delta sync
+# (utils/changelog.py) with one more.  Nothing is loaded through the ORM
+# one row at a time.
+#
+# A row the database refuses (a constraint, a lock timeout), or input
+# that stops parsing part way, ends the import with ImportFailed: the
+# batch is rolled back, earlier batches stay committed, and the error
+# names the rows that didn't make it.
+#
+# Columns (CSV header or JSON keys):
+#     name, brand, part_type (or type)  - required
+#     description, part_number, quantity, box, position, location
+#     tags  - a list in JSON; separated by ';' in CSV (tag names can
+#             contain commas, e.g. "Coils, Oscillator")
+#
+
+BATCH_SIZE = 500
+FORMATS = ('csv', 'json', 'ndjson')
+
+
+class ImportFailed(Exception):
+    """The import stopped part way: rows first_row..last_row (1-based;
+    last_row None when unknown) weren't imported, nor was anything after
+    them.  Earlier batches stay committed, as `report` shows.
+    `unreadable` if the input couldn't be parsed, rather than the
+    database rejecting a batch.
+    """
+
+    def __init__(self, first_row, last_row, error, report, unreadable=False):
+        self.first_row, self.last_row = first_row, last_row
+        self.report = report
+        self.unreadable = unreadable
+        rows = f"rows {first_row}-{last_row}" if last_row else f"rows from {first_row} on"
+        reason = f"unreadable input ({error})" if unreadable else \
+            getattr(error, 'orig', None) or error
+        super().__init__(f"{rows} not imported: {reason}")
+
+
+class ImportReport:
+    """Running totals for an import, handed to the progress callback"""
+
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.rows = 0
+        self.parts = 0
+        self.created = {'brands': 0, 'part_types': 0, 'locations': 0, 'tags': 0}
+        self.errors = []   # (row number, message)
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    @property
+    def rate(self):
+        """Rows per second so far"""
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def to_dict(self):
+        return {
+            'dry_run': self.dry_run,
+            'rows': self.rows,
+            'parts': self.parts,
+            'created': self.created,
+            'errors': [{'row': n, 'error': e} for n, e in self.errors],
+            'seconds': round(self.elapsed, 3),
+            'rows_per_second': round(self.rate, 1)
+        }
+
+
+def detect_format(filename):
+    """csv / json / ndjson from a file name's extension"""
+    ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if ext in ('ndjson', 'jsonl'):
+        return 'ndjson'
+    if ext in FORMATS:
+        return ext
+    raise ValueError(f"Can't tell the format of '{filename}' (use csv, json or ndjson)")
+
+
+def read_rows(stream, fmt):
+    """Yield one dict per part from a binary or text stream"""
+    if isinstance(stream.read(0), bytes):
+        stream = io.TextIOWrapper(stream, encoding='utf-8-sig')
+    if fmt == 'csv':
+        for row in csv.DictReader(stream):
+            yield {k.strip().lower(): v for k, v in row.items() if k}
+    elif fmt == 'ndjson':
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+    elif fmt == 'json':
+        data = json.load(stream)
+        yield from data['parts'] if isinstance(data, dict) else data
+    else:
+        raise ValueError(f"Unknown import format '{fmt}'")
+
+
+class _Lookup:
+    """name -> id for one lookup table, creating missing rows in bulk"""
+
+    def __init__(self, model, make_row, slug_column=None):
+        self.model = model
+        self.make_row = make_row   # name -> dict of column values
+        self.ids = {}
+        columns = [model.id, model.name] + ([slug_column] if slug_column else [])
+        for id_, name, *slug in db.session.execute(db.select(*columns)):
+            for key in (self.key(name), *slug):
+                if key:
+                    self.ids.setdefault(key, id_)
+        self.pending = {}
+
+    @staticmethod
+    def key(name):
+        return slugify(name or '')
+
+    def want(self, name):
+        key = self.key(name)
+        if not key:
+            raise ValueError(f"'{name}' isn't a usable {self.model.__tablename__} name")
+        if key not in self.ids:
+            self.pending.setdefault(key, name)
+        return key
+
+    def flush(self):
+        """Insert everything asked for but not found. Returns the count"""
+        if not self.pending:
+            return 0
+        rows = [self.make_row(name) for name in self.pending.values()]
+        new_ids = _insert_returning_ids(self.model, rows)
+        self.ids.update(zip(self.pending, new_ids))
+        count = len(self.pending)
+        self.pending = {}
+        return count
+
+
+class _LocationLookup(_Lookup):
+    # Locations have no slug; match them on lower-cased name
+    @staticmethod
+    def key(name):
+        return (name or '').strip().lower()
+
+
+def import_parts(rows, batch_size=BATCH_SIZE, dry_run=False, progress=None):
+    """Import an iterable of row dicts.  Each batch is committed on its
+    own (or everything rolled back at the end for a dry run).  Bad rows
+    are reported and skipped; a batch the database rejects raises
+    ImportFailed.  Returns an ImportReport.
+    """
+    report = ImportReport(dry_run)
+    lookups = {
+        'brands': _Lookup(Brand, lambda name: {
+            'name': name, 'alias': slugify(name)[:50]}, Brand.alias),
+        'part_types': _Lookup(PartType, lambda name: {
+            'name': name, 'slug': slugify(name)[:50]}, PartType.slug),
+        'locations': _LocationLookup(Location, lambda name: {'name': name}),
+        'tags': _Lookup(Tag, lambda name: {
+            'name': name, 'slug': slugify(name)[:100]}, Tag.slug),
+    }
+
+    rows = enumerate(rows, start=1)
+    try:
+        while True:
+            try:
+                batch = list(islice(rows, batch_size))
+            except (ValueError, csv.Error) as e:  # incl. JSON, UTF-8 errors
+                raise ImportFailed(report.rows + 1, None, e, report,
+                                   unreadable=True) from e
+            if not batch:
+                break
+            committed = report.parts
+            try:
+                _import_batch(batch, lookups, report)
+                if not dry_run:
+                    db.session.commit()
+            except SQLAlchemyError as e:
+                db.session.rollback()
+                report.parts = committed
+                raise ImportFailed(batch[0][0], batch[-1][0], e, report) from e
+            report.elapsed = time.perf_counter() - report.started
+            if progress:
+                progress(report)
+    finally:
+        if dry_run:
+            db.session.rollback()
+    report.elapsed = time.perf_counter() - report.started
+    return report
+
+
+def _import_batch(batch, lookups, report):
+    parts = []
+    for row_number, row in batch:
+        report.rows += 1
+        try:
+            parts.append(_clean(row, lookups))
+        except (ValueError, TypeError, AttributeError) as e:
+            report.errors.append((row_number, str(e)))
+
+    for name, lookup in lookups.items():
+        report.created[name] += lookup.flush()
+    if not parts:
+        return
+
+    part_rows, part_tag_keys = [], []
+    for part in parts:
+        part_tag_keys.append(part.pop('tags'))
+        part['brand_id'] = lookups['brands'].ids[part.pop('brand')]
+        part['part_type_id'] = lookups['part_types'].ids[part.pop('part_type')]
+        location = part.pop('location')
+        part['location_id'] = lookups['locations'].ids[location] if location else None
+        part_rows.append(part)
+
+    part_ids = _insert_returning_ids(Part, part_rows)
+    tag_ids = lookups['tags'].ids
+    links = [{'part_id': part_id, 'tag_id': tag_ids[key]}
+             for part_id, keys in zip(part_ids, part_tag_keys)
+             for key in keys]
+    if links:
+        db.session.execute(insert(part_tags), links)
+    listing.refresh(part_ids)
+    report.parts += len(part_ids)
+
+
+def _insert_returning_ids(model, rows):
+    """executemany INSERT, returning the new ids in the order of `rows`.
+    A multi-row INSERT hands out ascending ids in row order (rowid /
+    sequence), so sorting what RETURNING gives back lines it up with the
+    input; asking SQLAlchemy to sort instead (sort_by_parameter_order)
+    makes it fall back to one INSERT per row on SQLite.  Core rather than
+    ORM insert, because the ORM splits the batch wherever a NULL column
+    (e.g. no location) comes and goes.
+    """
+    table = model.__table__
+    ids = sorted(db.session.scalars(insert(table).returning(table.c.id), rows))
+    changelog.record(changelog.ENTITY_OF[model], ids)
+    return ids
+
+
+def _clean(row, lookups):
+    """Validate one input row into Part column values plus lookup keys"""
+    def text(field, length):
+        value = row.get(field)
+        return str(value).strip()[:length] if value not in (None, '') else ''
+
+    name = text('name', 100)
+    brand = text('brand', 50)
+    part_type = text('part_type', 50) or text('type', 50)
+    if not (name and brand and part_type):
+        raise ValueError("name, brand and part_type are required")
+
+    quantity = row.get('quantity')
+    quantity = int(quantity) if quantity not in (None, '') else 1
+    if quantity < 0:
+        raise ValueError(f"quantity can't be negative ({quantity})")
+
+    tags = row.get('tags') or []
+    if isinstance(tags, str):
+        tags = tags.split(';')
+    location = text('location', 50)
+
+    return {
+        'name': name,
+        'description': text('description', 1024),
+        'part_number': text('part_number', 30),
+        'quantity': quantity,
+        'box': text('box', 20),
+        'position': text('position', 50),
+        'brand': lookups['brands'].want(brand),
+        'part_type': lookups['part_types'].want(part_type),
+        'location': lookups['locations'].want(location) if location else None,
+        'tags': list(dict.fromkeys(
+            lookups['tags'].want(t) for t in helpers.validate_tags(tags))),
+    }
@@ -0,0 +1,134 @@
+from flask import current_app
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from ..models import db, ImageJob
+from . import helpers, images
+from .periodic import PeriodicTask
+
+
+#
+# Background processing for uploaded images.
+#
+# Upload requests only save the file and queue an ImageJob row; a small
+# thread pool does the slow work (decode, rotate, resize, hash, EXIF).
+# Jobs live in the database, so anything queued or cut off mid-run is
+# picked up again when the app next starts - and, while it runs, a job
+# left 'running' for IMAGE_JOB_TIMEOUT by a worker that died is requeued
+# by a periodic sweep.
+#
+
+class ImageJobQueue:
+    def __init__(self, app=None):
+        self._executor = None
+        self.sweeper = PeriodicTask('image-jobs', self.requeue_stale)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('IMAGE_JOB_WORKERS', 2)   # 0 = run inline
+        app.config.setdefault('IMAGE_JOB_ATTEMPTS', 3)
+        app.config.setdefault('IMAGE_JOB_TIMEOUT', 600)  # seconds before a
+                                                         # running job is stale
+        app.extensions['image_jobs'] = self
+
+    def enqueue(self, image):
+        """Queue processing for an Image.  Caller commits, then submit()s"""
+        job = ImageJob(image=image, status='queued')
+        db.session.add(job)
+        return job
+
+    def submit(self, job_id):
+        """Hand a committed job to the worker pool"""
+        workers = current_app.config['IMAGE_JOB_WORKERS']
+        if not workers:
+            return self.run(job_id)
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=workers,
+                                                thread_name_prefix='image-job')
+        app = current_app._get_current_object()
+        self._executor.submit(self._run_in_context, app, job_id)
+
+    def shutdown(self, wait=True):
+        """Stop the worker pool, by default letting submitted jobs finish"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    def _run_in_context(self, app, job_id):
+        with app.app_context():
+            self.run(job_id)
+
+    def run(self, job_id):
+        """Process one job.  Returns False if another worker already has it"""
+        # Claim the job atomically so two workers never process it twice
+        claimed = db.session.execute(
+            db.update(ImageJob)
+            .where(ImageJob.id == job_id, ImageJob.status == 'queued')
+            .values(status='running',
+                    attempts=ImageJob.attempts + 1,
+                    started_at=datetime.now(timezone.utc))
+        ).rowcount
+        db.session.commit()
+        if not claimed:
+            return False
+
+        job = db.session.get(ImageJob, job_id)
+        try:
+            images.process_image(job.image)
+            job.status = 'done'
+            job.error = None
+            job.finished_at = datetime.now(timezone.utc)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            helpers.log_error(f"Image job {job_id}", e)
+            job = db.session.get(ImageJob, job_id)
+            retry = job.attempts < current_app.config['IMAGE_JOB_ATTEMPTS']
+            job.status = 'queued' if retry else 'failed'
+            job.error = str(e)[:500]
+            job.finished_at = None if retry else datetime.now(timezone.utc)
+            db.session.commit()
+            if retry:
+                self.submit(job_id)
+        return True
+
+    def start(self, app):
+        """Requeue stale jobs every IMAGE_JOB_TIMEOUT seconds"""
+        self.sweeper.start(app, app.config['IMAGE_JOB_TIMEOUT'])
+
+    def recover(self):
+        """Resubmit queued jobs and any left 'running' by a dead worker"""
+        self._requeue_stale()
+        job_ids = db.session.scalars(
+            db.select(ImageJob.id)
+            .where(ImageJob.status == 'queued')
+            .order_by(ImageJob.id)
+        ).all()
+        for job_id in job_ids:
+            self.submit(job_id)
+        return len(job_ids)
+
+    def requeue_stale(self):
+        """Resubmit jobs left 'running' past IMAGE_JOB_TIMEOUT by a worker
+        that died.  Returns how many."""
+        job_ids = self._requeue_stale()
+        for job_id in job_ids:
+            self.submit(job_id)
+        return len(job_ids)
+
+    def _requeue_stale(self):
+        timeout = timedelta(seconds=current_app.config['IMAGE_JOB_TIMEOUT'])
+        job_ids = db.session.scalars(
+            db.update(ImageJob)
+            .where(ImageJob.status == 'running',
+                   ImageJob.started_at < datetime.now(timezone.utc) - timeout)
+            .values(status='queued')
+            .returning(ImageJob.id)
+            .execution_options(synchronize_session=False)
+        ).all()
+        db.session.commit()
+        return job_ids
+
+
+image_jobs = ImageJobQueue()
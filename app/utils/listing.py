@@ -0,0 +1,166 @@
+from sqlalchemy import delete, event, func, inspect, insert, select, update
+from sqlalchemy.orm import Session, aliased
+from ..models import db, Part, Brand, PartType, Image, ImageRendition, Tag, \
+                     PartListing, part_tags
+
+
+#
+# The PartListing read model: one pre-joined row per part holding what a
+# gallery / brand / tag listing shows (brand and type names, first image
+# and its card renditions, image and tag counts), so a listing page is a
+# single indexed query on one table instead of Part + Brand + PartType +
+# Image + ImageRendition.
+#
+# Rows are kept in step from the session: every flush notes which parts
+# it touched (directly, or through their images, renditions and tags)
+# and rewrites just those rows in the same transaction; renaming a brand
+# or type updates its name on every row in one statement.  Bulk Core
+# writes bypass the session, so they call refresh() themselves (the
+# importer does) or rebuild() afterwards (`flask parts rebuild-listing`).
+#
+
+REFRESH_BATCH = 500
+
+LISTING = PartListing.__table__
+
+
+def init_app(app):
+    """Build the listing for a database that has parts but no listing yet
+    (i.e. the first start after the table was added)"""
+    with app.app_context():
+        has_parts = db.session.scalar(select(Part.id).limit(1))
+        if has_parts and not db.session.scalar(select(PartListing.id).limit(1)):
+            count = rebuild()
+            app.logger.info(f"Built the part listing ({count} parts)")
+
+
+def _listing_select():
+    """(columns, select) producing listing rows from the source tables"""
+    # nested inside the subqueries below too, so always correlate it to
+    # the outer Part (and never to an Image the inner query reads)
+    first_image = select(func.min(Image.id)).where(
+        Image.part_id == Part.id).correlate_except(Image).scalar_subquery()
+    image = aliased(Image)
+
+    def card(fmt):
+        return select(ImageRendition.filename).where(
+            ImageRendition.image_id == first_image,
+            ImageRendition.kind == 'card',
+            ImageRendition.format == fmt
+        ).limit(1).scalar_subquery()
+
+    values = {
+        'id': Part.id,
+        'name': Part.name,
+        'description': Part.description,
+        'part_number': Part.part_number,
+        'quantity': Part.quantity,
+        'created_at': Part.created_at,
+        'brand_id': Part.brand_id,
+        'brand_name': Brand.name,
+        'part_type_id': Part.part_type_id,
+        'part_type_name': PartType.name,
+        'location_id': Part.location_id,
+        'image_id': first_image,
+        'image_filename': select(image.filename).where(
+            image.id == first_image).scalar_subquery(),
+        'card_jpeg': card('jpeg'),
+        'card_webp': card('webp'),
+        'image_count': select(func.count(Image.id)).where(
+            Image.part_id == Part.id).scalar_subquery(),
+        'tag_count': select(func.count()).select_from(part_tags).where(
+            part_tags.c.part_id == Part.id).scalar_subquery(),
+    }
+    query = select(*values.values()) \
+        .select_from(Part) \
+        .outerjoin(Brand, Brand.id == Part.brand_id) \
+        .outerjoin(PartType, PartType.id == Part.part_type_id)
+    return list(values), query
+
+
+def refresh(part_ids, conn=None):
+    """Rewrite the listing rows of these parts; parts that no longer
+    exist lose theirs.  Runs in the session's transaction by default.
+    """
+    conn = conn if conn is not None else db.session.connection()
+    ids = sorted({i for i in part_ids if i is not None})
+    columns, query = _listing_select()
+    for start in range(0, len(ids), REFRESH_BATCH):
+        batch = ids[start:start + REFRESH_BATCH]
+        conn.execute(delete(LISTING).where(LISTING.c.id.in_(batch)))
+        conn.execute(insert(LISTING).from_select(
+            columns, query.where(Part.id.in_(batch))))
+    return len(ids)
+
+
+def rebuild():
+    """Recreate every listing row from scratch.  Returns the row count"""
+    columns, query = _listing_select()
+    with db.engine.begin() as conn:
+        conn.execute(delete(LISTING))
+        conn.execute(insert(LISTING).from_select(columns, query))
+        return conn.execute(select(func.count()).select_from(LISTING)).scalar()
+
+
+# -- keeping it in step --
+
+def _pending(session):
+    return session.info.setdefault('listing', {
+        'parts': set(), 'images': set(), 'brands': set(), 'types': set()})
+
+
+@event.listens_for(Session, 'before_flush')
+def _note_deleted_tags(session, flush_context, instances):
+    # A deleted tag's part_tags rows are gone by the time after_flush runs
+    tag_ids = [obj.id for obj in session.deleted
+               if isinstance(obj, Tag) and obj.id is not None]
+    if tag_ids:
+        with session.no_autoflush:
+            _pending(session)['parts'].update(session.scalars(
+                select(part_tags.c.part_id).where(part_tags.c.tag_id.in_(tag_ids))))
+
+
+@event.listens_for(Session, 'after_flush')
+def _note_changes(session, flush_context):
+    pending = _pending(session)
+    for obj in session.new | session.dirty | session.deleted:
+        if isinstance(obj, Part):
+            pending['parts'].add(obj.id)
+        elif isinstance(obj, Image):
+            # the part it's on now, and any it was moved off
+            pending['parts'].add(obj.part_id)
+            pending['parts'].update(inspect(obj).attrs.part_id.history.deleted or ())
+        elif isinstance(obj, ImageRendition):
+            pending['images'].add(obj.image_id)
+        elif isinstance(obj, Brand):
+            pending['brands'].add(obj.id)
+        elif isinstance(obj, PartType):
+            pending['types'].add(obj.id)
+
+
+@event.listens_for(Session, 'after_flush_postexec')
+def _apply_changes(session, flush_context):
+    pending = session.info.pop('listing', None)
+    if not pending or not any(pending.values()):
+        return
+    conn = session.connection()
+
+    images = pending['images'] - {None}
+    if images:
+        pending['parts'].update(conn.execute(
+            select(Image.part_id).where(Image.id.in_(images))).scalars())
+    refresh(pending['parts'], conn)
+
+    for ids, column, model in ((pending['brands'], 'brand', Brand),
+                               (pending['types'], 'part_type', PartType)):
+        ids = ids - {None}
+        if ids:
+            conn.execute(update(LISTING).where(
+                LISTING.c[f'{column}_id'].in_(ids)
+            ).values({f'{column}_name': select(model.name).where(
+                model.id == LISTING.c[f'{column}_id']).scalar_subquery()}))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard(session):
+    session.info.pop('listing', None)
@@ -0,0 +1,24 @@
+from ..models import db, Part, Image
+
+
+#
+# Eager-loading strategies for Part queries, in one place so every view
+# loads the same way:
+#   - many-to-one (brand, type, location): joinedload - one row each, no
+#     multiplication
+#   - collections (images, tags): selectinload - one extra IN query per
+#     collection, instead of a cartesian JOIN that multiplies rows and
+#     breaks LIMIT
+#
+# (Listing pages don't load Parts at all; see utils/listing.py.)
+#
+
+def part_detail_options():
+    """For the part page and editor: everything about one part"""
+    return [
+        db.joinedload(Part.brand),
+        db.joinedload(Part.part_type),
+        db.joinedload(Part.location),
+        db.selectinload(Part.images).selectinload(Image.renditions),
+        db.selectinload(Part.tags),
+    ]
@@ -0,0 +1,54 @@
+from email.message import EmailMessage
+from flask import current_app
+import smtplib
+
+
+#
+# Sending email over SMTP (MAIL_* settings).  Only the outbox dispatcher
+# sends; request handlers queue messages instead (utils/outbox.py).
+#
+
+def init_app(app):
+    app.config.setdefault('MAIL_SERVER', 'localhost')
+    app.config.setdefault('MAIL_PORT', 25)
+    app.config.setdefault('MAIL_USE_TLS', False)   # STARTTLS
+    app.config.setdefault('MAIL_USE_SSL', False)   # SMTP over TLS (port 465)
+    app.config.setdefault('MAIL_USERNAME', None)
+    app.config.setdefault('MAIL_PASSWORD', None)
+    app.config.setdefault('MAIL_SENDER', 'parts@localhost')
+    app.config.setdefault('MAIL_TIMEOUT', 30)  # seconds per SMTP operation
+
+
+def connect():
+    """A logged-in SMTP connection to send any number of messages over"""
+    config = current_app.config
+    smtp_class = smtplib.SMTP_SSL if config['MAIL_USE_SSL'] else smtplib.SMTP
+    smtp = smtp_class(config['MAIL_SERVER'], config['MAIL_PORT'],
+                      timeout=config['MAIL_TIMEOUT'])
+    try:
+        if config['MAIL_USE_TLS']:
+            smtp.starttls()
+        if config['MAIL_USERNAME']:
+            smtp.login(config['MAIL_USERNAME'], config['MAIL_PASSWORD'])
+    except Exception:
+        disconnect(smtp)
+        raise
+    return smtp
+
+
+def disconnect(smtp):
+    if smtp is None:
+        return
+    try:
+        smtp.quit()
+    except (smtplib.SMTPException, OSError):  # already dropped
+        smtp.close()
+
+
+def message(to, subject, body):
+    msg = EmailMessage()
+    msg['From'] = current_app.config['MAIL_SENDER']
+    msg['To'] = to
+    msg['Subject'] = subject
+    msg.set_content(body)
+    return msg
@@ -0,0 +1,232 @@
+from bisect import bisect_left
+from flask import current_app, g, has_request_context, request, \
+                  template_rendered, before_render_template
+from sqlalchemy import event
+from threading import Lock
+import time
+from ..models import db
+
+
+#
+# Per-request instrumentation.
+#
+# For every request we record wall time, how many SQL statements ran and
+# how long they took (engine cursor events), time spent rendering
+# templates (Flask's template signals) and the response size.  Totals
+# and histograms per endpoint are served in Prometheus text format at
+# /metrics.  With SLOW_REQUEST_MS set, requests slower than that are
+# logged along with each statement they ran and its duration.
+#
+# Numbers are per process: with several workers, scrape each one (or
+# sum them) as you would any other multi-process exporter.
+#
+
+PREFIX = 'radioparts'
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the shape Prometheus expects"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def lines(self, name, labels):
+        total = 0
+        for bound, count in zip((*self.buckets, '+Inf'), self.counts):
+            total += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {total}'
+        yield f'{name}_sum{{{labels}}} {self.sum:.6f}'
+        yield f'{name}_count{{{labels}}} {total}'
+
+
+class RequestMetrics:
+    def __init__(self, app=None):
+        self._lock = Lock()
+        self.requests = {}      # (endpoint, method, status) -> count
+        self.endpoints = {}     # endpoint -> per-endpoint totals / histograms
+        self.started = time.time()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('METRICS_ENABLED', True)
+        app.config.setdefault('METRICS_URL', '/metrics')
+        app.config.setdefault('SLOW_REQUEST_MS', None)   # e.g. 500; None = off
+        app.config.setdefault('SLOW_REQUEST_MAX_SQL', 50)  # statements logged
+        app.extensions['request_metrics'] = self
+        if not app.config['METRICS_ENABLED']:
+            return
+
+        # first in line, so time spent in other hooks (CSRF etc.) counts
+        app.before_request_funcs.setdefault(None, []).insert(0, self._start)
+        app.after_request(self._finish)
+        before_render_template.connect(self._render_started, app)
+        template_rendered.connect(self._render_finished, app)
+
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', _sql_started)
+            event.listen(db.engine, 'after_cursor_execute', _sql_finished)
+
+        app.add_url_rule(app.config['METRICS_URL'], 'metrics', self.export)
+
+    # -- per request --
+
+    def _start(self):
+        if request.endpoint == 'metrics':
+            return
+        g.metrics = {
+            'start': time.perf_counter(),
+            'sql_count': 0,
+            'sql_time': 0.0,
+            'render_time': 0.0,
+            'render_start': None,
+            # only kept when someone will read them
+            'statements': [] if _slow_threshold() is not None else None,
+        }
+
+    def _render_started(self, app, template, context, **extra):
+        m = g.get('metrics')
+        if m is not None:
+            m['render_start'] = time.perf_counter()
+
+    def _render_finished(self, app, template, context, **extra):
+        m = g.get('metrics')
+        if m is not None and m['render_start'] is not None:
+            m['render_time'] += time.perf_counter() - m['render_start']
+            m['render_start'] = None
+
+    def _finish(self, response):
+        m = g.pop('metrics', None)
+        if m is None:
+            return response
+        elapsed = time.perf_counter() - m['start']
+        endpoint = request.endpoint or 'unmatched'
+        size = 0 if response.is_streamed else (response.content_length or 0)
+
+        with self._lock:
+            key = (endpoint, request.method, response.status_code)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = {
+                    'duration': Histogram(DURATION_BUCKETS),
+                    'queries': Histogram(QUERY_BUCKETS),
+                    'sql_seconds': 0.0,
+                    'render_seconds': 0.0,
+                    'response_bytes': 0,
+                }
+            stats['duration'].observe(elapsed)
+            stats['queries'].observe(m['sql_count'])
+            stats['sql_seconds'] += m['sql_time']
+            stats['render_seconds'] += m['render_time']
+            stats['response_bytes'] += size
+
+        response.headers['Server-Timing'] = (
+            f"sql;desc=\"{m['sql_count']} queries\";dur={m['sql_time'] * 1000:.1f}, "
+            f"render;dur={m['render_time'] * 1000:.1f}, "
+            f"total;dur={elapsed * 1000:.1f}")
+
+        threshold = _slow_threshold()
+        if threshold is not None and elapsed * 1000 >= threshold:
+            _log_slow(request, response, elapsed, m, size)
+        return response
+
+    # -- exposition --
+
+    def export(self):
+        """Prometheus text exposition format"""
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+
+        with self._lock:
+            family('requests_total', 'counter', 'Requests handled')
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                lines.append(f'{PREFIX}_requests_total{{endpoint="{endpoint}",'
+                             f'method="{method}",status="{status}"}} {count}')
+
+            family('request_duration_seconds', 'histogram', 'Wall time per request')
+            for endpoint, stats in sorted(self.endpoints.items()):
+                lines.extend(stats['duration'].lines(
+                    f'{PREFIX}_request_duration_seconds', f'endpoint="{endpoint}"'))
+
+            family('request_sql_queries', 'histogram', 'SQL statements per request')
+            for endpoint, stats in sorted(self.endpoints.items()):
+                lines.extend(stats['queries'].lines(
+                    f'{PREFIX}_request_sql_queries', f'endpoint="{endpoint}"'))
+
+            for name, key, help_text in (
+                    ('sql_seconds_total', 'sql_seconds', 'Time spent executing SQL'),
+                    ('template_render_seconds_total', 'render_seconds',
+                     'Time spent rendering templates'),
+                    ('response_bytes_total', 'response_bytes',
+                     'Response body bytes (streamed responses not counted)')):
+                family(name, 'counter', help_text)
+                for endpoint, stats in sorted(self.endpoints.items()):
+                    value = stats[key]
+                    value = f"{value:.6f}" if isinstance(value, float) else value
+                    lines.append(f'{PREFIX}_{name}{{endpoint="{endpoint}"}} {value}')
+
+        family('process_start_time_seconds', 'gauge', 'When this worker started')
+        lines.append(f"{PREFIX}_process_start_time_seconds {self.started:.0f}")
+
+        return current_app.response_class(
+            '\n'.join(lines) + '\n',
+            content_type='text/plain; version=0.0.4; charset=utf-8')
+
+    def clear(self):
+        with self._lock:
+            self.requests.clear()
+            self.endpoints.clear()
+
+
+def _current():
+    return g.get('metrics') if has_request_context() else None
+
+
+def _sql_started(conn, cursor, statement, parameters, context, executemany):
+    if _current() is not None:
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _sql_finished(conn, cursor, statement, parameters, context, executemany):
+    m = _current()
+    starts = conn.info.get('query_start')
+    if m is None or not starts:
+        return
+    duration = time.perf_counter() - starts.pop()
+    m['sql_count'] += 1
+    m['sql_time'] += duration
+    if m['statements'] is not None:
+        m['statements'].append((duration, statement))
+
+
+def _slow_threshold():
+    return current_app.config.get('SLOW_REQUEST_MS')
+
+
+def _log_slow(request, response, elapsed, m, size):
+    limit = current_app.config['SLOW_REQUEST_MAX_SQL']
+    statements = m['statements'] or []
+    sql = '\n'.join(f"    {duration * 1000:8.1f} ms  {' '.join(statement.split())}"
+                    for duration, statement in statements[:limit])
+    if len(statements) > limit:
+        sql += f"\n    ... {len(statements) - limit} more"
+    current_app.logger.warning(
+        f"Slow request {request.method} {request.full_path.rstrip('?')} -> "
+        f"{response.status_code}: {elapsed * 1000:.0f} ms total, "
+        f"{m['sql_count']} queries in {m['sql_time'] * 1000:.0f} ms, "
+        f"render {m['render_time'] * 1000:.0f} ms, {size} bytes\n{sql}")
+
+
+request_metrics = RequestMetrics()
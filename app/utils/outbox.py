@@ -0,0 +1,158 @@
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from flask import current_app
+from itertools import groupby
+from operator import attrgetter
+from uuid import uuid4
+import smtplib
+from ..models import db, OutboxMessage
+from . import helpers, mailer
+from .periodic import PeriodicTask
+
+
+#
+# Outgoing email, sent in digests.
+#
+# Request handlers never talk to the mail server: enqueue() adds an
+# OutboxMessage in the caller's transaction, so a message exists exactly
+# when what it is about was committed.  Every NOTIFY_INTERVAL seconds the
+# dispatcher (a thread in the web app, or `flask outbox dispatch` from
+# cron) claims the messages that are due, groups them by recipient and
+# sends each one email listing everything since the last digest, over a
+# single SMTP connection.  A failed send is retried with exponential
+# backoff - NOTIFY_RETRY_BASE seconds, doubling per attempt, at most
+# NOTIFY_RETRY_MAX - and given up on ('failed') after NOTIFY_MAX_ATTEMPTS.
+#
+# Claims are made with one UPDATE per run, so several processes can run
+# dispatchers without sending anything twice.  Any local SMTP stand-in
+# will do for trying it out, e.g.
+#     python -m aiosmtpd -n -l localhost:1025   (and MAIL_PORT = 1025)
+#
+
+# errors that mean the connection is gone, rather than one message refused
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, OSError)
+
+
+class Outbox:
+    def __init__(self, app=None):
+        self.dispatcher = PeriodicTask('outbox', self.dispatch)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('NOTIFY_INTERVAL', 300)  # seconds; 0 = no thread
+        app.config.setdefault('NOTIFY_MAX_ATTEMPTS', 8)
+        app.config.setdefault('NOTIFY_RETRY_BASE', 60)  # seconds
+        app.config.setdefault('NOTIFY_RETRY_MAX', 6 * 3600)
+        app.config.setdefault('NOTIFY_SEND_TIMEOUT', 600)  # seconds before a
+                                                           # claim is stale
+        app.config.setdefault('LIBRARIAN_EMAIL', None)  # parts with no librarian
+        app.extensions['outbox'] = self
+
+    def enqueue(self, recipient, subject, body, part_request=None):
+        """Queue an email for the recipient's next digest.  Caller commits."""
+        message = OutboxMessage(recipient=recipient, subject=subject[:200],
+                                body=body, part_request=part_request)
+        db.session.add(message)
+        return message
+
+    # -- dispatching --
+
+    def start(self, app):
+        """Run dispatch() every NOTIFY_INTERVAL seconds in a daemon thread"""
+        self.dispatcher.start(app, app.config['NOTIFY_INTERVAL'])
+
+    def dispatch(self):
+        """Send every due message, one digest per recipient.
+        Returns counts of messages 'sent', 'retrying' and 'failed', and
+        of 'digests' sent.
+        """
+        config = current_app.config
+        now = datetime.now(timezone.utc)
+        token = uuid4().hex
+
+        # claims left behind by a dispatcher that died mid-send.  (Not
+        # evaluated against messages already in the session: their
+        # aware datetimes don't compare with ones loaded from SQLite, and
+        # the commit expires them anyway.)
+        stale = now - timedelta(seconds=config['NOTIFY_SEND_TIMEOUT'])
+        db.session.execute(
+            db.update(OutboxMessage)
+            .where(OutboxMessage.status == 'sending',
+                   OutboxMessage.claimed_at < stale)
+            .values(status='queued', claimed_by=None)
+            .execution_options(synchronize_session=False))
+        db.session.execute(
+            db.update(OutboxMessage)
+            .where(OutboxMessage.status == 'queued',
+                   OutboxMessage.next_attempt_at <= now)
+            .values(status='sending', claimed_by=token, claimed_at=now)
+            .execution_options(synchronize_session=False))
+        db.session.commit()
+
+        claimed = OutboxMessage.query.filter_by(claimed_by=token, status='sending') \
+                               .order_by(OutboxMessage.recipient, OutboxMessage.id).all()
+        counts = Counter()
+        if not claimed:
+            return counts
+        batches = [list(group) for _, group in
+                   groupby(claimed, key=attrgetter('recipient'))]
+
+        smtp = unreachable = None
+        try:
+            for batch in batches:
+                try:
+                    if unreachable:  # don't wait out the timeout again
+                        raise unreachable
+                    if smtp is None:
+                        try:
+                            smtp = mailer.connect()
+                        except Exception as e:
+                            unreachable = e
+                            raise
+                    subject, body = digest(batch)
+                    smtp.send_message(mailer.message(batch[0].recipient, subject, body))
+                except Exception as e:
+                    self._failed(batch, e, now, counts)
+                    if isinstance(e, CONNECTION_ERRORS):
+                        mailer.disconnect(smtp)
+                        smtp = None  # reconnect for the next recipient
+                else:
+                    for message in batch:
+                        message.status = 'sent'
+                        message.sent_at = now
+                        message.error = None
+                    counts['sent'] += len(batch)
+                    counts['digests'] += 1
+                db.session.commit()
+        finally:
+            mailer.disconnect(smtp)
+        return counts
+
+    def _failed(self, batch, error, now, counts):
+        config = current_app.config
+        helpers.log_error(f"Digest to {batch[0].recipient}", error)
+        for message in batch:
+            message.attempts += 1
+            message.error = str(error)[:500]
+            message.claimed_by = None
+            if message.attempts >= config['NOTIFY_MAX_ATTEMPTS']:
+                message.status = 'failed'
+                counts['failed'] += 1
+            else:
+                delay = min(config['NOTIFY_RETRY_BASE'] * 2 ** (message.attempts - 1),
+                            config['NOTIFY_RETRY_MAX'])
+                message.status = 'queued'
+                message.next_attempt_at = now + timedelta(seconds=delay)
+                counts['retrying'] += 1
+
+
+def digest(messages):
+    """(subject, body) of one email covering `messages`"""
+    if len(messages) == 1:
+        return messages[0].subject, messages[0].body
+    sections = [f"{m.subject}\n{'-' * len(m.subject)}\n{m.body}" for m in messages]
+    return f"{len(messages)} new part requests", '\n\n\n'.join(sections)
+
+
+outbox = Outbox()
@@ -0,0 +1,123 @@
+from flask import current_app
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from sqlalchemy import tuple_
+import json
+from . import events
+from .cache import TTLCache, location_scopes
+
+
+#
+# Keyset ("cursor") pagination.  Instead of OFFSET n, each page asks for
+# rows sorting after the last row of the previous page, so page 500 costs
+# the same as page 1.  Totals are counted once and cached until the next
+# write, since an exact COUNT on every page view is what we're avoiding;
+# count keys start with the location counted (cache.location_key), so a
+# write clears only the totals of the locations it touched.
+#
+
+COUNT_TABLES = ('Part', 'Brand', 'PartType', 'Tag', 'part_tags', 'Image')
+
+_counts = TTLCache(max_size=512)
+
+
+class KeysetPage:
+    """One page of results plus the cursors either side of it"""
+
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None,
+                 total=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def to_dict(self, item_dict):
+        return {
+            'items': [item_dict(item) for item in self.items],
+            'next_cursor': self.next_cursor,
+            'prev_cursor': self.prev_cursor,
+            'total': self.total
+        }
+
+
+def encode_cursor(values):
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v
+                      for v in values])
+    return urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+    """Cursor string back to column values.  Raises ValueError if bad"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = json.loads(urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(raw, list) or len(raw) != len(columns):
+        raise ValueError("Invalid cursor")
+
+    values = []
+    for column, value in zip(columns, raw):
+        if value is not None and column.type.python_type is datetime:
+            value = datetime.fromisoformat(value)
+        values.append(value)
+    return values
+
+
+def keyset_paginate(query, columns, after=None, before=None, per_page=12,
+                    count_key=None):
+    """Page through `query` in descending order of `columns`.
+    `columns` must end with a unique column (normally the primary key)
+    so the order is total.  Pass at most one of `after` (the next_cursor
+    of the previous page) or `before` (the prev_cursor of the next one).
+    """
+    total = cached_count(query, count_key) if count_key else None
+
+    key = tuple_(*columns)
+    if before:
+        query = query.filter(key > tuple_(*decode_cursor(before, columns)))
+        query = query.order_by(*[c.asc() for c in columns])
+    else:
+        if after:
+            query = query.filter(key < tuple_(*decode_cursor(after, columns)))
+        query = query.order_by(*[c.desc() for c in columns])
+
+    # One extra row tells us whether there's another page
+    rows = query.limit(per_page + 1).all()
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if before:
+        rows.reverse()
+
+    def cursor_for(item):
+        return encode_cursor([getattr(item, c.key) for c in columns])
+
+    next_cursor = prev_cursor = None
+    if rows:
+        if more or before:
+            next_cursor = cursor_for(rows[-1])
+        if (more and before) or after:
+            prev_cursor = cursor_for(rows[0])
+
+    return KeysetPage(rows, per_page, next_cursor, prev_cursor, total)
+
+
+def cached_count(query, key):
+    """Row count of a query, cached per `key` (a cache.location_key)
+    until the next write"""
+    return _counts.get_or_set(key, lambda: query.order_by(None).count(),
+                              ttl=current_app.config.get('COUNT_CACHE_TTL', 60))
+
+
+@events.on_commit(*COUNT_TABLES, by_location=True)
+def invalidate(changed_tables=None, locations=None):
+    _counts.clear(location_scopes(locations))
@@ -0,0 +1,41 @@
+from threading import Event, Thread
+from . import helpers
+
+
+#
+# Housekeeping that runs every so often inside the web app (sending
+# digests, releasing expired holds).  One daemon thread per task; each
+# task must be safe to run from several processes at once, since every
+# worker has its own thread - cron can run the matching CLI command
+# instead.
+#
+
+class PeriodicTask:
+    def __init__(self, name, fn):
+        self.name = name
+        self.fn = fn
+        self._thread = None
+        self._stop = Event()
+
+    def start(self, app, interval):
+        """Call fn() in an app context every `interval` seconds (0 = never)"""
+        if not interval or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = Thread(target=self._run, args=(app, interval),
+                              name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+
+    def _run(self, app, interval):
+        from ..models import db
+        while not self._stop.wait(interval):
+            with app.app_context():
+                try:
+                    self.fn()
+                except Exception as e:
+                    db.session.rollback()
+                    helpers.log_error(f"Periodic task {self.name}", e)
@@ -0,0 +1,47 @@
+from contextlib import contextmanager
+from sqlalchemy import event
+from ..models import db
+
+
+#
+# Counting the SQL a block of code issues, to catch N+1 regressions.
+#
+#     with assert_max_queries(4):
+#         client.get('/gallery')
+#
+
+class QueryCounter:
+    """Records every statement executed on the engine while active"""
+
+    def __init__(self, engine=None):
+        self.engine = engine
+        self.statements = []
+        self.parameters = []  # alongside statements, as passed to the DBAPI
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+        self.parameters.append(None if executemany else parameters)
+
+    def __enter__(self):
+        self.engine = self.engine or db.engine
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._record)
+        return False
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+
+@contextmanager
+def assert_max_queries(limit, engine=None):
+    """Fail with the offending SQL if the block runs more than `limit` queries"""
+    with QueryCounter(engine) as counter:
+        yield counter
+    if counter.count > limit:
+        statements = '\n\n'.join(counter.statements)
+        raise AssertionError(
+            f"Expected at most {limit} queries, got {counter.count}:\n{statements}")
@@ -0,0 +1,47 @@
+import re
+from ..models import db
+
+
+#
+# Checking that hot queries use an index.
+#
+# The SQL that real page requests issue is captured (QueryCounter), then
+# each SELECT is run through EXPLAIN QUERY PLAN.  A plain "SCAN <table>"
+# (no "USING ... INDEX") on one of the big tables means SQLite is reading
+# every row - the plan a missing or unusable index gives you.  (Sorting
+# is allowed: with a selective filter such as a tag, fetching the few
+# matches by index and sorting them beats walking the date index.)
+#
+
+# tables that grow with the catalogue; the lookup tables (Brand, Tag, ...)
+# are small enough to scan
+HOT_TABLES = ('Part', 'PartListing', 'Image', 'ImageRendition', 'part_tags', 'image_tags')
+
+_FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+
+
+def explain(statement, parameters=()):
+    """SQLite's query plan for a statement, one line per step"""
+    with db.engine.connect() as conn:
+        rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}",
+                                    parameters or ())
+        return [row[-1] for row in rows]
+
+
+def full_scans(plan, tables=HOT_TABLES):
+    """The plan lines that read a hot table in full"""
+    return [line.strip() for line in plan
+            if (scan := _FULL_SCAN.match(line.strip())) and scan.group(1) in tables]
+
+
+def check_statements(statements, parameters):
+    """[(statement, full scan plan lines)] for the captured SELECTs that
+    have any"""
+    failures = []
+    for statement, params in zip(statements, parameters):
+        if not statement.lstrip().upper().startswith('SELECT'):
+            continue
+        bad = full_scans(explain(statement, params))
+        if bad:
+            failures.append((statement, bad))
+    return failures
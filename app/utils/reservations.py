@@ -0,0 +1,137 @@
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from flask import current_app
+from sqlalchemy import bindparam, update
+from uuid import uuid4
+from ..models import db, Part, PartRequest, Reservation
+from . import changelog, listing
+from .periodic import PeriodicTask
+
+
+#
+# Holding stock for the people who ask for it.
+#
+# Part.quantity is what's free to hold.  reserve() takes units off it
+# with one conditional UPDATE ("quantity = quantity - n WHERE quantity
+# >= n"), so of two requests racing for the last 6V6 exactly one gets
+# it: nothing is read first, and no lock is held beyond the statement's
+# own.  Each hold is a Reservation row that expires after
+# RESERVATION_TTL; releasing it, or the sweeper expiring it, puts the
+# units back.  Status changes are conditional too ("WHERE status =
+# 'held'"), so a hold released by its owner while the sweeper expires it
+# only goes back on the shelf once.
+#
+# These are Core UPDATEs, which the session's PartListing and change log
+# hooks can't see, so they refresh the parts' listing rows and log the
+# change themselves.
+#
+
+# what a part request becomes when its hold ends this way
+REQUEST_STATUS = {
+    'fulfilled': 'Fulfilled',
+    'released': 'Cancelled',
+    'expired': 'Pending',   # back to the librarian
+}
+
+
+def init_app(app):
+    app.config.setdefault('RESERVATION_TTL', 3 * 24 * 3600)  # seconds
+    app.config.setdefault('RESERVATION_MAX_QUANTITY', 10)  # per hold
+    app.config.setdefault('RESERVATION_SWEEP_INTERVAL', 300)  # seconds; 0 = off
+
+
+def start(app):
+    """Expire stale holds every RESERVATION_SWEEP_INTERVAL seconds"""
+    sweeper.start(app, app.config['RESERVATION_SWEEP_INTERVAL'])
+
+
+def reserve(part_id, quantity=1, requester_email=None, part_request=None):
+    """Hold `quantity` units of a part.  Returns the Reservation, or None
+    if there aren't that many free.  Caller commits.
+    """
+    if not 1 <= quantity <= current_app.config['RESERVATION_MAX_QUANTITY']:
+        raise ValueError(f"Can't reserve {quantity} at once")
+    taken = _take(part_id, quantity)
+    if not taken and _close(Reservation.part_id == part_id,
+                            Reservation.expires_at <= _now(), status='expired'):
+        taken = _take(part_id, quantity)  # expired holds, not yet swept
+    if not taken:
+        return None
+
+    reservation = Reservation(
+        token=uuid4().hex, part_id=part_id, quantity=quantity,
+        requester_email=requester_email, part_request=part_request,
+        expires_at=_now() + timedelta(seconds=current_app.config['RESERVATION_TTL']))
+    db.session.add(reservation)
+    if part_request is not None:
+        part_request.status = 'Reserved'
+    listing.refresh([part_id])
+    changelog.record('parts', [part_id])
+    return reservation
+
+
+def release(reservation):
+    """Put a hold's units back.  False if it wasn't held any more."""
+    return bool(_close(Reservation.id == reservation.id, status='released'))
+
+
+def fulfil(reservation):
+    """The held units were handed over.  False if it wasn't held any more."""
+    return bool(_close(Reservation.id == reservation.id, status='fulfilled'))
+
+
+def sweep():
+    """Expire every hold past its expiry.  Commits; returns how many."""
+    count = _close(Reservation.expires_at <= _now(), status='expired')
+    db.session.commit()
+    return count
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _take(part_id, quantity):
+    return db.session.execute(
+        update(Part)
+        .where(Part.id == part_id, Part.quantity >= quantity)
+        .values(quantity=Part.quantity - quantity)
+    ).rowcount
+
+
+def _close(*conditions, status):
+    """End the holds matching `conditions` that are still held, restocking
+    unless they were fulfilled.  Returns how many were ended.
+    """
+    closed = db.session.execute(
+        update(Reservation)
+        .where(Reservation.status == 'held', *conditions)
+        .values(status=status, closed_at=_now())
+        .returning(Reservation.part_id, Reservation.quantity,
+                   Reservation.part_request_id)
+    ).all()
+    if not closed:
+        return 0
+
+    if status != 'fulfilled':
+        units = Counter()
+        for part_id, quantity, _ in closed:
+            units[part_id] += quantity
+        parts = Part.__table__
+        db.session.execute(
+            update(parts).where(parts.c.id == bindparam('part'))
+            .values(quantity=parts.c.quantity + bindparam('units')),
+            [{'part': part_id, 'units': n} for part_id, n in units.items()])
+        listing.refresh(units)
+        changelog.record('parts', units)
+
+    request_ids = [request_id for _, _, request_id in closed if request_id]
+    if request_ids:
+        db.session.execute(
+            update(PartRequest)
+            .where(PartRequest.id.in_(request_ids), PartRequest.status == 'Reserved')
+            .values(status=REQUEST_STATUS[status]))
+    return len(closed)
+
+
+sweeper = PeriodicTask('reservations', sweep)
@@ -0,0 +1,81 @@
+from pathlib import Path
+from sqlalchemy import inspect, text
+from ..models import db, Brand, PartType, Tag
+from .helpers import slugify
+
+
+#
+# Schema changes are Alembic migrations (migrations/, managed with
+# `flask db migrate` / `flask db upgrade`), applied at startup.
+# Alembic is imported on first use: it is the largest single import of
+# the app, and the CLI-only app (see create_cli_app) never needs it.
+#
+
+MIGRATIONS_DIR = Path(__file__).resolve().parents[2] / 'migrations'
+
+
+def init_app(app):
+    from flask_migrate import Migrate
+    # render_as_batch: SQLite can only ALTER a table by copying it
+    Migrate(app, db, directory=str(MIGRATIONS_DIR), render_as_batch=True,
+            compare_type=True)
+
+
+def upgrade_schema():
+    """Bring the database up to date by running pending migrations.
+    A database from before migrations existed is first patched up to
+    match the models and stamped as current.
+    """
+    from flask_migrate import stamp, upgrade
+    tables = set(inspect(db.engine).get_table_names())
+    if 'alembic_version' not in tables and 'Part' in tables:
+        _patch_legacy_schema()
+        stamp(revision='head')
+    upgrade()
+    _backfill_slugs()
+
+
+def _patch_legacy_schema():
+    """Pre-migrations upgrade path: create missing tables, then add any
+    columns and indexes the models declare but the existing tables lack.
+    New columns must be nullable (SQLite can't add a NOT NULL column
+    without a default).
+    """
+    db.create_all()
+
+    inspector = inspect(db.engine)
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            existing = {c['name'] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                conn.execute(text(
+                    f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+
+def _backfill_slugs():
+    """Tags, brands and types are looked up by slug; give the ones
+    created without one (older rows) their slugify(name)
+    """
+    for model, column in ((Tag, Tag.slug), (Brand, Brand.alias),
+                          (PartType, PartType.slug)):
+        rows = db.session.execute(
+            db.select(model.id, model.name).where(column.is_(None))).all()
+        if not rows:
+            continue
+        taken = set(db.session.scalars(db.select(column).where(column.is_not(None))))
+        for id_, name in rows:
+            slug = base = slugify(name or '') or str(id_)
+            n = 1
+            while slug in taken:
+                n += 1
+                slug = f"{base}-{n}"
+            taken.add(slug)
+            db.session.execute(db.update(model).where(model.id == id_)
+                                 .values({column.key: slug}))
+        db.session.commit()
@@ -0,0 +1,187 @@
+import re
+from flask import current_app
+from sqlalchemy import text, literal_column, table, or_
+from ..models import db, Part, Brand, PartType
+
+
+#
+# Full-text search over parts, backed by an SQLite FTS5 table.
+#
+# The index holds one row per part (rowid == Part.id) with the brand, type
+# and tag names denormalised into it.  Triggers keep it in step with every
+# write to Part, Brand, PartType, Tag and part_tags, so nothing in the
+# blueprints has to remember to update it.
+#
+
+INDEX_TABLE = 'part_search'
+
+# bm25 weights, in column order: a hit on the name or part number
+# counts for far more than one buried in the description
+COLUMN_WEIGHTS = (10.0, 2.0, 8.0, 4.0, 3.0, 4.0)
+
+CREATE_INDEX_SQL = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS {INDEX_TABLE} USING fts5(
+    name, description, part_number, brand, part_type, tags,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '1 2 3'
+)
+"""
+
+
+def _refresh_sql(where):
+    """Statements that (re)write the index rows for the parts matching `where`"""
+    return [
+        f"DELETE FROM {INDEX_TABLE} WHERE rowid IN (SELECT p.id FROM Part p WHERE {where})",
+        f"""
+        INSERT INTO {INDEX_TABLE} (rowid, name, description, part_number, brand, part_type, tags)
+        SELECT p.id,
+               p.name,
+               coalesce(p.description, ''),
+               coalesce(p.part_number, ''),
+               coalesce(b.name, ''),
+               coalesce(pt.name, ''),
+               coalesce((SELECT group_concat(t.name, ' ')
+                         FROM part_tags ptg JOIN Tag t ON t.id = ptg.tag_id
+                         WHERE ptg.part_id = p.id), '')
+        FROM Part p
+        LEFT JOIN Brand b ON b.id = p.brand_id
+        LEFT JOIN PartType pt ON pt.id = p.part_type_id
+        WHERE {where}
+        """
+    ]
+
+
+# trigger name -> (event, which parts to refresh)
+TRIGGERS = {
+    'part_search_part_ai': ('AFTER INSERT ON Part', 'p.id = NEW.id'),
+    'part_search_part_au': ('AFTER UPDATE ON Part', 'p.id = NEW.id'),
+    'part_search_brand_au': ('AFTER UPDATE OF name ON Brand', 'p.brand_id = NEW.id'),
+    'part_search_type_au': ('AFTER UPDATE OF name ON PartType', 'p.part_type_id = NEW.id'),
+    'part_search_tag_au': ('AFTER UPDATE OF name ON Tag',
+                           'p.id IN (SELECT part_id FROM part_tags WHERE tag_id = NEW.id)'),
+    'part_search_tags_ai': ('AFTER INSERT ON part_tags', 'p.id = NEW.part_id'),
+    'part_search_tags_ad': ('AFTER DELETE ON part_tags', 'p.id = OLD.part_id'),
+}
+
+
+def init_app(app):
+    """Create the search index and its triggers if the database supports it.
+    Anything other than SQLite with FTS5 falls back to LIKE matching.
+    """
+    app.extensions['part_search'] = False
+    if not app.config.get('FULL_TEXT_SEARCH', True):
+        return
+
+    with app.app_context():
+        if db.engine.dialect.name != 'sqlite':
+            return
+        try:
+            with db.engine.begin() as conn:
+                is_new = not conn.execute(text(
+                    "SELECT 1 FROM sqlite_master WHERE name = :name"
+                ), {'name': INDEX_TABLE}).first()
+                conn.execute(text(CREATE_INDEX_SQL))
+                _create_triggers(conn)
+                if is_new:
+                    _rebuild(conn)
+        except Exception as e:  # e.g. SQLite compiled without FTS5
+            app.logger.warning(f"Full-text search disabled | Error: {str(e)}")
+            return
+
+    app.extensions['part_search'] = True
+
+
+def _trigger_names():
+    return list(TRIGGERS) + ['part_search_part_ad']
+
+
+def _create_triggers(conn):
+    for name, (event, where) in TRIGGERS.items():
+        body = ''.join(f'{statement};' for statement in _refresh_sql(where))
+        conn.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {body} END"))
+    conn.execute(text(
+        f"CREATE TRIGGER IF NOT EXISTS part_search_part_ad AFTER DELETE ON Part "
+        f"BEGIN DELETE FROM {INDEX_TABLE} WHERE rowid = OLD.id; END"))
+
+
+def _rebuild(conn):
+    for statement in [f"DELETE FROM {INDEX_TABLE}", _refresh_sql('1 = 1')[1]]:
+        conn.execute(text(statement))
+    conn.execute(text(f"INSERT INTO {INDEX_TABLE} ({INDEX_TABLE}) VALUES ('optimize')"))
+
+
+def drop_index():
+    """Remove the index and its triggers, e.g. ahead of a bulk load;
+    rebuild_index() puts both back"""
+    with db.engine.begin() as conn:
+        for name in _trigger_names():
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+        conn.execute(text(f"DROP TABLE IF EXISTS {INDEX_TABLE}"))
+
+
+def rebuild_index():
+    """Drop and repopulate the index from the Part table.
+    Returns the number of parts indexed.
+    """
+    with db.engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {INDEX_TABLE}"))
+        for name in _trigger_names():
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+        conn.execute(text(CREATE_INDEX_SQL))
+        _create_triggers(conn)
+        _rebuild(conn)
+        return conn.execute(text(f"SELECT count(*) FROM {INDEX_TABLE}")).scalar()
+
+
+def build_match(search_query):
+    """Turn free text into an FTS5 MATCH expression.
+    Every word becomes a quoted prefix term, so "6V6" also finds "6V6GT"
+    and stray punctuation can't be read as query syntax.
+    """
+    terms = re.findall(r'\w+', search_query)
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def ranked_matches(search_query):
+    """Subquery of (part_id, rank) for a search, best match first.
+    Returns None if there is nothing searchable in the query.
+    """
+    match = build_match(search_query)
+    if not match:
+        return None
+
+    weights = ', '.join(str(w) for w in COLUMN_WEIGHTS)
+    return db.select(
+        literal_column('rowid').label('part_id'),
+        literal_column(f'bm25({INDEX_TABLE}, {weights})').label('rank')
+    ).select_from(
+        table(INDEX_TABLE)
+    ).where(
+        text(f'{INDEX_TABLE} MATCH :match').bindparams(match=match)
+    ).subquery()
+
+
+def apply_search(query, search_query, model=Part):
+    """Filter (and rank) a Part (or PartListing) query by free text"""
+    if current_app.extensions.get('part_search'):
+        matches = ranked_matches(search_query)
+        if matches is None:
+            return query
+        return query.join(
+            matches, model.id == matches.c.part_id
+        ).order_by(matches.c.rank)
+
+    # No FTS5 available - fall back to a (slow) LIKE scan
+    like = f"%{search_query}%"
+    if model is Part:
+        query = query.outerjoin(Part.brand).outerjoin(Part.part_type)
+        names = (Brand.name, PartType.name)
+    else:  # the listing has the names already
+        names = (model.brand_name, model.part_type_name)
+    return query.filter(or_(
+        model.name.ilike(like),
+        model.description.ilike(like),
+        model.part_number.ilike(like),
+        *(name.ilike(like) for name in names)
+    ))
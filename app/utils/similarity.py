@@ -0,0 +1,137 @@
+from collections import namedtuple
+from flask import current_app
+from threading import Lock
+import time
+from ..models import db, Image
+from . import events
+
+
+#
+# "Find similar parts": perceptual hashes of images, and a nearest
+# neighbour search over them.
+#
+# Each image gets a 64-bit difference hash (dHash): shrunk to 9x8 grey
+# pixels, one bit per pair of neighbours saying whether brightness rises
+# or falls.  Photos of the same dial or knob - rescaled, recompressed,
+# lightly retouched - end up a few bits apart, so "similar" is a small
+# Hamming distance.  The hash is made by the upload job and backfilled by
+# `flask images fingerprint`.
+#
+# Searching keeps every hash in one packed uint64 array in memory and
+# compares against all of them at once with NumPy (XOR, then a bit count:
+# a millisecond or two for 100k images), falling back to plain Python
+# if NumPy isn't installed.  The index is rebuilt on first use after a
+# commit touching images, or after SIMILARITY_INDEX_TTL for other
+# processes' writes.
+#
+
+HASH_SIZE = 8   # 8x8 = 64 bits
+
+_Snapshot = namedtuple('_Snapshot', ['hashes', 'image_ids', 'part_ids', 'built_at'])
+
+Match = namedtuple('Match', ['part_id', 'image_id', 'distance'])
+
+
+def perceptual_hash(picture):
+    """dHash of a PIL image, as 16 hex digits"""
+    from PIL import Image as PILImage
+    small = picture.convert('L').resize((HASH_SIZE + 1, HASH_SIZE),
+                                        PILImage.LANCZOS)
+    pixels = small.tobytes()
+    bits = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            bits = bits << 1 | (pixels[offset + col] < pixels[offset + col + 1])
+    return f"{bits:016x}"
+
+
+class SimilarityIndex:
+    def __init__(self, app=None):
+        self._lock = Lock()
+        self._snapshot = None   # see _build()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SIMILARITY_INDEX_TTL', 300)
+        app.config.setdefault('SIMILARITY_MAX_DISTANCE', 10)  # of 64 bits
+        app.extensions['similarity_index'] = self
+
+    def invalidate(self):
+        self._snapshot = None
+
+    def similar_parts(self, phash, limit=20, max_distance=None, exclude_part=None):
+        """Matches (part_id, image_id, distance) for the parts whose
+        closest image is within `max_distance` bits of `phash`, closest
+        first - one per part.
+        """
+        if max_distance is None:
+            max_distance = current_app.config['SIMILARITY_MAX_DISTANCE']
+        index = self._current()
+        found = []
+        seen = set()
+        for position, dist in _nearest(index, int(phash, 16), max_distance):
+            part_id = index.part_ids[position]
+            if part_id == exclude_part or part_id in seen:
+                continue
+            seen.add(part_id)
+            found.append(Match(part_id, index.image_ids[position], dist))
+            if len(found) == limit:
+                break
+        return found
+
+    def _current(self):
+        snapshot = self._snapshot
+        ttl = current_app.config['SIMILARITY_INDEX_TTL']
+        if snapshot is None or time.monotonic() - snapshot.built_at > ttl:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is None or time.monotonic() - snapshot.built_at > ttl:
+                    snapshot = self._snapshot = _build()
+        return snapshot
+
+
+def _build():
+    rows = db.session.execute(
+        db.select(Image.phash, Image.id, Image.part_id)
+        .where(Image.phash.is_not(None), Image.part_id.is_not(None))
+        .order_by(Image.id)).all()
+    hashes = [int(phash, 16) for phash, _, _ in rows]
+    try:
+        import numpy as np
+        hashes = np.array(hashes, dtype=np.uint64)
+    except ImportError:
+        pass
+    return _Snapshot(hashes=hashes,
+                     image_ids=[image_id for _, image_id, _ in rows],
+                     part_ids=[part_id for _, _, part_id in rows],
+                     built_at=time.monotonic())
+
+
+def _nearest(index, query, max_distance):
+    """(position, distance) of the hashes within max_distance, nearest first"""
+    hashes = index.hashes
+    if isinstance(hashes, list):  # no NumPy
+        found = [(position, (h ^ query).bit_count())
+                 for position, h in enumerate(hashes)]
+        return sorted(((p, d) for p, d in found if d <= max_distance),
+                      key=lambda item: item[1])
+
+    import numpy as np
+    xor = hashes ^ np.uint64(query)
+    if hasattr(np, 'bitwise_count'):  # NumPy 2
+        distances = np.bitwise_count(xor)
+    else:
+        distances = np.unpackbits(xor.view(np.uint8)).reshape(-1, 64).sum(axis=1)
+    positions = np.flatnonzero(distances <= max_distance)
+    order = positions[np.argsort(distances[positions], kind='stable')]
+    return zip(order.tolist(), distances[order].tolist())
+
+
+similarity_index = SimilarityIndex()
+
+
+@events.on_commit('Image')
+def invalidate(changed_tables=None):
+    similarity_index.invalidate()
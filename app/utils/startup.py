@@ -0,0 +1,104 @@
+from pathlib import Path
+from statistics import median
+import json
+import os
+import subprocess
+import sys
+
+
+#
+# Startup time of the app factories, measured in a fresh interpreter
+# (`python -X importtime`) so nothing is already imported: how long
+# `import app` and building the app take, how much of that is on top of
+# importing Flask and SQLAlchemy alone, which imports cost the most, and
+# whether any of the deferred heavy modules got loaded anyway.  Run by
+# `flask perf startup`.
+#
+
+ROOT = Path(__file__).resolve().parents[2]
+
+# loaded only where used; the CLI app should load none of them
+DEFERRED_MODULES = (
+    'alembic',
+    'flask_migrate',
+    'flask_wtf',
+    'PIL',
+    'slugify',
+    'app.blueprints',
+)
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+{imports}
+imported = time.perf_counter()
+{create}
+built = time.perf_counter()
+import json
+print(json.dumps({{
+    'import_ms': (imported - start) * 1000,
+    'create_ms': (built - imported) * 1000,
+    'modules': sorted(sys.modules),
+}}))
+"""
+
+# what every variant imports anyway: startup budgets are for the time
+# spent on top of this, which is mostly down to the machine
+FRAMEWORK_IMPORTS = 'import flask, flask_sqlalchemy, sqlalchemy.orm'
+
+
+def measure(factory='create_cli_app', repeat=5):
+    """Startup of `app.<factory>()`, the median of `repeat` fresh runs:
+    {factory, import_ms, create_ms, total_ms, overhead_ms (over the
+    framework imports alone), slowest: [(module, ms)], deferred: [the
+    DEFERRED_MODULES that got loaded]}
+    """
+    floor = median(_total(_run(FRAMEWORK_IMPORTS, '')) for _ in range(repeat))
+    runs = sorted((_run('import app', f'app.{factory}()') for _ in range(repeat)),
+                  key=_total)
+    middle = runs[len(runs) // 2]
+    loaded = set(middle['modules'])
+    return {
+        'factory': factory,
+        'import_ms': median(r['import_ms'] for r in runs),
+        'create_ms': median(r['create_ms'] for r in runs),
+        'total_ms': _total(middle),
+        'overhead_ms': _total(middle) - floor,
+        'slowest': middle['slowest'],
+        'deferred': [name for name in DEFERRED_MODULES if name in loaded],
+    }
+
+
+def _total(run):
+    return run['import_ms'] + run['create_ms']
+
+
+def _run(imports, create):
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c',
+         PROBE.format(imports=imports, create=create)],
+        cwd=ROOT, env=dict(os.environ), capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError(f"{create or imports} failed:\n{result.stderr[-2000:]}")
+    run = json.loads(result.stdout.strip().splitlines()[-1])
+    run['slowest'] = _top_imports(result.stderr)[:10]
+    return run
+
+
+def _top_imports(importtime_output):
+    """(module, cumulative ms) of the imports made by the probe and the
+    ones those made directly, slowest first.  Lines look like
+    `import time:  self [us] | cumulative | <two spaces per level>module`.
+    """
+    found = []
+    for line in importtime_output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        try:
+            _, cumulative, name = line[len('import time:'):].split('|')
+            cumulative = int(cumulative)
+        except ValueError:  # the header line
+            continue
+        if not name.startswith('    '):  # levels 0 and 1
+            found.append((name.strip(), cumulative / 1000))
+    return sorted(found, key=lambda item: -item[1])
@@ -0,0 +1,344 @@
+from flask import Request, current_app, request
+from pathlib import Path
+from uuid import uuid4
+import hashlib
+import os
+import re
+import shutil
+import time
+from ..models import db, Image, ImageRendition
+
+
+#
+# Content-addressed storage for uploaded originals.
+#
+# Files are hashed as they stream to disk and stored as
+#     UPLOAD_FOLDER/locations/<location id>/cas/ab/cd/abcd...ef.jpg
+# (UPLOAD_FOLDER/cas/... for images not kept at any location), so a
+# photo uploaded twice is stored once per location, finding it again is
+# an index lookup on Image.content_hash, and the URL of a file can never
+# point at different bytes - which lets browsers cache it forever.  Each
+# location's originals and renditions stay under its own directory, so
+# one library's files can be backed up, synced or moved on their own
+# (`flask images relocate` moves images whose location changed).
+#
+# Views marked @streamed get their multipart file fields written straight
+# into UPLOAD_FOLDER/cas/tmp and hashed while the body is parsed, so an
+# upload is never held in memory (or copied a second time) on its way to
+# the store.  Files too big for one request arrive as Dropzone chunks,
+# kept one file per chunk under cas/tmp/chunks/<upload id>/ until the
+# last one is in and they're joined up.
+#
+
+CAS_DIR = 'cas'
+LOCATIONS_DIR = 'locations'
+CHUNK_SIZE = 1024 * 1024
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+UPLOAD_ID = re.compile(r'^[0-9A-Za-z-]{8,64}$')
+CAS_PATH = re.compile(rf'^(?:{LOCATIONS_DIR}/\d+/)?{CAS_DIR}/')
+LOCATION_PATH = re.compile(rf'^{LOCATIONS_DIR}/(\d+)/')
+
+
+def init_app(app):
+    configure(app)
+    if app.request_class is Request:
+        app.request_class = UploadRequest
+    app.after_request(immutable_headers)
+
+
+def configure(app):
+    """Upload settings alone, for apps that don't take uploads"""
+    app.config.setdefault('UPLOAD_MAX_FILE_SIZE', 64 * 1024 * 1024)  # chunked
+    app.config.setdefault('UPLOAD_PARTIAL_MAX_AGE', 24 * 3600)  # seconds
+
+
+def streamed(view):
+    """Mark a view whose file uploads should stream into the store"""
+    view.streams_uploads = True
+    return view
+
+
+class HashingFile:
+    """Temp file in the upload dir that hashes whatever is written to it.
+    Unless finish()ed, the file is removed again when closed.
+    """
+
+    def __init__(self, upload_dir):
+        tmp_dir = _tmp_dir(upload_dir)
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        self.path = tmp_dir / uuid4().hex
+        self.size = 0
+        self._file = open(self.path, 'w+b')
+        self._digest = hashlib.sha256()
+        self._finished = False
+
+    def write(self, data):
+        self._digest.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def __getattr__(self, name):   # read, seek etc. for the form parser
+        return getattr(self._file, name)
+
+    def finish(self):
+        """Close the file and hand it over: (digest, temp path, size)"""
+        self._file.close()
+        self._finished = True
+        return self._digest.hexdigest(), self.path, self.size
+
+    def close(self):
+        self._file.close()
+        if not self._finished:
+            self.path.unlink(missing_ok=True)
+
+
+class UploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type,
+                         filename=None, content_length=None):
+        view = current_app.view_functions.get(self.endpoint)
+        if filename and getattr(view, 'streams_uploads', False):
+            return HashingFile(current_app.config['UPLOAD_FOLDER'])
+        return super()._get_file_stream(total_content_length, content_type,
+                                        filename, content_length)
+
+
+def receive(stream, upload_dir):
+    """Get an upload stream into a temp file, hashing as it goes (already
+    done, for a @streamed view).
+    Returns (sha256 hex digest, temp path, size in bytes).
+    """
+    if isinstance(stream, HashingFile):
+        return stream.finish()
+    out = HashingFile(upload_dir)
+    try:
+        shutil.copyfileobj(stream, out, CHUNK_SIZE)
+    except Exception:
+        out.close()
+        raise
+    return out.finish()
+
+
+# -- chunked uploads --
+
+def save_chunk(upload_id, index, total, total_size, stream, upload_dir):
+    """Store chunk `index` (of `total`) of a chunked upload.  Sending a
+    chunk again replaces it.  Returns how many chunks are now in.
+    """
+    if total_size > current_app.config['UPLOAD_MAX_FILE_SIZE']:
+        raise ValueError(f"File is too big ({total_size} bytes)")
+    if not 0 <= index < total:
+        raise ValueError(f"Chunk {index} out of range (0-{total - 1})")
+    chunk_dir = _chunk_dir(upload_dir, upload_id)
+    chunk_dir.mkdir(parents=True, exist_ok=True)
+    _, tmp_path, _ = receive(stream, upload_dir)
+    os.replace(tmp_path, chunk_dir / str(index))
+    return len(received_chunks(upload_id, upload_dir))
+
+
+def received_chunks(upload_id, upload_dir):
+    """Sorted indexes of the chunks received so far"""
+    chunk_dir = _chunk_dir(upload_dir, upload_id)
+    if not chunk_dir.is_dir():
+        return []
+    return sorted(int(p.name) for p in chunk_dir.iterdir() if p.name.isdigit())
+
+
+def assemble(upload_id, total, upload_dir):
+    """Join a chunked upload's chunks into one temp file, which is then
+    handled like any other upload.  `total` (from the client) has to
+    match the chunks received.  Returns what receive() does.
+    """
+    if total < 1:
+        raise ValueError(f"Upload {upload_id}: total_chunks must be at least 1")
+    received = received_chunks(upload_id, upload_dir)
+    missing = set(range(total)) - set(received)
+    if missing:
+        raise ValueError(f"Upload {upload_id} is missing chunks "
+                         f"{', '.join(map(str, sorted(missing)))}")
+    if len(received) != total:
+        # chunks past the end: joining only `total` would truncate the file
+        raise ValueError(f"Upload {upload_id} has {len(received)} chunks, "
+                         f"not {total}")
+
+    # Claim the chunks, so a second finish request can't join them too
+    chunk_dir = _chunk_dir(upload_dir, upload_id)
+    claimed = chunk_dir.with_name(f"{chunk_dir.name}.joining")
+    try:
+        os.rename(chunk_dir, claimed)
+    except FileNotFoundError:
+        raise ValueError(f"Upload {upload_id} was already finished")
+
+    out = HashingFile(upload_dir)
+    try:
+        for index in range(total):
+            with open(claimed / str(index), 'rb') as chunk:
+                shutil.copyfileobj(chunk, out, CHUNK_SIZE)
+        if out.size > current_app.config['UPLOAD_MAX_FILE_SIZE']:
+            raise ValueError(f"File is too big ({out.size} bytes)")
+    except Exception:
+        out.close()
+        raise
+    finally:
+        shutil.rmtree(claimed, ignore_errors=True)
+    return out.finish()
+
+
+def clean_partial_uploads(upload_dir, max_age):
+    """Remove temp files and chunked uploads untouched for `max_age`
+    seconds (abandoned uploads).  Returns how many were removed.
+    """
+    cutoff = time.time() - max_age
+    removed = 0
+    for tmp_dir in (_tmp_dir(upload_dir), _tmp_dir(upload_dir) / 'chunks'):
+        if not tmp_dir.is_dir():
+            continue
+        for path in tmp_dir.iterdir():
+            if path.name == 'chunks' or path.stat().st_mtime >= cutoff:
+                continue
+            if path.is_dir():
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                path.unlink(missing_ok=True)
+            removed += 1
+    return removed
+
+
+def _tmp_dir(upload_dir):
+    return Path(upload_dir) / CAS_DIR / 'tmp'
+
+
+def _chunk_dir(upload_dir, upload_id):
+    if not UPLOAD_ID.match(upload_id or ''):
+        raise ValueError(f"Bad upload id '{upload_id}'")
+    return _tmp_dir(upload_dir) / 'chunks' / upload_id
+
+
+def location_dir(location_id):
+    """Directory (relative to UPLOAD_FOLDER, with a trailing slash) of a
+    location's files; '' for images kept nowhere in particular"""
+    return f"{LOCATIONS_DIR}/{location_id}/" if location_id else ''
+
+
+def location_of(filename):
+    """Id of the location whose directory a stored file is in, if any"""
+    match = LOCATION_PATH.match(filename or '')
+    return int(match.group(1)) if match else None
+
+
+def cas_filename(digest, ext, location_id=None):
+    """Path (relative to UPLOAD_FOLDER) a file with this hash lives at"""
+    return (f"{location_dir(location_id)}{CAS_DIR}/{digest[:2]}/{digest[2:4]}/"
+            f"{digest}{ext.lower()}")
+
+
+def store(tmp_path, digest, ext, upload_dir, location_id=None):
+    """Move a received temp file to its content address.
+    Returns the filename to record on the Image.
+    """
+    filename = cas_filename(digest, ext, location_id)
+    target = Path(upload_dir) / filename
+    if target.exists():  # same bytes already stored
+        Path(tmp_path).unlink(missing_ok=True)
+    else:
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp_path, target)
+    return filename
+
+
+def relocate(image, location_id, upload_dir):
+    """Copy an image's original and renditions into a location's directory
+    and point its rows at the copies.  Returns the old filenames, for
+    remove_unused() once that's committed.
+    """
+    left = []
+    for row in (image, *image.renditions):
+        filename = location_dir(location_id) + LOCATION_PATH.sub('', row.filename)
+        if filename == row.filename:
+            continue
+        target = Path(upload_dir) / filename
+        if not target.exists():
+            target.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(Path(upload_dir) / row.filename, target)
+        left.append(row.filename)
+        row.filename = filename
+    image.location_id = location_id
+    return left
+
+
+def remove_unused(filenames, upload_dir):
+    """Delete those of these files no Image or rendition uses any more.
+    Returns how many went."""
+    filenames = set(filenames)
+    if not filenames:
+        return 0
+    used = set(db.session.scalars(
+        db.select(Image.filename).where(Image.filename.in_(filenames))
+        .union(db.select(ImageRendition.filename)
+               .where(ImageRendition.filename.in_(filenames)))))
+    for filename in filenames - used:
+        (Path(upload_dir) / filename).unlink(missing_ok=True)
+    return len(filenames - used)
+
+
+def find_duplicate(digest):
+    """The oldest Image with these exact bytes, if any"""
+    return Image.query.filter_by(content_hash=digest).order_by(Image.id).first()
+
+
+def find_duplicates(digests, location_id=None):
+    """find_duplicate() for a batch of hashes, in one query, among the
+    images kept at one location (whose files are in its directory).
+    Returns {digest: oldest Image}, renditions loaded for clone_image().
+    """
+    found = {}
+    digests = set(digests)
+    if digests:
+        for image in Image.query.options(db.selectinload(Image.renditions)) \
+                                .filter(Image.content_hash.in_(digests),
+                                        Image.location_id.is_not_distinct_from(
+                                            location_id)) \
+                                .order_by(Image.id):
+            found.setdefault(image.content_hash, image)
+    return found
+
+
+def clone_image(original):
+    """New Image row sharing an existing image's file and renditions
+    (none, if the original hasn't been processed yet)"""
+    image = Image(
+        filename=original.filename,
+        content_hash=original.content_hash,
+        width=original.width,
+        height=original.height,
+        file_size=original.file_size,
+        taken_at=original.taken_at,
+        phash=original.phash,  # so the copy turns up in /similar too
+        location_id=original.location_id
+    )
+    for r in original.renditions:
+        image.renditions.append(ImageRendition(
+            kind=r.kind, format=r.format, filename=r.filename,
+            width=r.width, height=r.height, size=r.size))
+    return image
+
+
+def is_shared(image):
+    """Whether another Image row points at the same file"""
+    return db.session.query(
+        Image.query.filter(Image.filename == image.filename,
+                           Image.id != image.id).exists()
+    ).scalar()
+
+
+def immutable_headers(response):
+    """Content-addressed files never change, so let browsers keep them"""
+    if request.endpoint == 'static' and response.status_code == 200:
+        upload_url = Path(current_app.config['UPLOAD_FOLDER']).name
+        filename = (request.view_args or {}).get('filename', '')
+        if filename.startswith(f"{upload_url}/") and \
+                CAS_PATH.match(filename[len(upload_url) + 1:]):
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = IMMUTABLE_MAX_AGE
+            response.cache_control.immutable = True
+    return response
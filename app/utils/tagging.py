@@ -0,0 +1,89 @@
+from sqlalchemy import insert, or_
+from ..models import db, Image, Tag
+from . import changelog
+from .helpers import slugify
+
+
+#
+# Resolving submitted tag names and image ids for a part save.
+#
+# Everything is fetched with one IN query per kind, missing tags are
+# created with a single multi-row INSERT, and collections are updated by
+# difference, so the UPDATE/INSERT/DELETE work the flush does is limited
+# to rows that actually changed and a save costs the same number of
+# statements however many tags or images are involved.
+#
+
+def resolve_tags(names, created=None):
+    """Tag objects for `names`, in order, creating any that don't exist
+    (and appending those to the list `created`, if given).  Names are
+    matched on their slug, so "Octal" and "octal" are one tag (or on the
+    exact name, for tags renamed since their slug was made).
+    """
+    wanted = {}
+    for name in names:
+        slug = slugify(name)
+        if slug:
+            wanted.setdefault(slug, name)
+    if not wanted:
+        return []
+
+    # by name too: a renamed tag keeps its old slug
+    found = {}
+    for tag in Tag.query.filter(or_(Tag.slug.in_(list(wanted)),
+                                    Tag.name.in_(list(wanted.values())))):
+        found.setdefault(tag.slug, tag)
+        found.setdefault(slugify(tag.name), tag)
+    missing = [{'name': name, 'slug': slug}
+               for slug, name in wanted.items() if slug not in found]
+    if missing:
+        new_tags = db.session.scalars(insert(Tag).returning(Tag), missing).all()
+        changelog.record('tags', [tag.id for tag in new_tags])
+        found.update((tag.slug, tag) for tag in new_tags)
+        if created is not None:
+            created.extend(new_tags)
+    return [found[slug] for slug in wanted]
+
+
+def resolve_images(ids, *options):
+    """Images for a list of (possibly blank / string) ids, in one query"""
+    ids = {int(i) for i in ids if str(i).strip()}
+    if not ids:
+        return []
+    return Image.query.options(*options).filter(Image.id.in_(ids)) \
+                      .order_by(Image.id).all()
+
+
+def set_tags(part, tags):
+    """Make part.tags exactly `tags`, touching only the differences"""
+    wanted = set(tags)
+    current = set(part.tags)
+    for tag in current - wanted:
+        part.tags.remove(tag)
+    for tag in tags:
+        if tag not in current:
+            part.tags.append(tag)
+            current.add(tag)
+
+
+def attach_images(part, images):
+    """Add unassigned `images` to part.  Returns the ones attached."""
+    attached = [image for image in images
+                if image.part_id in (None, part.id) and image not in part.images]
+    part.images.extend(attached)
+    return attached
+
+
+def detach_images(part, image_ids):
+    """Delete part's images whose ids are listed, with their renditions,
+    jobs and tag links preloaded so the cascade is a few batched
+    statements rather than a few per image.
+    """
+    images = resolve_images(image_ids,
+                            db.selectinload(Image.renditions),
+                            db.selectinload(Image.jobs),
+                            db.selectinload(Image.tags))
+    removed = [image for image in images if image.part_id == part.id]
+    for image in removed:
+        db.session.delete(image)
+    return removed
@@ -0,0 +1,126 @@
+from bisect import bisect_left
+from collections import namedtuple
+from flask import current_app
+from heapq import nsmallest
+from itertools import islice
+from sqlalchemy import func
+from threading import Lock
+import re
+import time
+from ..models import db, Tag, part_tags
+from . import events
+
+
+#
+# In-memory prefix index over tag names, for type-ahead.
+#
+# Every word of every tag name starts a search key ("coils, oscillator"
+# gives "coils oscillator" and "oscillator"), and the keys are kept in
+# one sorted list, so finding the tags matching what has been typed so
+# far is a binary search plus a walk over just the matches - no database
+# round trip per keystroke.  Matches are ranked by how many parts use
+# the tag.  The index is rebuilt (two queries) on first use after a
+# commit touching tags, or after TAG_INDEX_TTL for other processes'
+# writes.
+#
+
+_WORD = re.compile(r'\w+')
+
+_Snapshot = namedtuple('_Snapshot', [
+    'keys',       # sorted search keys
+    'owners',     # position (in tags) of the tag each key comes from
+    'tags',       # tag dicts, by name
+    'positions',  # tag id -> position
+    'popular',    # positions, most used first
+    'rank',       # position -> place in popular
+    'built_at',
+])
+
+
+def normalize(text):
+    """Lower-cased words separated by single spaces"""
+    return ' '.join(_WORD.findall(text.casefold()))
+
+
+class TagIndex:
+    def __init__(self, app=None):
+        self._lock = Lock()
+        self._snapshot = None   # see _build()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('TAG_INDEX_TTL', 60)
+        app.extensions['tag_index'] = self
+
+    def invalidate(self):
+        self._snapshot = None
+
+    def suggest(self, prefix, limit=10, exclude=()):
+        """Up to `limit` tags with a word starting with `prefix`, most used
+        first.  Tags are dicts of id, name, slug and count (parts using it).
+        """
+        index = self._current()
+        skip = {index.positions[tag_id] for tag_id in exclude
+                if tag_id in index.positions}
+        query = normalize(prefix)
+        if not query:
+            found = islice((i for i in index.popular if i not in skip), limit)
+        else:
+            start = bisect_left(index.keys, query)
+            end = bisect_left(index.keys, query + '\uffff', start)
+            candidates = {index.owners[i] for i in range(start, end)} - skip
+            found = nsmallest(limit, candidates, key=index.rank.__getitem__)
+        return [index.tags[i] for i in found]
+
+    def all(self, exclude=()):
+        """Every tag, by name, less the ids in `exclude`"""
+        tags = self._current().tags
+        exclude = set(exclude)
+        return [tag for tag in tags if tag['id'] not in exclude]
+
+    def _current(self):
+        snapshot = self._snapshot
+        ttl = current_app.config.get('TAG_INDEX_TTL', 60)
+        if snapshot is None or time.monotonic() - snapshot.built_at > ttl:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is None or time.monotonic() - snapshot.built_at > ttl:
+                    snapshot = self._snapshot = _build()
+        return snapshot
+
+
+def _build():
+    counts = dict(db.session.execute(
+        db.select(part_tags.c.tag_id, func.count()).group_by(part_tags.c.tag_id)).all())
+    tags = [{'id': id_, 'name': name, 'slug': slug, 'count': counts.get(id_, 0)}
+            for id_, name, slug in db.session.execute(
+                db.select(Tag.id, Tag.name, Tag.slug).order_by(Tag.name))]
+
+    entries = []
+    for position, tag in enumerate(tags):
+        words = normalize(tag['name']).split(' ')
+        entries.extend((' '.join(words[i:]), position)
+                       for i in range(len(words)) if words[i])
+    entries.sort()
+    popular = sorted(range(len(tags)),
+                     key=lambda i: (-tags[i]['count'], tags[i]['name'].casefold()))
+    rank = [0] * len(tags)
+    for order, position in enumerate(popular):
+        rank[position] = order
+    return _Snapshot(
+        keys=[key for key, _ in entries],
+        owners=[position for _, position in entries],
+        tags=tags,
+        positions={tag['id']: position for position, tag in enumerate(tags)},
+        popular=popular,
+        rank=rank,
+        built_at=time.monotonic())
+
+
+tag_index = TagIndex()
+
+
+@events.on_commit('Tag', 'part_tags')
+def invalidate(changed_tables=None):
+    tag_index.invalidate()
@@ -1,6 +1,15 @@
-from app import create_app
+from app import create_app, create_cli_app
+
+
+def __getattr__(name):
+    # `app` is built on first access rather than at import, so
+    # `flask --app radioparts:create_cli_app ...` never builds the web app
+    if name == 'app':
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-app = create_app()
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    create_app().run(debug=True)
@@ -0,0 +1,28 @@
+import pytest
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    """The web app on a scratch SQLite database, seeded with a small
+    synthetic catalogue (utils/benchmark.py) before any test adds rows"""
+    import os
+    db_path = tmp_path_factory.mktemp('db') / 'test.db'
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    from app import create_app
+    from app.utils import benchmark, listing
+    app = create_app()
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    with app.app_context():
+        benchmark.seed(parts=2000, brands=50, tags=200, images=3000)
+        listing.rebuild()
+    yield app
+    os.environ.pop('DATABASE_URL', None)
+
+
+@pytest.fixture(scope='session')
+def catalogue(app):
+    """The newest part of the seeded catalogue (detached, so no app
+    context is left pushed for requests to share)"""
+    from app.models import Part
+    with app.app_context():
+        return Part.query.order_by(Part.id.desc()).first()
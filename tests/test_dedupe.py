@@ -0,0 +1,48 @@
+import hashlib
+from app.models import db, Image, Location
+from app.utils import storage
+
+
+#
+# `flask images dedupe`: legacy uploads move into content-addressed
+# storage, identical ones share a file, and files already stored by
+# content - under a location too - are left alone.
+#
+
+def add_image(filename, location_id=None):
+    image = Image(filename=filename, location_id=location_id)
+    db.session.add(image)
+    db.session.commit()
+    return image.id
+
+
+def test_dedupe(app, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    data = b'a scan of a dial glass'
+    digest = hashlib.sha256(data).hexdigest()
+    with app.app_context():
+        location = Location(name='Dedupe test')
+        db.session.add(location)
+        db.session.commit()
+        located = storage.cas_filename(digest, '.jpg', location.id)
+        (tmp_path / located).parent.mkdir(parents=True)
+        (tmp_path / located).write_bytes(data)
+        (tmp_path / 'dial.jpg').write_bytes(data)
+        (tmp_path / 'dial copy.jpg').write_bytes(data)
+        located_id = add_image(located, location.id)
+        legacy_ids = [add_image('dial.jpg'), add_image('dial copy.jpg')]
+
+        result = app.test_cli_runner().invoke(args=['images', 'dedupe'])
+        assert result.exit_code == 0, result.output
+        assert 'Moved 1 files, merged 1 duplicates' in result.output
+
+        db.session.expire_all()
+        # the located image's file is its only copy, and stays put
+        assert db.session.get(Image, located_id).filename == located
+        assert (tmp_path / located).read_bytes() == data
+        shared = storage.cas_filename(digest, '.jpg')
+        for image_id in legacy_ids:
+            assert db.session.get(Image, image_id).filename == shared
+        assert (tmp_path / shared).read_bytes() == data
+        assert not (tmp_path / 'dial.jpg').exists()
+        assert not (tmp_path / 'dial copy.jpg').exists()
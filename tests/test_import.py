@@ -0,0 +1,76 @@
+import io
+import json
+import pytest
+from sqlalchemy.exc import IntegrityError
+from app.models import Part
+from app.utils import importer
+
+
+#
+# POST /import_parts: token auth, and what a client is told when an
+# import stops part way (blueprints/parts.py, utils/importer.py).
+#
+
+TOKEN = 'test-import-token'
+
+
+@pytest.fixture
+def post(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'IMPORT_TOKEN', TOKEN)
+    client = app.test_client()
+
+    def post(lines, token=TOKEN):
+        body = ''.join(f"{line}\n" for line in lines).encode()
+        return client.post('/import_parts',
+                           data={'file': (io.BytesIO(body), 'parts.ndjson')},
+                           headers={'Authorization': f'Bearer {token}'})
+    return post
+
+
+def rows(count, prefix):
+    return [json.dumps({'name': f"{prefix} {n}", 'brand': 'Import Test Co',
+                        'part_type': 'Valve'}) for n in range(count)]
+
+
+def imported(app, prefix):
+    with app.app_context():
+        return Part.query.filter(Part.name.startswith(prefix)).count()
+
+
+def test_needs_the_token(app, post, monkeypatch):
+    assert post(rows(1, 'Token'), token='wrong').status_code == 401
+    monkeypatch.setitem(app.config, 'IMPORT_TOKEN', None)
+    assert post(rows(1, 'Token')).status_code == 403
+    assert imported(app, 'Token') == 0
+
+
+def test_imports(app, post):
+    response = post(rows(3, 'Plain'))
+    assert response.status_code == 200
+    assert response.get_json()['parts'] == 3 == imported(app, 'Plain')
+
+
+def test_unreadable_line_after_a_committed_batch(app, post):
+    lines = rows(importer.BATCH_SIZE + 10, 'Partial')
+    lines.insert(importer.BATCH_SIZE + 5, '{"name": ')
+    response = post(lines)
+    assert response.status_code == 207
+    result = response.get_json()
+    assert result['rows'] == [importer.BATCH_SIZE + 1, None]
+    assert result['report']['parts'] == importer.BATCH_SIZE == imported(app, 'Partial')
+
+
+def test_unreadable_from_the_start(app, post):
+    response = post(['not json'] + rows(2, 'Garbled'))
+    assert response.status_code == 400
+    assert response.get_json()['report']['parts'] == 0
+
+
+def test_rejected_batch(app, post, monkeypatch):
+    def rejected(model, values):
+        raise IntegrityError('INSERT', {}, Exception('UNIQUE constraint failed'))
+    monkeypatch.setattr(importer, '_insert_returning_ids', rejected)
+    response = post(rows(2, 'Rejected'))
+    assert response.status_code == 409
+    assert response.get_json()['rows'] == [1, 2]
+    assert imported(app, 'Rejected') == 0
@@ -0,0 +1,27 @@
+from datetime import datetime, timedelta, timezone
+from app.models import db, Image, ImageJob
+from app.utils.jobs import image_jobs
+
+
+#
+# The image job queue's periodic sweep (utils/jobs.py): jobs a dead
+# worker left 'running' go back in the queue; live ones are left alone.
+#
+
+def test_requeue_stale_resubmits_only_stuck_jobs(app, monkeypatch):
+    submitted = []
+    monkeypatch.setattr(image_jobs, 'submit', submitted.append)
+    timeout = timedelta(seconds=app.config['IMAGE_JOB_TIMEOUT'])
+    now = datetime.now(timezone.utc)
+    with app.app_context():
+        stuck, busy = (ImageJob(image=Image(filename=f'job-{n}.jpg'), status='running',
+                                started_at=started)
+                       for n, started in enumerate([now - 2 * timeout, now]))
+        db.session.add_all([stuck, busy])
+        db.session.commit()
+
+        assert image_jobs.requeue_stale() == 1
+        assert submitted == [stuck.id]
+        db.session.expire_all()
+        assert (stuck.status, busy.status) == ('queued', 'running')
+        assert image_jobs.requeue_stale() == 0
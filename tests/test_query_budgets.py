@@ -0,0 +1,47 @@
+import pytest
+from app.commands import QUERY_BUDGETS, EXPLAIN_ROUTES
+from app.models import db, Tag, part_tags
+from app.utils import facets, pagination, queryplan
+from app.utils.httpcache import response_cache
+from app.utils.querycount import QueryCounter
+
+
+#
+# The listing pages' SQL budgets and index use, as `flask perf queries`
+# and `flask perf explain` check them, so a regression fails the suite.
+#
+
+def cold_get(app, url):
+    """GET url with every cache emptied; returns (response, QueryCounter)"""
+    with app.app_context():
+        facets.invalidate()
+        pagination.invalidate()
+        response_cache.clear()
+        engine = db.engine
+    with QueryCounter(engine) as counter:
+        response = app.test_client().get(url)
+    return response, counter
+
+
+def url_for_route(app, route, part):
+    with app.app_context():
+        tag = Tag.query.join(part_tags).first()
+        return route.format(part_id=part.id, brand_id=part.brand_id,
+                            type_id=part.part_type_id, location_id=part.location_id,
+                            tag_name=tag.name,
+                            cursor=pagination.encode_cursor([part.created_at, part.id]))
+
+
+@pytest.mark.parametrize('route, budget', QUERY_BUDGETS.items())
+def test_query_budget(app, catalogue, route, budget):
+    response, counter = cold_get(app, url_for_route(app, route, catalogue))
+    assert response.status_code == 200
+    assert counter.count <= budget, '\n'.join(counter.statements)
+
+
+@pytest.mark.parametrize('route', EXPLAIN_ROUTES)
+def test_queries_use_indexes(app, catalogue, route):
+    response, counter = cold_get(app, url_for_route(app, route, catalogue))
+    assert response.status_code == 200
+    with app.app_context():
+        assert queryplan.check_statements(counter.statements, counter.parameters) == []
@@ -0,0 +1,120 @@
+import smtplib
+import pytest
+from app.models import db, OutboxMessage, Part
+from app.utils.outbox import outbox
+
+
+#
+# Part requests (blueprints/requests.py) and the digest outbox
+# (utils/outbox.py), sent to an SMTP stand-in.
+#
+
+class FakeSMTP:
+    """Takes the place of smtplib.SMTP; records what is sent, or fails
+    with `FakeSMTP.error` if set"""
+    sent = []
+    error = None
+
+    def __init__(self, host, port, timeout=None):
+        pass
+
+    def send_message(self, message):
+        if FakeSMTP.error:
+            raise FakeSMTP.error
+        FakeSMTP.sent.append(message)
+
+    def quit(self):
+        pass
+
+    close = quit
+
+
+@pytest.fixture
+def smtp(app, monkeypatch):
+    monkeypatch.setattr(smtplib, 'SMTP', FakeSMTP)
+    monkeypatch.setitem(app.config, 'LIBRARIAN_EMAIL', 'librarian@example.com')
+    monkeypatch.setattr(FakeSMTP, 'sent', [])
+    monkeypatch.setattr(FakeSMTP, 'error', None)
+    with app.app_context():
+        db.session.execute(db.delete(OutboxMessage))
+        db.session.commit()
+        yield FakeSMTP
+        db.session.rollback()
+
+
+def request_parts(app, count):
+    """Request `count` parts kept at one location; returns (client,
+    parts, the librarian they go to)"""
+    client = app.test_client()
+    location_id = Part.query.first().location_id
+    parts = Part.query.filter_by(location_id=location_id).limit(count).all()
+    for part in parts:
+        response = client.post('/request-part', data={
+            'part_id': part.id, 'email': 'restorer@example.com', 'notes': 'For a 1947 Philips'})
+        assert response.status_code == 302
+    part = parts[0]
+    recipient = (part.location and part.location.librarian_email) or \
+        app.config['LIBRARIAN_EMAIL']
+    return client, parts, recipient
+
+
+def test_requests_are_queued_not_sent(app, smtp):
+    client, parts, _ = request_parts(app, 2)
+    assert smtp.sent == []
+    queued = OutboxMessage.query.filter_by(status='queued').all()
+    assert len(queued) == 2
+    # the confirmation reaches the visitor through the uncached state endpoint
+    state = client.get('/request-part/state').get_json()
+    assert any('Request sent' in m for m in state['messages'])
+    assert state['csrf_token']
+
+
+def test_dispatch_sends_one_digest_per_recipient(app, smtp):
+    _, parts, recipient = request_parts(app, 3)
+    counts = outbox.dispatch()
+    assert (counts['sent'], counts['digests']) == (3, 1)
+    [message] = smtp.sent
+    assert message['To'] == recipient
+    assert message['Subject'] == '3 new part requests'
+    for part in parts:
+        assert part.name in message.get_content()
+    assert OutboxMessage.query.filter_by(status='sent').count() == 3
+    assert outbox.dispatch() == {}  # nothing left to send
+
+
+def test_failed_send_is_retried_then_given_up(app, smtp, monkeypatch):
+    monkeypatch.setitem(app.config, 'NOTIFY_MAX_ATTEMPTS', 2)
+    request_parts(app, 1)
+    smtp.error = smtplib.SMTPServerDisconnected('connection dropped')
+
+    assert outbox.dispatch()['retrying'] == 1
+    message = OutboxMessage.query.one()
+    assert (message.status, message.attempts) == ('queued', 1)
+    assert 'connection dropped' in message.error
+    assert outbox.dispatch() == {}  # backing off: not due yet
+
+    message.next_attempt_at = message.created_at
+    db.session.commit()
+    assert outbox.dispatch()['failed'] == 1
+    assert OutboxMessage.query.one().status == 'failed'
+    assert smtp.sent == []
+
+
+def test_reservation_api_needs_csrf_token(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'WTF_CSRF_ENABLED', True)
+    client = app.test_client()
+    with app.app_context():
+        part_id = Part.query.first().id
+    assert client.post(f'/part/{part_id}/reserve', json={'quantity': 1}).status_code == 400
+    token = client.get('/request-part/state').get_json()['csrf_token']
+    response = client.post(f'/part/{part_id}/reserve', json={'quantity': 1},
+                           headers={'X-CSRFToken': token})
+    assert response.status_code in (201, 409), response.get_json()
+
+
+@pytest.mark.parametrize('quantity', [None, [1], 'two'])
+def test_reserve_rejects_bad_quantity(app, quantity):
+    with app.app_context():
+        part_id = Part.query.first().id
+    response = app.test_client().post(f'/part/{part_id}/reserve', json={'quantity': quantity})
+    assert response.status_code == 400
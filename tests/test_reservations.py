@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta, timezone
+from threading import Barrier, Thread
+import pytest
+from app.models import db, Part, Reservation
+from app.utils import reservations
+
+
+#
+# Holds on stock (utils/reservations.py): the conditional UPDATEs that
+# take and return units, and the sweeper that expires stale holds.
+#
+
+@pytest.fixture
+def stocked(app):
+    """A fresh part with some units free; yields (part id, set quantity)"""
+    def stock(quantity):
+        part = Part.query.filter(~Part.id.in_(db.select(Reservation.part_id))).first()
+        part.quantity = quantity
+        db.session.commit()
+        return part.id
+
+    with app.app_context():
+        yield stock
+        db.session.rollback()
+
+
+def free(part_id):
+    db.session.expire_all()
+    return db.session.get(Part, part_id).quantity
+
+
+def test_last_unit_goes_to_exactly_one_of_two_racing_requests(app, stocked):
+    part_id = stocked(1)
+    start = Barrier(2)
+    results = []
+
+    def request_it(email):
+        with app.app_context():
+            start.wait()
+            reservation = reservations.reserve(part_id, requester_email=email)
+            db.session.commit()
+            results.append(reservation is not None)
+
+    threads = [Thread(target=request_it, args=(f"{n}@example.com",)) for n in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(results) == [False, True]
+    assert free(part_id) == 0
+    assert Reservation.query.filter_by(part_id=part_id, status='held').count() == 1
+
+
+def test_release_puts_the_units_back_once(app, stocked):
+    part_id = stocked(3)
+    reservation = reservations.reserve(part_id, 2)
+    db.session.commit()
+    assert free(part_id) == 1
+    assert reservations.reserve(part_id, 2) is None  # only one left
+
+    assert reservations.release(reservation)
+    db.session.commit()
+    assert free(part_id) == 3
+    assert not reservations.release(reservation)  # already released
+    db.session.commit()
+    assert free(part_id) == 3
+
+
+def test_sweeper_expires_only_stale_holds(app, stocked):
+    part_id = stocked(2)
+    stale = reservations.reserve(part_id)
+    fresh = reservations.reserve(part_id)
+    db.session.flush()
+    stale.expires_at = datetime.now(timezone.utc) - timedelta(minutes=1)
+    db.session.commit()
+    assert free(part_id) == 0
+
+    assert reservations.sweep() == 1
+    db.session.expire_all()
+    assert db.session.get(Reservation, stale.id).status == 'expired'
+    assert db.session.get(Reservation, fresh.id).status == 'held'
+    assert free(part_id) == 1
+    assert reservations.sweep() == 0
@@ -0,0 +1,18 @@
+import pytest
+from app.commands import STARTUP_BUDGETS
+from app.utils import startup
+
+
+#
+# `flask perf startup` as a test: each app factory, in a fresh
+# interpreter under `python -X importtime`, must stay within its budget,
+# and the CLI app must not load the deferred heavy modules.
+#
+
+@pytest.mark.parametrize('factory, budget', STARTUP_BUDGETS.items())
+def test_startup_budget(app, factory, budget):
+    # `app` points DATABASE_URL at the (already migrated) scratch database
+    r = startup.measure(factory, repeat=3)
+    assert r['overhead_ms'] <= budget, r['slowest']
+    if factory == 'create_cli_app':
+        assert r['deferred'] == []
@@ -0,0 +1,68 @@
+import io
+import pytest
+from PIL import Image as PILImage
+from app.models import db, Image, Part
+
+
+#
+# Uploads of a photo already in the store share its file (utils/storage.py).
+#
+
+def photo(colour):
+    data = io.BytesIO()
+    PILImage.new('RGB', (300, 200), colour).save(data, 'JPEG')
+    return data.getvalue()
+
+
+def upload(client, data):
+    response = client.post('/upload_images',
+                           data={'files': (io.BytesIO(data), 'dial.jpg')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()
+
+
+def assign(app, image_id):
+    with app.app_context():
+        db.session.get(Image, image_id).part_id = Part.query.first().id
+        db.session.commit()
+
+
+@pytest.fixture
+def uploads(app, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    monkeypatch.setitem(app.config, 'IMAGE_JOB_WORKERS', 0)  # process inline
+    return app.test_client()
+
+
+def test_copy_of_processed_photo_shares_renditions_and_phash(app, uploads):
+    data = photo('navy')
+    original = upload(uploads, data)
+    assign(app, original['id'])
+
+    copy = upload(uploads, data)
+    assert copy['id'] != original['id'] and 'job_id' not in copy
+    with app.app_context():
+        first, second = db.session.get(Image, original['id']), db.session.get(Image, copy['id'])
+        assert second.filename == first.filename
+        assert second.phash and second.phash == first.phash
+        assert sorted(r.filename for r in second.renditions) == \
+            sorted(r.filename for r in first.renditions)
+
+
+def test_copy_of_unprocessed_photo_gets_its_own_job(app, uploads, monkeypatch):
+    from app.utils.jobs import image_jobs
+    monkeypatch.setattr(image_jobs, 'submit', lambda job_id: None)  # held up
+    data = photo('maroon')
+    original = upload(uploads, data)
+    assign(app, original['id'])
+
+    copy = upload(uploads, data)
+    assert 'job_id' in copy
+    with app.app_context():
+        assert not db.session.get(Image, copy['id']).renditions
+        image_jobs.run(copy['job_id'])
+        db.session.expire_all()
+        second = db.session.get(Image, copy['id'])
+        assert second.renditions and second.phash
+        assert second.filename == db.session.get(Image, original['id']).filename